@@ -0,0 +1,81 @@
+"""Micro-benchmark of registry operations with many known nodes.
+
+Compares the registry with the original set based implementation, which
+scanned the set to delete a node and serialized the whole registry on every
+read.  Run from the repository root:
+
+    PYTHONPATH=. python benchmarks/registry.py [<number of nodes>]
+
+"""
+
+from collections import namedtuple
+import json
+import sys
+import timeit
+
+from seventweets.registry import Registry
+
+
+_Node = namedtuple('_Node', 'name, address')
+
+
+class SetRegistry:
+    # The original implementation, for comparison.
+
+    _known_nodes = set()
+    _self_node = {'name': None, 'address': None}
+
+    @classmethod
+    def register(cls, node):
+        if node != cls._self_node:
+            cls._known_nodes.add(_Node(**node))
+
+    @classmethod
+    def known_nodes(cls):
+        node_list = [n._asdict() for n in cls._known_nodes]
+        node_list.append(cls._self_node)
+        return json.dumps(node_list)
+
+    @classmethod
+    def delete_node(cls, node):
+        for n in cls._known_nodes:
+            if n.name == node:
+                cls._known_nodes.remove(n)
+                break
+
+
+def node(i):
+    return {'name': 'node{}'.format(i),
+            'address': 'node{}.example.com:8000'.format(i)}
+
+
+def bench(label, stmt, number):
+    seconds = min(timeit.repeat(stmt, number=number, repeat=3)) / number
+    print('{:<40} {:>12.2f} us'.format(label, seconds * 1e6))
+
+
+def main(n):
+    nodes = [node(i) for i in range(n)]
+    # Somewhere in the middle, so a scan has work to do.
+    middle = nodes[n // 2]
+
+    print('{} known nodes'.format(n))
+
+    for name, registry, known_nodes in [
+            ('set', SetRegistry, SetRegistry.known_nodes),
+            ('dict', Registry, lambda: Registry.known_nodes)]:
+        for each in nodes:
+            registry.register(each)
+
+        bench(name + ': register known node',
+              lambda: registry.register(middle), 1000)
+        bench(name + ': known_nodes (POST /registry)', known_nodes, 10)
+
+        def delete_and_register():
+            registry.delete_node(middle['name'])
+            registry.register(middle)
+        bench(name + ': delete_node + register', delete_and_register, 100)
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10000)
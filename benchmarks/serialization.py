@@ -0,0 +1,67 @@
+"""Benchmark of serializing tweet rows to JSON.
+
+Compares the cost per row of the original serialization (a ``Tweet`` object
+per row, its ``__dict__`` serialized by the standard library's json) with
+the row based serialization of seventweets.serialization, with both JSON
+backends.  Run from the repository root:
+
+    PYTHONPATH=. python benchmarks/serialization.py [<number of rows>]
+
+"""
+
+import json
+import sys
+import timeit
+
+from seventweets import serialization
+from seventweets.storage import Tweet
+
+
+class DictTweet:
+    # The original Tweet, for comparison.
+
+    def __init__(self, tweet):
+        self.id = tweet[0]
+        self.name = tweet[1]
+        self.tweet = tweet[2]
+
+
+def rows(n):
+    return [[i, 'node', 'This is tweet number {} of the benchmark'.format(i)]
+            for i in range(1, n + 1)]
+
+
+stdlib_dumps = json.JSONEncoder(separators=(',', ':'),
+                                ensure_ascii=False).encode
+
+
+def bench(label, func, n, number=5):
+    seconds = min(timeit.repeat(func, number=number, repeat=3)) / number
+    print('{:<44} {:>10.3f} us/row'.format(label, seconds / n * 1e6))
+
+
+def main(n):
+    data = rows(n)
+    print('{} rows, orjson {}'.format(
+        n, 'installed' if serialization.orjson else 'not installed'))
+
+    bench('before: DictTweet.__dict__ + json.dumps',
+          lambda: json.dumps([DictTweet(r).__dict__ for r in data]), n)
+    bench('slots Tweet.as_dict() + json.dumps',
+          lambda: json.dumps([Tweet(r).as_dict() for r in data]), n)
+    bench('rows + json (dumps_tweets without orjson)',
+          lambda: stdlib_dumps([serialization.tweet_dict(r) for r in data]),
+          n)
+    if serialization.orjson:
+        bench('rows + orjson (dumps_tweets)',
+              lambda: serialization.dumps_tweets(data), n)
+
+    print()
+    bench('before: one row, DictTweet + json.dumps',
+          lambda: [json.dumps(DictTweet(r).__dict__) for r in data], n)
+    bench('one row, dumps_tweet ({})'.format(serialization.BACKEND),
+          lambda: [serialization.dumps_tweet(r) for r in data], n)
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
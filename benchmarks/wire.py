@@ -0,0 +1,72 @@
+"""Benchmark of the encodings of tweets sent between nodes.
+
+Compares size, encoding and decoding time of a list of tweets in JSON and in
+the columnar encoding of seventweets.wire, each plain and compressed with
+gzip.  Tweets are those of one node (a page of ``GET /tweets``), or of many
+(results of a global search).  Run from the repository root:
+
+    PYTHONPATH=. python benchmarks/wire.py [<number of tweets>]
+
+"""
+
+import gzip
+import json
+import random
+import sys
+import time
+
+from seventweets import wire
+
+
+WORDS = ('hello world tweet node network search timeline python flask '
+         'postgres gossip retweet cache merge cursor batch').split()
+
+
+def tweets(n, nodes):
+    rng = random.Random(0)
+    return [{'id': i,
+             'name': 'node{}'.format(rng.randrange(nodes)),
+             'tweet': ' '.join(rng.choice(WORDS)
+                               for _ in range(rng.randint(3, 20)))}
+            for i in range(1, n + 1)]
+
+
+def timed(func, *args):
+    # Best of three runs, in milliseconds.
+    best = float('inf')
+    for _ in range(3):
+        start = time.perf_counter()
+        result = func(*args)
+        best = min(best, time.perf_counter() - start)
+    return result, best * 1000
+
+
+def bench(label, objects, dumps, loads, level):
+    body, encode = timed(lambda: dumps(objects).encode())
+    decoded, decode = timed(loads, body)
+    assert decoded == objects
+
+    compressed, compress = timed(gzip.compress, body, level)
+    _, decompress = timed(gzip.decompress, compressed)
+
+    print('{:<8} {:>12,} B {:>9.1f} ms {:>9.1f} ms {:>12,} B {:>9.1f} ms '
+          '{:>9.1f} ms'.format(label, len(body), encode, decode,
+                               len(compressed), encode + compress,
+                               decode + decompress))
+
+
+def main(n):
+    for nodes in (1, 20):
+        objects = tweets(n, nodes)
+        print('\n{:,} tweets of {} node(s)'.format(n, nodes))
+        print('{:<8} {:>14} {:>12} {:>12} {:>14} {:>12} {:>12}'.format(
+            '', 'size', 'encode', 'decode', 'gzip size', 'encode', 'decode'))
+
+        for level in (1, 6):
+            print('gzip level {}'.format(level))
+            bench('json', objects, json.dumps, json.loads, level)
+            bench('columns', objects, wire.dumps, wire.loads, level)
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
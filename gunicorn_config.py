@@ -1,15 +1,66 @@
+import os
+
+
 bind = "0.0.0.0:8000"
-worker_class = "gthread"
+
+# The synchronous Flask node (default), or the asynchronous one with
+# ST_APP=seventweets.asgi:app and ST_WORKER_CLASS=uvicorn.workers.UvicornWorker.
+wsgi_app = os.environ.get('ST_APP', 'seventweets.node:app')
+worker_class = os.environ.get('ST_WORKER_CLASS', 'gthread')
 threads = 10
 
 
-def on_exit(server):
+def post_worker_init(worker):
+    import json
+    import threading
+
     import requests
 
+    from seventweets import gossip
+    from seventweets import push
+    from seventweets import timeline
+    from seventweets.config import Config
+    from seventweets.peers import get_client
     from seventweets.registry import Registry
+
+    # Every worker answers probes, one of them probes (see gossip.start).
+    if Config.GOSSIP:
+        gossip.start()
+
+    if Config.TIMELINE:
+        timeline.start()
+
+    if Config.PUSH:
+        push.start()
+
+    # A persisted registry survives restarts, but the nodes in it forgot us
+    # when we shut down.  Announce ourselves again, from the first worker
+    # only (later workers replace ones that died, the node didn't restart).
+    if Config.REGISTRY_BACKEND == 'postgres' and worker.age == 1:
+        body = json.dumps({'name': Config.NAME, 'address': Config.ADDRESS})
+
+        def announce():
+            for node in Registry.nodes():
+                try:
+                    get_client().post(node.address, '/registry', data=body)
+                except requests.RequestException:
+                    pass
+
+        threading.Thread(target=announce, daemon=True).start()
+
+
+def on_exit(server):
+    import requests
+
     from seventweets.config import Config
+    from seventweets.peers import get_client
+    from seventweets.registry import Registry
 
-    for node in Registry._known_nodes:
-        endpoint = 'http://{address}/registry/{name}'.format(address=node.address,
-                                                             name=Config.NAME)
-        r = requests.delete(endpoint)
+    for node in Registry.nodes():
+        try:
+            get_client().delete(node.address,
+                                '/registry/{name}'.format(name=Config.NAME))
+        except requests.RequestException:
+            # Others will find out eventually, don't let one unreachable
+            # node prevent telling the rest.
+            pass
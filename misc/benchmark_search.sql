@@ -0,0 +1,36 @@
+-- Compare the old substring search with full text search at 1M tweets.
+--
+-- Run against a scratch database that has misc/schema.sql applied:
+--
+--     psql -f misc/benchmark_search.sql <database>
+--
+-- The table is filled with random tweets of ten words drawn from a 10000 word
+-- vocabulary, so a single word matches roughly one tweet in a thousand.
+
+\timing on
+
+TRUNCATE tweet;
+
+INSERT INTO tweet (node_name, content, pub_datetime)
+SELECT 'bench',
+	(SELECT string_agg('w' || (random() * 10000)::int, ' ')
+	 FROM generate_series(1, 10) WHERE n > 0),
+	now() - n * interval '1 second'
+FROM generate_series(1, 1000000) AS n;
+
+ANALYZE tweet;
+
+-- Old query.
+EXPLAIN ANALYZE
+SELECT id, node_name, content FROM tweet
+WHERE content ILIKE '%w4242%' AND
+(pub_datetime > '-infinity' AND pub_datetime < 'infinity');
+
+-- New query, as issued by Storage.search.
+EXPLAIN ANALYZE
+SELECT id, node_name, content
+FROM tweet, plainto_tsquery('pg_catalog.simple', 'w4242') AS query
+WHERE content_tsv @@ query AND
+pub_datetime > '-infinity' AND pub_datetime < 'infinity'
+ORDER BY ts_rank(content_tsv, query) DESC, id DESC
+LIMIT NULL;
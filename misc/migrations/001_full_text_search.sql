@@ -0,0 +1,19 @@
+-- Add full text search on tweet content to an existing database.
+
+BEGIN;
+
+ALTER TABLE tweet ADD COLUMN IF NOT EXISTS content_tsv TSVECTOR;
+
+UPDATE tweet
+	SET content_tsv = to_tsvector('pg_catalog.simple', coalesce(content, ''));
+
+CREATE INDEX IF NOT EXISTS tweet_content_tsv_idx
+	ON tweet USING GIN (content_tsv);
+
+DROP TRIGGER IF EXISTS tweet_content_tsv_update ON tweet;
+CREATE TRIGGER tweet_content_tsv_update
+	BEFORE INSERT OR UPDATE OF content ON tweet
+	FOR EACH ROW EXECUTE PROCEDURE
+	tsvector_update_trigger(content_tsv, 'pg_catalog.simple', content);
+
+COMMIT;
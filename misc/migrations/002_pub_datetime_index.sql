@@ -0,0 +1,5 @@
+-- Index tweets by publication time for date range searches.  Built
+-- concurrently so that a running node can keep writing tweets.
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS tweet_pub_datetime_id_idx
+	ON tweet (pub_datetime, id);
@@ -0,0 +1,13 @@
+-- Keep the registry of nodes in the database, shared by all worker
+-- processes and kept across restarts (ST_REGISTRY_BACKEND=postgres).
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS node (
+	name VARCHAR(20) PRIMARY KEY,
+	address VARCHAR(255) NOT NULL
+);
+
+CREATE SEQUENCE IF NOT EXISTS node_version_seq;
+
+COMMIT;
@@ -0,0 +1,18 @@
+-- Home timeline (ST_TIMELINE=1), see seventweets.timeline.
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS timeline (
+	seq BIGSERIAL PRIMARY KEY,
+	node_name VARCHAR(20) NOT NULL,
+	tweet_id INTEGER NOT NULL,
+	content VARCHAR(500),
+	UNIQUE (node_name, tweet_id)
+);
+
+CREATE TABLE IF NOT EXISTS timeline_cursor (
+	node_name VARCHAR(20) PRIMARY KEY,
+	after_id INTEGER NOT NULL
+);
+
+COMMIT;
@@ -0,0 +1,18 @@
+-- Push new tweets to subscribed nodes (ST_PUSH=1), see seventweets.push.
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS outbox (
+	tweet_id INTEGER PRIMARY KEY,
+	content VARCHAR(500)
+);
+
+CREATE TABLE IF NOT EXISTS subscription (
+	node_name VARCHAR(20) PRIMARY KEY,
+	address VARCHAR(255) NOT NULL,
+	after_id INTEGER NOT NULL,
+	failures INTEGER NOT NULL DEFAULT 0,
+	retry_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT current_timestamp
+);
+
+COMMIT;
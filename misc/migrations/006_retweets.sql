@@ -0,0 +1,23 @@
+-- Retweets referencing the original tweet, see Storage.save_retweet.
+
+BEGIN;
+
+ALTER TABLE tweet ADD COLUMN IF NOT EXISTS rt_origin_node VARCHAR(20);
+
+CREATE UNIQUE INDEX IF NOT EXISTS tweet_rt_origin_idx
+	ON tweet (rt_origin_node, rt_origin_id) WHERE rt;
+
+CREATE TABLE IF NOT EXISTS origin_tweet (
+	node_name VARCHAR(20) NOT NULL,
+	tweet_id INTEGER NOT NULL,
+	content VARCHAR(500),
+	PRIMARY KEY (node_name, tweet_id)
+);
+
+CREATE OR REPLACE VIEW tweet_view AS
+	SELECT t.id, t.node_name, COALESCE(t.content, o.content) AS content,
+		t.pub_datetime, t.rt, t.rt_origin_node, t.rt_origin_id
+	FROM tweet AS t LEFT JOIN origin_tweet AS o
+		ON o.node_name = t.rt_origin_node AND o.tweet_id = t.rt_origin_id;
+
+COMMIT;
@@ -0,0 +1,44 @@
+-- Feed of changes of tweets (GET /changes), see Storage.get_changes.  Needs
+-- PostgreSQL 10 for transition tables in triggers.  Existing tweets are added
+-- to the feed as one transaction.
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS change (
+	seq BIGSERIAL PRIMARY KEY,
+	xid BIGINT NOT NULL DEFAULT txid_current(),
+	tweet_id INTEGER NOT NULL,
+	deleted BOOLEAN NOT NULL DEFAULT FALSE
+);
+
+CREATE INDEX IF NOT EXISTS change_xid_seq_idx ON change (xid, seq);
+
+CREATE OR REPLACE FUNCTION tweet_change() RETURNS trigger AS $$
+BEGIN
+	IF TG_OP = 'INSERT' THEN
+		INSERT INTO change (tweet_id)
+			SELECT id FROM new_tweets ORDER BY id;
+	ELSE
+		INSERT INTO change (tweet_id, deleted)
+			SELECT id, TRUE FROM old_tweets ORDER BY id;
+	END IF;
+	RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS tweet_change_insert ON tweet;
+CREATE TRIGGER tweet_change_insert
+	AFTER INSERT ON tweet REFERENCING NEW TABLE AS new_tweets
+	FOR EACH STATEMENT EXECUTE PROCEDURE tweet_change();
+
+DROP TRIGGER IF EXISTS tweet_change_delete ON tweet;
+CREATE TRIGGER tweet_change_delete
+	AFTER DELETE ON tweet REFERENCING OLD TABLE AS old_tweets
+	FOR EACH STATEMENT EXECUTE PROCEDURE tweet_change();
+
+INSERT INTO change (tweet_id)
+	SELECT id FROM tweet
+	WHERE NOT EXISTS (SELECT 1 FROM change)
+	ORDER BY id;
+
+COMMIT;
@@ -0,0 +1,15 @@
+-- Pull the home timeline from the change feeds of nodes (GET /changes)
+-- instead of by tweet ID, see seventweets.timeline.  Needs
+-- 007_changes.sql on all nodes.  Nodes are pulled from the start of their
+-- feeds once, tweets already in the timeline are skipped.
+
+BEGIN;
+
+ALTER TABLE timeline_cursor
+	ADD COLUMN IF NOT EXISTS after_xid BIGINT NOT NULL DEFAULT 0,
+	ADD COLUMN IF NOT EXISTS after_seq BIGINT NOT NULL DEFAULT 0,
+	ADD COLUMN IF NOT EXISTS pulled_at TIMESTAMP WITH TIME ZONE NOT NULL
+		DEFAULT current_timestamp,
+	DROP COLUMN IF EXISTS after_id;
+
+COMMIT;
@@ -0,0 +1,20 @@
+-- Push new tweets from the change feed instead of the outbox, see
+-- seventweets.push.  Needs 007_changes.sql.  Existing subscribers continue
+-- from the end of the feed, they catch up on what they missed by pulling.
+
+BEGIN;
+
+ALTER TABLE subscription
+	ADD COLUMN IF NOT EXISTS after_xid BIGINT NOT NULL DEFAULT 0,
+	ADD COLUMN IF NOT EXISTS after_seq BIGINT NOT NULL DEFAULT 0,
+	DROP COLUMN IF EXISTS after_id;
+
+UPDATE subscription SET (after_xid, after_seq) = (
+	SELECT xid, seq FROM change
+	WHERE xid < txid_snapshot_xmin(txid_current_snapshot())
+	ORDER BY xid DESC, seq DESC LIMIT 1)
+WHERE EXISTS (SELECT 1 FROM change);
+
+DROP TABLE IF EXISTS outbox;
+
+COMMIT;
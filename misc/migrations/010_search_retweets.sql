@@ -0,0 +1,28 @@
+-- Full text search on retweets, by the content of their origin, see
+-- Storage.search.  Needs 006_retweets.sql.
+
+BEGIN;
+
+ALTER TABLE origin_tweet ADD COLUMN IF NOT EXISTS content_tsv TSVECTOR;
+
+UPDATE origin_tweet
+	SET content_tsv = to_tsvector('pg_catalog.simple', coalesce(content, ''));
+
+CREATE INDEX IF NOT EXISTS origin_tweet_content_tsv_idx
+	ON origin_tweet USING GIN (content_tsv);
+
+DROP TRIGGER IF EXISTS origin_tweet_content_tsv_update ON origin_tweet;
+CREATE TRIGGER origin_tweet_content_tsv_update
+	BEFORE INSERT OR UPDATE OF content ON origin_tweet
+	FOR EACH ROW EXECUTE PROCEDURE
+	tsvector_update_trigger(content_tsv, 'pg_catalog.simple', content);
+
+CREATE OR REPLACE VIEW tweet_view AS
+	SELECT t.id, t.node_name, COALESCE(t.content, o.content) AS content,
+		t.pub_datetime, t.rt, t.rt_origin_node, t.rt_origin_id,
+		CASE WHEN t.content IS NULL THEN o.content_tsv
+			ELSE t.content_tsv END AS content_tsv
+	FROM tweet AS t LEFT JOIN origin_tweet AS o
+		ON o.node_name = t.rt_origin_node AND o.tweet_id = t.rt_origin_id;
+
+COMMIT;
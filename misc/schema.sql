@@ -1,4 +1,14 @@
+DROP VIEW IF EXISTS tweet_view;
 DROP TABLE IF EXISTS tweet;
+DROP TABLE IF EXISTS change;
+DROP FUNCTION IF EXISTS tweet_change();
+DROP TABLE IF EXISTS origin_tweet;
+DROP TABLE IF EXISTS node;
+DROP TABLE IF EXISTS timeline;
+DROP TABLE IF EXISTS timeline_cursor;
+DROP TABLE IF EXISTS outbox;
+DROP TABLE IF EXISTS subscription;
+DROP SEQUENCE IF EXISTS node_version_seq;
 
 CREATE TABLE tweet (
 	id SERIAL PRIMARY KEY,
@@ -6,5 +16,125 @@ CREATE TABLE tweet (
 	content VARCHAR(500),
 	pub_datetime TIMESTAMP WITH TIME ZONE DEFAULT current_timestamp,
 	rt BOOLEAN DEFAULT FALSE,
-	rt_origin_id INTEGER
+	rt_origin_id INTEGER,
+	rt_origin_node VARCHAR(20),
+	content_tsv TSVECTOR
+);
+
+-- Time bounded searches and "latest N tweets" become index range scans.
+CREATE INDEX tweet_pub_datetime_id_idx ON tweet (pub_datetime, id);
+
+-- Full text search on content, the search vector is kept up to date by the
+-- trigger.
+CREATE INDEX tweet_content_tsv_idx ON tweet USING GIN (content_tsv);
+
+CREATE TRIGGER tweet_content_tsv_update
+	BEFORE INSERT OR UPDATE OF content ON tweet
+	FOR EACH ROW EXECUTE PROCEDURE
+	tsvector_update_trigger(content_tsv, 'pg_catalog.simple', content);
+
+-- Retweets reference the original tweet (rt_origin_node, rt_origin_id) and
+-- have no content of their own.  A node retweets a tweet only once.
+CREATE UNIQUE INDEX tweet_rt_origin_idx ON tweet (rt_origin_node, rt_origin_id)
+	WHERE rt;
+
+-- Content of retweeted tweets, fetched from their nodes once and shared by
+-- all retweets of them.
+CREATE TABLE origin_tweet (
+	node_name VARCHAR(20) NOT NULL,
+	tweet_id INTEGER NOT NULL,
+	content VARCHAR(500),
+	content_tsv TSVECTOR,
+	PRIMARY KEY (node_name, tweet_id)
+);
+
+-- Retweets are found by full text search on the content of the origin.
+CREATE INDEX origin_tweet_content_tsv_idx ON origin_tweet
+	USING GIN (content_tsv);
+
+CREATE TRIGGER origin_tweet_content_tsv_update
+	BEFORE INSERT OR UPDATE OF content ON origin_tweet
+	FOR EACH ROW EXECUTE PROCEDURE
+	tsvector_update_trigger(content_tsv, 'pg_catalog.simple', content);
+
+-- Tweets as they are read, with the content of retweets filled in.
+CREATE VIEW tweet_view AS
+	SELECT t.id, t.node_name, COALESCE(t.content, o.content) AS content,
+		t.pub_datetime, t.rt, t.rt_origin_node, t.rt_origin_id,
+		CASE WHEN t.content IS NULL THEN o.content_tsv
+			ELSE t.content_tsv END AS content_tsv
+	FROM tweet AS t LEFT JOIN origin_tweet AS o
+		ON o.node_name = t.rt_origin_node AND o.tweet_id = t.rt_origin_id;
+
+-- Feed of changes of tweets, see Storage.get_changes.  Every saved tweet adds
+-- a row, and every deleted one a tombstone row, with the ID of the
+-- transaction that made the change.
+CREATE TABLE change (
+	seq BIGSERIAL PRIMARY KEY,
+	xid BIGINT NOT NULL DEFAULT txid_current(),
+	tweet_id INTEGER NOT NULL,
+	deleted BOOLEAN NOT NULL DEFAULT FALSE
+);
+
+CREATE INDEX change_xid_seq_idx ON change (xid, seq);
+
+-- Statement level, so that a batch of tweets adds its changes with one
+-- insert.
+CREATE FUNCTION tweet_change() RETURNS trigger AS $$
+BEGIN
+	IF TG_OP = 'INSERT' THEN
+		INSERT INTO change (tweet_id)
+			SELECT id FROM new_tweets ORDER BY id;
+	ELSE
+		INSERT INTO change (tweet_id, deleted)
+			SELECT id, TRUE FROM old_tweets ORDER BY id;
+	END IF;
+	RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER tweet_change_insert
+	AFTER INSERT ON tweet REFERENCING NEW TABLE AS new_tweets
+	FOR EACH STATEMENT EXECUTE PROCEDURE tweet_change();
+
+CREATE TRIGGER tweet_change_delete
+	AFTER DELETE ON tweet REFERENCING OLD TABLE AS old_tweets
+	FOR EACH STATEMENT EXECUTE PROCEDURE tweet_change();
+
+-- Registry of known nodes, see seventweets.registry.PostgresStore.  Every
+-- change of the registry draws a new version from the sequence.
+CREATE TABLE node (
+	name VARCHAR(20) PRIMARY KEY,
+	address VARCHAR(255) NOT NULL
+);
+
+CREATE SEQUENCE node_version_seq;
+
+-- Home timeline, tweets of this node and its peers in the order they were
+-- pulled (see seventweets.timeline), and how far each node's change feed was
+-- pulled, and when.
+CREATE TABLE timeline (
+	seq BIGSERIAL PRIMARY KEY,
+	node_name VARCHAR(20) NOT NULL,
+	tweet_id INTEGER NOT NULL,
+	content VARCHAR(500),
+	UNIQUE (node_name, tweet_id)
+);
+
+CREATE TABLE timeline_cursor (
+	node_name VARCHAR(20) PRIMARY KEY,
+	after_xid BIGINT NOT NULL DEFAULT 0,
+	after_seq BIGINT NOT NULL DEFAULT 0,
+	pulled_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT current_timestamp
+);
+
+-- Nodes new tweets are pushed to, and how far in the change feed each
+-- subscriber got (see seventweets.push).
+CREATE TABLE subscription (
+	node_name VARCHAR(20) PRIMARY KEY,
+	address VARCHAR(255) NOT NULL,
+	after_xid BIGINT NOT NULL DEFAULT 0,
+	after_seq BIGINT NOT NULL DEFAULT 0,
+	failures INTEGER NOT NULL DEFAULT 0,
+	retry_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT current_timestamp
 );
@@ -0,0 +1,291 @@
+"""This module implements an asynchronous (ASGI) network node.
+
+It exposes the same API as :mod:`seventweets.node`, but the endpoints that
+call other nodes (``/search`` and ``/join_network``) are implemented with
+asyncio and an asynchronous HTTP client, so that a single process can wait on
+thousands of slow peers without tying up a thread for each.  All other
+endpoints are served by the Flask app of :mod:`seventweets.node`, run in a
+thread pool, so both apps share storage, registry and their behaviour.
+Database access in the asynchronous endpoints also goes through
+:class:`seventweets.storage.Storage` and the connection pool, in the same
+thread pool.
+
+Run with an ASGI server, e.g. via gunicorn with
+``ST_WORKER_CLASS=uvicorn.workers.UvicornWorker`` and
+``ST_APP=seventweets.asgi:app`` (see ``gunicorn_config.py``).
+
+Attributes:
+    app (:class:`starlette.applications.Starlette`): The ASGI application.
+
+Functions:
+    join_network: Initiate network join.
+    search: Search local or all tweets.
+
+"""
+
+import asyncio
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+import json
+import time
+
+import aiohttp
+from asgiref.wsgi import WsgiToAsgi
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.gzip import GZipMiddleware
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import Response
+from starlette.routing import Mount
+from starlette.routing import Route
+
+from seventweets import node as flask_node
+from seventweets import peers
+from seventweets import serialization
+from seventweets import wire
+from seventweets.config import Config
+from seventweets.db import get_db_cursor
+from seventweets.db import InvalidInput
+from seventweets.db import QueryTimeout
+from seventweets.registry import Registry
+from seventweets.search import TopK
+from seventweets.storage import Storage
+
+
+# Client for all requests to other nodes, created on startup.
+_client = None
+
+# Background tasks, referenced until done so that they aren't collected.
+_background = set()
+
+
+def _response(body, status=200):
+    return Response(body, status, headers=flask_node.HEADERS)
+
+
+def _list_response(request, objects):
+    # Same as seventweets.node._list_response.
+    headers = dict(flask_node.HEADERS, Vary='Accept')
+    if wire.accepts(request.headers.get('Accept')):
+        headers['Content-Type'] = wire.COLUMNS
+        return Response(wire.dumps(objects), 200, headers=headers)
+    return Response(serialization.dumps(objects), 200, headers=headers)
+
+
+def _authorized(request):
+    # Same rules as seventweets.node.auth.
+    return request.headers.get('X-Api-Token') == Config.API_TOKEN
+
+
+async def search(request):
+    """Search for, and return tweets satisfying query string parameters.
+
+    Asynchronous version of :func:`seventweets.node.search`, see there for
+    parameters and return values.
+
+    """
+    start = time.monotonic()
+    args = request.query_params
+
+    try:
+        params = flask_node._search_params(args)
+        budget = flask_node._budget(request.headers)
+    except ValueError:
+        return _response('{}', 400)
+
+    if budget is not None and budget <= 0:
+        return _response('{}', 504)
+
+    def local_search():
+        with get_db_cursor(timeout=budget) as cursor:
+            return Storage.search(cursor, **params)
+
+    try:
+        result = await run_in_threadpool(local_search)
+    except QueryTimeout:
+        return _response('{}', 504)
+    except InvalidInput:
+        return _response('{}', 400)
+
+    if args.get('all') in ['1', 'true', 'yes']:
+        top = TopK(params['limit'], params['order'])
+        top.add(result)
+
+        deadline = start + min(Config.SEARCH_DEADLINE,
+                               budget if budget is not None else float('inf'))
+        known = await run_in_threadpool(Registry.nodes)
+        nodes = await _search_peers(known, flask_node._peer_params(params),
+                                    top, deadline)
+        result = top.result()
+
+        if args.get('status') in ['1', 'true', 'yes']:
+            return _response(serialization.dumps({'tweets': result,
+                                                  'nodes': nodes}))
+
+    return _list_response(request, result)
+
+
+async def _search_peer(node, params, top, deadline):
+    # Run a local search on a single peer and merge its tweets into top,
+    # return the number of tweets and the time it took.  The peer is told of
+    # the deadline (time.monotonic() based).
+
+    start = time.monotonic()
+    remaining = max(deadline - start, 0.001)
+
+    tweets = await _client.request_json(
+        'GET', node.address, '/search', params=params,
+        headers={flask_node.DEADLINE_HEADER: str(int(remaining * 1000))},
+        timeout=min(Config.SEARCH_PEER_TIMEOUT, remaining), retry=False)
+    flask_node._search_cache.set(node.address, params, tweets)
+    top.add(tweets, source=node.name)
+
+    return len(tweets), time.monotonic() - start
+
+
+async def _search_peers(nodes, params, top, deadline):
+    # Search all the nodes concurrently, with caching, circuit breakers and
+    # hedging, see seventweets.node._search_peers.
+
+    def submit(node):
+        return asyncio.ensure_future(_search_peer(node, params, top,
+                                                  deadline))
+
+    cache = flask_node._search_cache
+    cached = flask_node._cached_results(nodes, params, top)
+    for node in nodes:
+        if cached.get(node.name, {}).get('cached') == 'stale':
+            if cache.claim(node.address, params):
+                if Registry.breaker(node.name).allow():
+                    task = asyncio.ensure_future(_refresh_peer(node, params))
+                    _background.add(task)
+                    task.add_done_callback(_background.discard)
+                else:
+                    cache.release(node.address, params)
+
+    attempts = OrderedDict((node.name, [submit(node)]) for node in nodes
+                           if node.name not in cached and
+                           Registry.breaker(node.name).allow())
+    hedge_at = (time.monotonic() + Config.SEARCH_HEDGE_DELAY
+                if Config.SEARCH_HEDGE_DELAY else None)
+
+    while True:
+        pending = [t for tries in attempts.values()
+                   if not flask_node._resolved(tries)
+                   for t in tries if not t.done()]
+        now = time.monotonic()
+        if not pending or now >= deadline:
+            break
+
+        if hedge_at is not None and now >= hedge_at:
+            for node in nodes:
+                tries = attempts.get(node.name)
+                if tries and not flask_node._resolved(tries):
+                    tries.append(submit(node))
+            hedge_at = None
+            continue
+
+        until = deadline if hedge_at is None else min(deadline, hedge_at)
+        await asyncio.wait(pending, timeout=until - now,
+                           return_when=asyncio.FIRST_COMPLETED)
+
+    return [cached.get(node.name) or
+            flask_node._peer_status(node, attempts.get(node.name))
+            for node in nodes]
+
+
+async def _refresh_peer(node, params):
+    # Refresh stale cached results of a node, see
+    # seventweets.node._refresh_peer.
+
+    deadline = time.monotonic() + Config.SEARCH_PEER_TIMEOUT
+    try:
+        await _search_peer(node, params, TopK(0, 'newest'), deadline)
+    except Exception:
+        Registry.breaker(node.name).failure()
+    else:
+        Registry.breaker(node.name).success()
+    finally:
+        flask_node._search_cache.release(node.address, params)
+
+
+async def join_network(request):
+    """Initiate joining the network if not already in.
+
+    Asynchronous version of :func:`seventweets.node.join_network`, see there
+    for the request and response format.
+
+    """
+    if not _authorized(request):
+        return _response('{}', 401)
+
+    init_node = json.loads((await request.body()).decode('utf-8'))
+
+    self_node = OrderedDict([('name', Config.NAME), ('address', Config.ADDRESS)])
+    body = json.dumps(self_node)
+
+    # In case others not returning self in list of known nodes.  With the
+    # postgres registry backend registering is a database write, kept off
+    # the event loop.
+    await run_in_threadpool(Registry.register, init_node)
+
+    try:
+        all_nodes = await _register_to(init_node, body)
+    except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+        summary = [flask_node._join_status(init_node, e)]
+        return _response(json.dumps({'nodes': summary}), 502)
+
+    summary = [flask_node._join_status(init_node)]
+
+    others = [n for n in all_nodes
+              if n['name'] not in (init_node['name'], Config.NAME)]
+    await run_in_threadpool(_register_all, others)
+
+    results = await asyncio.gather(*(_register_to(n, body) for n in others),
+                                   return_exceptions=True)
+
+    for n, result in zip(others, results):
+        error = result if isinstance(result, Exception) else None
+        summary.append(flask_node._join_status(n, error))
+
+    return _response(json.dumps({'nodes': summary}))
+
+
+async def _register_to(peer, body):
+    # Announce ourselves to a node, return its decoded response.
+    return await _client.request_json('POST', peer['address'], '/registry',
+                                      data=body)
+
+
+def _register_all(nodes):
+    # Register nodes, run in the thread pool.
+    for node in nodes:
+        Registry.register(node)
+
+
+@asynccontextmanager
+async def _lifespan(app):
+    global _client
+
+    client = peers.AsyncPeerClient(pool_size=Config.PEER_POOL_SIZE,
+                                   timeout=Config.PEER_TIMEOUT,
+                                   retries=Config.PEER_RETRIES)
+    _client = client
+    try:
+        yield
+    finally:
+        await client.close()
+
+
+app = Starlette(
+    routes=[
+        Route('/search', search),
+        Route('/join_network', join_network, methods=['POST']),
+        Mount('/', app=WsgiToAsgi(flask_node.app)),
+    ],
+    # Responses of the Flask app are compressed there already.
+    middleware=[Middleware(GZipMiddleware,
+                           minimum_size=Config.GZIP_MIN_SIZE,
+                           compresslevel=Config.GZIP_LEVEL)]
+    if Config.GZIP_MIN_SIZE else [],
+    lifespan=_lifespan)
@@ -0,0 +1,210 @@
+"""This module implements group commit of new tweets.
+
+Saving a tweet in its own transaction costs a commit, and the wait for the
+database to flush it to disk, per tweet.  With ``Config.WRITE_BATCH``,
+tweets posted concurrently are instead handed to a writer thread, which
+collects them for at most ``Config.WRITE_BATCH_WAIT`` seconds (or until
+``Config.WRITE_BATCH_SIZE`` are waiting) and saves them all with one
+multi-row ``INSERT`` and a single commit (see
+:meth:`seventweets.storage.Storage.save_tweets`).  Every caller waits for
+the commit and gets its own saved tweet back.
+
+If saving a batch fails on an invalid tweet (one the database rejects, or
+one that can't even be sent to it), its tweets are saved one by one, so
+that a single bad tweet only fails its own request.  Other errors (no free
+connection, a broken one) fail the whole batch at once.  A caller
+waits at most ``Config.DB_POOL_WAIT_TIMEOUT`` seconds more than the batch
+window, then gets :exc:`seventweets.db.PoolTimeout`.
+
+Classes:
+    WriteBatcher: Saves tweets of concurrent callers in batches.
+
+Functions:
+    get_batcher: Return the batcher of this process.
+
+"""
+
+import logging
+import queue
+import threading
+import time
+
+from seventweets.config import Config
+from seventweets.db import get_db_cursor
+from seventweets.db import InvalidInput
+from seventweets.db import PoolTimeout
+from seventweets.storage import Storage
+
+
+logger = logging.getLogger(__name__)
+
+
+class _Pending:
+    # A tweet waiting to be saved, and the outcome once it is.
+
+    __slots__ = ('tweet', 'result', 'error', 'done', 'abandoned')
+
+    def __init__(self, tweet):
+        self.tweet = tweet
+        self.result = None
+        self.error = None
+        self.done = threading.Event()
+        # Set when the caller stopped waiting.
+        self.abandoned = False
+
+
+class WriteBatcher:
+    """Saves tweets of concurrent callers in batches, one commit per batch.
+
+    Methods:
+        save_tweet: Save a tweet and return it once it's committed.
+        start: Start the writer thread.
+        stop: Stop the writer thread.
+
+    """
+
+    def __init__(self, max_size=100, max_wait=0.005, timeout=10):
+        """Initialize the batcher.
+
+        Args:
+            max_size (int): Maximum number of tweets saved at once.
+            max_wait (float): Seconds a batch waits for more tweets after
+                the first one arrived.
+            timeout (float): Seconds a caller waits for its tweet to be
+                saved, on top of ``max_wait``.
+
+        """
+        self.max_size = max_size
+        self.max_wait = max_wait
+        self.timeout = timeout
+
+        self._queue = queue.Queue()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def save_tweet(self, tweet):
+        """Save a tweet and return it once it's committed.
+
+        Args:
+            tweet (str): Content of the tweet.
+
+        Returns:
+            dict: The saved tweet (``{"id": <int>, "name": <str>, "tweet":
+                <str>}``).
+
+        Raises:
+            PoolTimeout: If the tweet wasn't saved in time.  It's not saved
+                at all then, unless it was being saved already.
+            Exception: Whatever saving the tweet raised.
+
+        """
+        pending = _Pending(tweet)
+        self._queue.put(pending)
+
+        if not pending.done.wait(self.max_wait + self.timeout):
+            pending.abandoned = True
+            raise PoolTimeout('Tweet not saved in {} seconds'.format(
+                self.max_wait + self.timeout))
+
+        if pending.error is not None:
+            raise pending.error
+        return pending.result
+
+    def start(self):
+        """Start the writer thread."""
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='writes',
+                                        daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the writer thread, after saving the tweets waiting."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while not self._stop.is_set() or not self._queue.empty():
+            try:
+                first = self._queue.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            batch = [p for p in self._collect(first) if not p.abandoned]
+            if batch:
+                self._write(batch)
+
+    def _collect(self, first):
+        # The batch started by first: tweets arriving until max_wait passed,
+        # or max_size tweets.
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+
+        while len(batch) < self.max_size:
+            timeout = deadline - time.monotonic()
+            try:
+                if timeout > 0:
+                    batch.append(self._queue.get(timeout=timeout))
+                else:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+
+        return batch
+
+    def _write(self, batch):
+        # Save a batch and hand every caller its tweet.  A batch failed on an
+        # invalid tweet is saved again one tweet per transaction, to find out
+        # whose tweet it was.  Any other error fails the whole batch, saving
+        # the tweets one by one would only fail the same way, slower.
+        try:
+            with get_db_cursor() as cursor:
+                saved = Storage.save_tweets(cursor,
+                                            [p.tweet for p in batch])
+        except InvalidInput as e:
+            if len(batch) == 1:
+                self._fail(batch, e)
+                return
+            logger.warning('Saving a batch of %s tweets failed, saving them '
+                           'one by one: %s', len(batch), e)
+            for pending in batch:
+                self._write([pending])
+            return
+        except Exception as e:
+            self._fail(batch, e)
+            return
+
+        for pending, tweet in zip(batch, saved):
+            pending.result = tweet
+            pending.done.set()
+
+    @staticmethod
+    def _fail(batch, error):
+        # Hand every caller of the batch the error.
+        for pending in batch:
+            pending.error = error
+            pending.done.set()
+
+
+_batcher = None
+_batcher_lock = threading.Lock()
+
+
+def get_batcher():
+    """Return the batcher of this process, starting it if needed.
+
+    Returns:
+        WriteBatcher: The running batcher, configured from :class:`Config`.
+
+    """
+    global _batcher
+
+    if _batcher is None:
+        with _batcher_lock:
+            if _batcher is None:
+                batcher = WriteBatcher(max_size=Config.WRITE_BATCH_SIZE,
+                                       max_wait=Config.WRITE_BATCH_WAIT,
+                                       timeout=Config.DB_POOL_WAIT_TIMEOUT)
+                batcher.start()
+                _batcher = batcher
+    return _batcher
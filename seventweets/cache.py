@@ -0,0 +1,251 @@
+"""This module implements caching of database reads.
+
+All caches share the same small interface: ``get``, ``set``, ``delete``,
+``clear`` and ``stats``.  Keys are strings and values are strings (serialized
+JSON), so that any backend can store them.
+
+Classes:
+    LRUCache: In-process cache bounded by size and entry age.
+    MemcachedCache: Cache shared by all processes using the same memcached.
+    NullCache: A cache that never holds anything.
+
+Functions:
+    get_cache: Return the cache configured for this process.
+
+"""
+
+from collections import OrderedDict
+import logging
+import threading
+import time
+
+from seventweets.config import Config
+
+
+logger = logging.getLogger(__name__)
+
+
+class LRUCache:
+    """In-process, thread-safe cache with LRU eviction and entry expiry.
+
+    Every process has its own instance, so with several worker processes a
+    change made in one worker is seen by the others only after the affected
+    entries expire.
+
+    Attributes:
+        maxsize (int): Maximum number of entries.
+        ttl (float): Seconds after which an entry expires.
+
+    """
+
+    def __init__(self, maxsize=1024, ttl=60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (expiry time, value)
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def get(self, key):
+        """Return the value cached under key, or ``None``."""
+        with self._lock:
+            entry = self._entries.get(key)
+
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self._misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return entry[1]
+
+    def set(self, key, value):
+        """Cache value under key, evicting least recently used entries."""
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self._evictions += 1
+
+    def delete(self, key):
+        """Remove key from the cache if present."""
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        """Remove all entries."""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Return cache statistics.
+
+        Returns:
+            dict: Backend name, number of entries, hit, miss and eviction
+                counters.
+
+        """
+        with self._lock:
+            return dict(backend='memory', size=len(self._entries),
+                        maxsize=self.maxsize, hits=self._hits,
+                        misses=self._misses, evictions=self._evictions)
+
+
+class MemcachedCache:
+    """Cache stored in memcached, shared by all processes that use it.
+
+    Running a memcached next to the node makes all gunicorn workers on the
+    host see the same cached data and invalidations.  Requires the
+    ``pymemcache`` package.
+
+    The cache never fails a read: if memcached can't be reached, or refuses
+    a value (like one over its 1 MB item size), the entry is treated as a
+    miss and the data is read from the database.
+
+    Attributes:
+        ttl (int): Seconds after which an entry expires.
+        prefix (str): Prefix of all keys, so that several nodes can share one
+            memcached.
+
+    """
+
+    def __init__(self, servers, ttl=60, prefix=''):
+        """Initialize the cache.
+
+        Args:
+            servers (list): ``(host, port)`` tuples of memcached servers.
+            ttl (int): See class attributes.
+            prefix (str): See class attributes.
+
+        """
+        try:
+            from pymemcache.client.hash import HashClient
+        except ImportError:
+            raise RuntimeError('The memcached cache backend requires '
+                               'the pymemcache package')
+
+        self.ttl = int(ttl)
+        self.prefix = prefix
+
+        self._client = HashClient(servers, use_pooling=True, ignore_exc=True)
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._errors = 0
+
+    def get(self, key):
+        """Return the value cached under key, or ``None``."""
+        try:
+            value = self._client.get(self.prefix + key)
+        except Exception as e:
+            self._failed('get', e)
+            value = None
+
+        with self._lock:
+            if value is None:
+                self._misses += 1
+                return None
+            self._hits += 1
+
+        return value.decode('utf-8')
+
+    def set(self, key, value):
+        """Cache value under key."""
+        try:
+            self._client.set(self.prefix + key, value.encode('utf-8'),
+                             expire=self.ttl)
+        except Exception as e:
+            self._failed('set', e)
+
+    def delete(self, key):
+        """Remove key from the cache if present."""
+        try:
+            self._client.delete(self.prefix + key)
+        except Exception as e:
+            self._failed('delete', e)
+
+    def clear(self):
+        """Remove all entries.  This flushes the whole memcached."""
+        self._client.flush_all()
+
+    def stats(self):
+        """Return cache statistics of this process.
+
+        Returns:
+            dict: Backend name, hit, miss and error counters.
+
+        """
+        with self._lock:
+            return dict(backend='memcached', hits=self._hits,
+                        misses=self._misses, errors=self._errors)
+
+    def _failed(self, operation, error):
+        # Count and log a failed memcached operation, the caller carries on
+        # as if the entry wasn't cached.
+        with self._lock:
+            self._errors += 1
+        logger.warning('Memcached %s failed: %s', operation, error)
+
+
+class NullCache:
+    """A cache that never holds anything, used to disable caching."""
+
+    def get(self, key):
+        return None
+
+    def set(self, key, value):
+        pass
+
+    def delete(self, key):
+        pass
+
+    def clear(self):
+        pass
+
+    def stats(self):
+        return dict(backend='none')
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    """Return the cache of this process, creating it if needed.
+
+    The backend is selected by ``Config.CACHE_BACKEND``: ``"memory"`` for
+    :class:`LRUCache`, ``"memcached"`` for :class:`MemcachedCache` and
+    ``"none"`` for :class:`NullCache`.
+
+    Returns:
+        The cache object.
+
+    """
+    global _cache
+
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                backend = Config.CACHE_BACKEND
+
+                if backend == 'memory':
+                    _cache = LRUCache(Config.CACHE_SIZE, Config.CACHE_TTL)
+                elif backend == 'memcached':
+                    servers = []
+                    for server in Config.CACHE_SERVERS.split(','):
+                        host, _, port = server.strip().partition(':')
+                        servers.append((host, int(port or 11211)))
+                    _cache = MemcachedCache(servers, Config.CACHE_TTL,
+                                            prefix='{}:'.format(Config.NAME))
+                elif backend == 'none':
+                    _cache = NullCache()
+                else:
+                    raise ValueError(
+                        'Unknown cache backend: {}'.format(backend))
+    return _cache
@@ -21,6 +21,102 @@ class Config:
         ADDRESS (str): Node address, IP or FQDN.
         API_TOKEN (str): Auth token that the front end for this node uses to
             issue state changing commands.
+        DB_POOL_MIN (int): Number of database connections kept open even when
+            idle.
+        DB_POOL_MAX (int): Maximum number of database connections per worker
+            process.
+        DB_POOL_IDLE_TIMEOUT (float): Seconds after which an idle database
+            connection is closed.
+        DB_POOL_CHECK_INTERVAL (float): Seconds of idleness after which a
+            database connection is checked before use.
+        DB_POOL_WAIT_TIMEOUT (float): Seconds to wait for a free database
+            connection.
+        PAGE_SIZE (int): Default number of tweets in a page of tweets.
+        MAX_PAGE_SIZE (int): Maximum number of tweets in a page of tweets.
+        STREAM_BATCH_SIZE (int): Number of rows fetched from the database at
+            once when streaming tweets and search results.
+        MAX_TWEET_LENGTH (int): Maximum length of a tweet, as allowed by the
+            database schema.
+        MAX_BATCH_SIZE (int): Maximum number of tweets saved by one batch
+            request.
+        WRITE_BATCH (bool): If tweets posted concurrently are saved
+            together, with one commit (see :mod:`seventweets.batching`).
+        WRITE_BATCH_SIZE (int): Maximum number of tweets saved together.
+        WRITE_BATCH_WAIT (float): Seconds a tweet waits for others to be
+            saved with.
+        CACHE_BACKEND (str): Cache for tweets read from the database,
+            ``"memory"`` (per process), ``"memcached"`` (shared by processes)
+            or ``"none"``.
+        CACHE_SIZE (int): Maximum number of entries in the in-process cache.
+        CACHE_TTL (float): Seconds after which cache entries expire.
+        CACHE_SERVERS (str): Comma separated ``host:port`` addresses of
+            memcached servers.
+        PEER_WORKERS (int): Maximum number of threads per worker process
+            used for concurrent requests to other nodes.
+        PEER_POOL_SIZE (int): Maximum number of keep-alive connections per
+            other node.
+        PEER_POOLS (int): Maximum number of other nodes to keep connections
+            to.
+        PEER_TIMEOUT (float): Seconds to wait for another node to answer.
+        PEER_RETRIES (int): Number of retries of failed requests to other
+            nodes.
+        SEARCH_PEER_TIMEOUT (float): Seconds a single node is given to answer
+            a global search.
+        SEARCH_DEADLINE (float): Seconds after which a global search returns
+            with whatever results it has.
+        SEARCH_HEDGE_DELAY (float): Seconds after which a peer that hasn't
+            answered a global search yet is sent a second, hedged request.
+            Zero disables hedging.
+        SEARCH_CACHE_SIZE (int): Maximum number of peers' search results
+            cached by the node coordinating a global search.
+        SEARCH_CACHE_TTL (float): Seconds cached search results of a peer are
+            used without asking it again.  Zero disables the cache.
+        SEARCH_CACHE_STALE (float): Seconds after ``SEARCH_CACHE_TTL`` cached
+            search results are still used while being refreshed.
+        BREAKER_THRESHOLD (int): Consecutive failed requests to a node after
+            which it isn't sent requests for a while.
+        BREAKER_COOLDOWN (float): Seconds a node isn't sent requests after
+            too many failures.
+        REGISTRY_BACKEND (str): Storage of the registry of nodes,
+            ``"memory"`` (per process) or ``"postgres"`` (shared by processes
+            and kept across restarts).
+        REGISTRY_REFRESH_INTERVAL (float): Seconds between checks for changes
+            of the registry made by other processes.
+        TIMELINE (bool): If tweets of all nodes are pulled into the home
+            timeline.
+        TIMELINE_INTERVAL (float): Seconds between pulls of new tweets into
+            the home timeline.
+        TIMELINE_BATCH_SIZE (int): Number of tweets asked of a node at once
+            when pulling into the home timeline.
+        TIMELINE_WORKERS (int): Number of nodes pulled concurrently per
+            worker process.
+        GZIP_MIN_SIZE (int): Size in bytes from which responses are
+            compressed with gzip for clients accepting it, zero disables
+            compression.
+        GZIP_LEVEL (int): Compression level of gzip, 1 (fastest) to 9
+            (smallest).
+        PUSH (bool): If new tweets are pushed to subscribed nodes, and the
+            home timeline subscribes to the nodes it pulls from.
+        PUSH_INTERVAL (float): Seconds between deliveries of new tweets to
+            subscribers, unless a tweet saved by the same worker process
+            triggers one earlier.
+        PUSH_BATCH_SIZE (int): Maximum number of tweets delivered to a
+            subscriber at once.
+        PUSH_BACKOFF (float): Seconds before the first retry of a failed
+            delivery, doubled with every further failure.
+        PUSH_MAX_BACKOFF (float): Maximum seconds between retries of failed
+            deliveries.
+        PUSH_MAX_FAILURES (int): Number of failed deliveries in a row after
+            which a subscriber is dropped.
+        GOSSIP (bool): If the gossip membership protocol runs, keeping the
+            registry in sync with the network and evicting dead nodes.
+        GOSSIP_PERIOD (float): Seconds between probes of other nodes.
+        GOSSIP_PING_TIMEOUT (float): Seconds to wait for a node to answer a
+            probe.
+        GOSSIP_INDIRECT_PROBES (int): Number of nodes asked to probe a node
+            that didn't answer.
+        GOSSIP_SUSPICION_TIMEOUT (float): Seconds after which a node that
+            failed probing is declared dead.
 
     """
 
@@ -31,3 +127,65 @@ class Config:
     NAME = os.environ.get('ST_NODE_NAME')
     ADDRESS = os.environ.get('ST_NODE_ADDRESS')
     API_TOKEN = os.environ.get('ST_API_TOKEN')
+
+    DB_POOL_MIN = int(os.environ.get('ST_PG_POOL_MIN', 1))
+    DB_POOL_MAX = int(os.environ.get('ST_PG_POOL_MAX', 10))
+    DB_POOL_IDLE_TIMEOUT = float(os.environ.get('ST_PG_POOL_IDLE_TIMEOUT', 300))
+    DB_POOL_CHECK_INTERVAL = float(
+        os.environ.get('ST_PG_POOL_CHECK_INTERVAL', 30))
+    DB_POOL_WAIT_TIMEOUT = float(os.environ.get('ST_PG_POOL_WAIT_TIMEOUT', 10))
+
+    PAGE_SIZE = int(os.environ.get('ST_PAGE_SIZE', 50))
+    MAX_PAGE_SIZE = int(os.environ.get('ST_MAX_PAGE_SIZE', 1000))
+    STREAM_BATCH_SIZE = int(os.environ.get('ST_STREAM_BATCH_SIZE', 500))
+
+    MAX_TWEET_LENGTH = 500
+    MAX_BATCH_SIZE = int(os.environ.get('ST_MAX_BATCH_SIZE', 10000))
+    WRITE_BATCH = os.environ.get('ST_WRITE_BATCH', '') in ['1', 'true', 'yes']
+    WRITE_BATCH_SIZE = int(os.environ.get('ST_WRITE_BATCH_SIZE', 100))
+    WRITE_BATCH_WAIT = float(os.environ.get('ST_WRITE_BATCH_WAIT', 0.005))
+
+    CACHE_BACKEND = os.environ.get('ST_CACHE_BACKEND', 'memory')
+    CACHE_SIZE = int(os.environ.get('ST_CACHE_SIZE', 4096))
+    CACHE_TTL = float(os.environ.get('ST_CACHE_TTL', 60))
+    CACHE_SERVERS = os.environ.get('ST_CACHE_SERVERS', 'localhost:11211')
+
+    PEER_WORKERS = int(os.environ.get('ST_PEER_WORKERS', 32))
+    PEER_POOL_SIZE = int(os.environ.get('ST_PEER_POOL_SIZE', 10))
+    PEER_POOLS = int(os.environ.get('ST_PEER_POOLS', 100))
+    PEER_TIMEOUT = float(os.environ.get('ST_PEER_TIMEOUT', 3))
+    PEER_RETRIES = int(os.environ.get('ST_PEER_RETRIES', 2))
+    SEARCH_PEER_TIMEOUT = float(os.environ.get('ST_SEARCH_PEER_TIMEOUT', 3))
+    SEARCH_DEADLINE = float(os.environ.get('ST_SEARCH_DEADLINE', 5))
+    SEARCH_HEDGE_DELAY = float(os.environ.get('ST_SEARCH_HEDGE_DELAY', 0))
+    SEARCH_CACHE_SIZE = int(os.environ.get('ST_SEARCH_CACHE_SIZE', 1000))
+    SEARCH_CACHE_TTL = float(os.environ.get('ST_SEARCH_CACHE_TTL', 10))
+    SEARCH_CACHE_STALE = float(os.environ.get('ST_SEARCH_CACHE_STALE', 60))
+    BREAKER_THRESHOLD = int(os.environ.get('ST_BREAKER_THRESHOLD', 5))
+    BREAKER_COOLDOWN = float(os.environ.get('ST_BREAKER_COOLDOWN', 30))
+
+    REGISTRY_BACKEND = os.environ.get('ST_REGISTRY_BACKEND', 'memory')
+    REGISTRY_REFRESH_INTERVAL = float(
+        os.environ.get('ST_REGISTRY_REFRESH_INTERVAL', 1))
+
+    TIMELINE = os.environ.get('ST_TIMELINE', '') in ['1', 'true', 'yes']
+    TIMELINE_INTERVAL = float(os.environ.get('ST_TIMELINE_INTERVAL', 10))
+    TIMELINE_BATCH_SIZE = int(os.environ.get('ST_TIMELINE_BATCH_SIZE', 500))
+    TIMELINE_WORKERS = int(os.environ.get('ST_TIMELINE_WORKERS', 4))
+
+    GZIP_MIN_SIZE = int(os.environ.get('ST_GZIP_MIN_SIZE', 1024))
+    GZIP_LEVEL = int(os.environ.get('ST_GZIP_LEVEL', 1))
+
+    PUSH = os.environ.get('ST_PUSH', '') in ['1', 'true', 'yes']
+    PUSH_INTERVAL = float(os.environ.get('ST_PUSH_INTERVAL', 1))
+    PUSH_BATCH_SIZE = int(os.environ.get('ST_PUSH_BATCH_SIZE', 100))
+    PUSH_BACKOFF = float(os.environ.get('ST_PUSH_BACKOFF', 1))
+    PUSH_MAX_BACKOFF = float(os.environ.get('ST_PUSH_MAX_BACKOFF', 300))
+    PUSH_MAX_FAILURES = int(os.environ.get('ST_PUSH_MAX_FAILURES', 20))
+
+    GOSSIP = os.environ.get('ST_GOSSIP', '') in ['1', 'true', 'yes']
+    GOSSIP_PERIOD = float(os.environ.get('ST_GOSSIP_PERIOD', 1))
+    GOSSIP_PING_TIMEOUT = float(os.environ.get('ST_GOSSIP_PING_TIMEOUT', 0.5))
+    GOSSIP_INDIRECT_PROBES = int(os.environ.get('ST_GOSSIP_INDIRECT_PROBES', 3))
+    GOSSIP_SUSPICION_TIMEOUT = float(
+        os.environ.get('ST_GOSSIP_SUSPICION_TIMEOUT', 5))
@@ -0,0 +1,398 @@
+"""This module implements database connection handling.
+
+Instead of opening a new connection for every request, connections are drawn
+from a bounded, thread-safe pool that is shared by all threads of a worker
+process.
+
+Classes:
+    ConnectionPool: A bounded pool of database connections.
+    PoolTimeout: Raised when no connection becomes available in time.
+    QueryTimeout: Raised when a statement is cancelled by a timeout.
+    InvalidInput: Raised when a statement fails because of invalid data.
+
+Functions:
+    get_db_cursor: Context manager yielding a cursor on a pooled connection.
+    get_pool: Return the connection pool of this process.
+    on_commit: Run a function after the current transaction commits.
+
+"""
+
+from collections import deque
+from contextlib import contextmanager
+import threading
+import time
+
+import pg8000
+
+from seventweets.config import Config
+
+
+class PoolTimeout(Exception):
+    """Raised when waiting for a free connection takes too long."""
+
+
+class QueryTimeout(Exception):
+    """Raised when a statement is cancelled because it ran too long."""
+
+
+class InvalidInput(Exception):
+    """Raised when a statement fails because of an invalid value.
+
+    That's a value PostgreSQL can't convert (like a malformed date), a value
+    that doesn't fit a column, or one that violates a constraint.  Such
+    errors are caused by the data of a statement, they don't mean anything is
+    wrong with the database or the connection.
+
+    """
+
+
+class ConnectionPool:
+    """A thread-safe, bounded pool of database connections.
+
+    Connections are opened lazily, up to ``maxconn`` of them.  Idle
+    connections are handed out most recently used first, so the ones at the
+    bottom of the stack stay unused and are closed after ``idle_timeout``
+    seconds, but never below ``minconn`` open connections.  A connection that
+    has been idle for longer than ``check_interval`` seconds is health checked
+    before it is handed out, and transparently replaced if it is broken.
+
+    Attributes:
+        minconn (int): Number of connections kept open even when idle.
+        maxconn (int): Maximum number of open connections.
+        idle_timeout (float): Seconds after which an idle connection is closed.
+        check_interval (float): Seconds of idleness after which a connection
+            is checked before use.
+        wait_timeout (float): Seconds to wait for a free connection before
+            giving up with :exc:`PoolTimeout`.
+
+    Methods:
+        getconn: Check out a connection.
+        putconn: Return a connection to the pool.
+        closeall: Close all idle connections.
+        stats: Return pool statistics.
+
+    """
+
+    def __init__(self, connect, minconn=1, maxconn=10, idle_timeout=300,
+                 check_interval=30, wait_timeout=10):
+        """Initialize the pool.
+
+        Args:
+            connect (callable): Called without arguments to open a new
+                connection.
+            minconn (int): See class attributes.
+            maxconn (int): See class attributes.
+            idle_timeout (float): See class attributes.
+            check_interval (float): See class attributes.
+            wait_timeout (float): See class attributes.
+
+        """
+        if maxconn < 1 or minconn > maxconn:
+            raise ValueError('Invalid pool size: min {}, max {}'.format(
+                minconn, maxconn))
+
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.idle_timeout = idle_timeout
+        self.check_interval = check_interval
+        self.wait_timeout = wait_timeout
+
+        self._connect = connect
+        self._cond = threading.Condition()
+        # Stack of (connection, time it was returned) pairs, most recently
+        # returned on the right.
+        self._idle = deque()
+        self._size = 0  # Open connections, idle or checked out.
+        self._counters = dict(checkouts=0, connects=0, waits=0, timeouts=0,
+                              reconnects=0, discarded=0, expired=0)
+
+    def getconn(self):
+        """Check out a connection from the pool.
+
+        Returns:
+            A database connection.  It must be given back with
+            :meth:`putconn`.
+
+        Raises:
+            PoolTimeout: If no connection became free within ``wait_timeout``.
+
+        """
+        deadline = time.monotonic() + self.wait_timeout
+
+        with self._cond:
+            while not self._idle and self._size >= self.maxconn:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._counters['timeouts'] += 1
+                    raise PoolTimeout(
+                        'No free database connection after {} seconds'.format(
+                            self.wait_timeout))
+                self._counters['waits'] += 1
+                self._cond.wait(remaining)
+
+            self._counters['checkouts'] += 1
+            if self._idle:
+                connection, returned = self._idle.pop()
+            else:
+                connection, returned = None, None
+                # Reserve the slot now, the actual connect happens outside the
+                # lock so that it doesn't stall other threads.
+                self._size += 1
+
+        if connection is None:
+            return self._open()
+
+        if time.monotonic() - returned > self.check_interval:
+            if not self._check(connection):
+                self._close(connection)
+                self._count('reconnects')
+                return self._open()
+
+        return connection
+
+    def putconn(self, connection, discard=False):
+        """Return a connection to the pool.
+
+        Args:
+            connection: A connection previously returned by :meth:`getconn`.
+            discard (bool): Close the connection instead of reusing it, e.g.
+                when it is known to be broken.
+
+        """
+        if discard:
+            self._close(connection)
+            with self._cond:
+                self._counters['discarded'] += 1
+                self._size -= 1
+                self._cond.notify()
+            return
+
+        with self._cond:
+            self._idle.append((connection, time.monotonic()))
+            expired = self._expire()
+            self._cond.notify()
+
+        for c in expired:
+            self._close(c)
+
+    def closeall(self):
+        """Close all idle connections.
+
+        Checked out connections are not affected and go back to the pool when
+        they are returned.
+
+        """
+        with self._cond:
+            idle = [c for c, _ in self._idle]
+            self._idle.clear()
+            self._size -= len(idle)
+            self._cond.notify_all()
+
+        for c in idle:
+            self._close(c)
+
+    def stats(self):
+        """Return pool statistics for monitoring.
+
+        Returns:
+            dict: Current pool size and usage, configured limits, and
+                cumulative event counters.
+
+        """
+        with self._cond:
+            stats = dict(self._counters)
+            stats.update(size=self._size,
+                         idle=len(self._idle),
+                         in_use=self._size - len(self._idle),
+                         min=self.minconn,
+                         max=self.maxconn)
+        return stats
+
+    def _open(self):
+        # Open a new connection for a slot already reserved in _size.
+        try:
+            connection = self._connect()
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+
+        self._count('connects')
+        return connection
+
+    def _count(self, counter):
+        with self._cond:
+            self._counters[counter] += 1
+
+    def _expire(self):
+        # Remove connections idle for too long from the bottom of the stack.
+        # Must be called with the lock held, returns the connections to close.
+        expired = []
+        now = time.monotonic()
+
+        while (self._idle and self._size > self.minconn and
+               now - self._idle[0][1] > self.idle_timeout):
+            expired.append(self._idle.popleft()[0])
+            self._size -= 1
+            self._counters['expired'] += 1
+
+        return expired
+
+    @staticmethod
+    def _check(connection):
+        # Health check: a trivial round trip to the server.
+        try:
+            cursor = connection.cursor()
+            cursor.execute('SELECT 1')
+            cursor.fetchone()
+            cursor.close()
+            connection.rollback()
+        except Exception:
+            return False
+        return True
+
+    @staticmethod
+    def _close(connection):
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+# Per thread stack of lists of functions to call after commit, one list for
+# each get_db_cursor block the thread is in.
+_local = threading.local()
+
+
+def get_pool():
+    """Return the connection pool of this process, creating it if needed.
+
+    The pool is created lazily so that no connection is opened on import, and
+    so that each forked worker process gets its own pool.
+
+    Returns:
+        ConnectionPool: The pool configured from :class:`Config`.
+
+    """
+    global _pool
+
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(
+                    lambda: pg8000.connect(**Config.DB_CONFIG),
+                    minconn=Config.DB_POOL_MIN,
+                    maxconn=Config.DB_POOL_MAX,
+                    idle_timeout=Config.DB_POOL_IDLE_TIMEOUT,
+                    check_interval=Config.DB_POOL_CHECK_INTERVAL,
+                    wait_timeout=Config.DB_POOL_WAIT_TIMEOUT)
+    return _pool
+
+
+def on_commit(func):
+    """Call func after the current transaction is committed.
+
+    Used to keep things derived from the database, like caches, in sync with
+    it: the function is called only once the changes are visible to other
+    connections, and not at all if the transaction is rolled back.  Outside
+    of a :func:`get_db_cursor` block the function is called immediately.
+
+    Args:
+        func (callable): Function to call without arguments.
+
+    """
+    stack = getattr(_local, 'on_commit', None)
+
+    if stack:
+        stack[-1].append(func)
+    else:
+        func()
+
+
+@contextmanager
+def get_db_cursor(timeout=None):
+    """Context manager yielding a cursor on a pooled connection.
+
+    The transaction is committed when the block exits normally and rolled
+    back otherwise.  A connection that can't even be rolled back is considered
+    broken and is discarded instead of being returned to the pool.
+
+    Args:
+        timeout (float): If set, statements in the block are cancelled by the
+            server after running this many seconds.
+
+    Yields:
+        :class:`pg8000.Cursor`: Database cursor object.
+
+    Raises:
+        QueryTimeout: If a statement was cancelled because of ``timeout``.
+        InvalidInput: If a statement failed on an invalid value.
+
+    """
+    pool = get_pool()
+    connection = pool.getconn()
+    broken = False
+
+    if not hasattr(_local, 'on_commit'):
+        _local.on_commit = []
+    _local.on_commit.append([])
+
+    try:
+        cursor = connection.cursor()
+        if timeout is not None:
+            # Zero would mean no timeout at all.
+            ms = max(int(timeout * 1000), 1)
+            cursor.execute("SELECT set_config('statement_timeout', %s, true)",
+                           (str(ms),))
+        yield cursor
+        cursor.close()
+        connection.commit()
+    except BaseException as e:
+        _local.on_commit.pop()
+        try:
+            connection.rollback()
+        except Exception:
+            broken = True
+        if _cancelled(e):
+            raise QueryTimeout('Statement cancelled after {} seconds'.format(
+                timeout)) from e
+        if _invalid(e):
+            raise InvalidInput(_sqlstate(e, 'M') or str(e)) from e
+        raise
+    else:
+        for func in _local.on_commit.pop():
+            func()
+    finally:
+        pool.putconn(connection, discard=broken)
+
+
+def _cancelled(error):
+    # If error is pg8000's error of a statement cancelled by timeout.
+    return _sqlstate(error) == '57014'
+
+
+def _invalid(error):
+    # If error is pg8000's error of a statement failing on an invalid value,
+    # SQLSTATE class 22 (data exception) or 23 (integrity constraint
+    # violation), or of a parameter it couldn't even send.
+    return (isinstance(error, _ENCODING_ERRORS) or
+            (_sqlstate(error) or '')[:2] in ('22', '23'))
+
+
+# Errors pg8000 raises before sending a statement, on array parameters with
+# values it can't encode (like a number among strings).
+_ENCODING_ERRORS = (pg8000.ArrayContentNotHomogenousError,
+                    pg8000.ArrayContentNotSupportedError,
+                    pg8000.ArrayDimensionsNotConsistentError)
+
+
+def _sqlstate(error, field='C'):
+    # A field of pg8000's error of a failed statement, None for other errors.
+    # Server errors carry the fields of the error response, "C" is the
+    # SQLSTATE and "M" the message.
+    fields = error.args[0] if error.args else None
+    return fields.get(field) if isinstance(fields, dict) else None
@@ -0,0 +1,620 @@
+"""This module implements gossip based membership with failure detection.
+
+The protocol follows SWIM.  Every protocol period each node pings one other
+member, going round robin through a shuffled list of members.  If the member
+doesn't acknowledge in time, a few other members are asked to ping it on our
+behalf (indirect probe), which tells a dead node from a bad network path.  If
+that fails too, the member becomes suspect, and if it doesn't refute the
+suspicion before the suspicion timeout, it is declared dead and removed.
+
+Membership changes (a member being alive, suspect or dead) are not sent
+separately but piggybacked on pings and acknowledgements, each a number of
+times proportional to the logarithm of the network size, which spreads them
+to all nodes in O(log N) protocol periods.  Every member has an incarnation
+number that only it increments, to refute suspicion of itself, so that
+newer information always wins over older.  A node that pings a node which
+doesn't know it yet receives the full membership list in the
+acknowledgement, which is how a new node catches up.
+
+Messages are plain JSON-able dictionaries, and the network is accessed
+through a transport object, so the protocol can be run between in-process
+nodes in simulations and tests.
+
+Every worker process of a node has an instance, as pings can arrive at any
+of them, but only one probes other nodes: the one holding the node's lock
+file (see :class:`FileLock`).  The others answer pings and learn of changes
+from them, and take over the probing when the holder dies.  The probe
+traffic of a node thus doesn't grow with its number of workers.
+
+Classes:
+    Gossip: Membership protocol state machine of a single node.
+    HTTPTransport: Transport over the HTTP API of nodes.
+    FileLock: Lock electing the worker process that probes.
+
+Functions:
+    get_gossip: Return the membership protocol instance of this process.
+    start: Start the membership protocol for this node.
+
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import wait
+from concurrent.futures import FIRST_COMPLETED
+import fcntl
+import json
+import logging
+import math
+import os
+import random
+import tempfile
+import threading
+import time
+
+from seventweets.config import Config
+from seventweets.peers import PeerClient
+from seventweets.registry import Registry
+
+
+ALIVE = 'alive'
+SUSPECT = 'suspect'
+DEAD = 'dead'
+
+logger = logging.getLogger(__name__)
+
+
+class _Member:
+    # What we know about another node.
+
+    def __init__(self, name, address, state, incarnation, changed):
+        self.name = name
+        self.address = address
+        self.state = state
+        self.incarnation = incarnation
+        self.changed = changed  # Time of the last change of state.
+
+    def as_update(self):
+        return dict(name=self.name, address=self.address, state=self.state,
+                    incarnation=self.incarnation)
+
+
+class Gossip:
+    """Membership protocol state machine of a single node.
+
+    :meth:`tick` runs one protocol period, and :meth:`handle_ping` and
+    :meth:`handle_ping_req` answer messages of other nodes.  :meth:`start`
+    runs the protocol periods in a background thread, in simulations they
+    can be driven by calling :meth:`tick` directly.
+
+    Callbacks of membership changes are queued while the state is locked,
+    and run after it's released, in the order of the changes, by the
+    background thread or the caller of :meth:`tick`, :meth:`add_member` or
+    :meth:`remove_member`.  Answering pings never waits for them.
+
+    The transport must have two methods, both raising an exception on
+    failure or timeout:
+
+    *  ``ping(address, message)`` -- Deliver a ping to the node at address
+       and return its acknowledgement;
+    *  ``ping_req(address, target, message)`` -- Ask the node at address to
+       ping target (a ``{"name": <str>, "address": <str>}`` dictionary) and
+       return its acknowledgement if target acknowledged.
+
+    Attributes:
+        name (str): Name of this node.
+        address (str): Address of this node.
+        incarnation (int): Incarnation number of this node.
+
+    Methods:
+        members: Return the members that are not dead.
+        add_member: Add a member we learned of outside of the protocol.
+        remove_member: Declare a member that left the network dead.
+        tick: Run one protocol period.
+        handle_ping: Answer a ping.
+        handle_ping_req: Answer an indirect ping request.
+        start: Run protocol periods in a background thread.
+        stop: Stop the background thread.
+
+    """
+
+    def __init__(self, name, address, transport, on_alive=None, on_dead=None,
+                 period=1.0, indirect_probes=3, suspicion_timeout=5.0,
+                 retransmit_mult=3, max_piggyback=10, clock=time.monotonic,
+                 rng=None, incarnation=None, leader=None):
+        """Initialize the node's protocol state.
+
+        Args:
+            name (str): See class attributes.
+            address (str): See class attributes.
+            transport: Object used to send messages, see above.
+            on_alive (callable): Called with name and address when a member
+                is added or comes back from the dead.
+            on_dead (callable): Called with name when a member is declared
+                dead.
+            period (float): Seconds between protocol periods in the
+                background thread.
+            indirect_probes (int): Number of members asked to ping a member
+                that didn't acknowledge.
+            suspicion_timeout (float): Seconds after which a suspect member
+                is declared dead.
+            retransmit_mult (int): Each update is piggybacked this many
+                times the logarithm of the network size.
+            max_piggyback (int): Maximum number of updates in a message.
+            clock (callable): Returns current time in seconds.
+            rng (:class:`random.Random`): Random number generator.
+            incarnation (int): Initial incarnation number.  Defaults to the
+                current UNIX time, so that a restarted node is newer than
+                anything the network remembers about its previous run.
+            leader (callable): Returns if the background thread should
+                probe, or only run callbacks, this period.  Always probes
+                if not set.
+
+        """
+        self.name = name
+        self.address = address
+        self.incarnation = (int(time.time()) if incarnation is None
+                            else incarnation)
+
+        self.transport = transport
+        self.on_alive = on_alive
+        self.on_dead = on_dead
+        self.period = period
+        self.indirect_probes = indirect_probes
+        self.suspicion_timeout = suspicion_timeout
+        self.retransmit_mult = retransmit_mult
+        self.max_piggyback = max_piggyback
+        self.clock = clock
+        self.rng = rng or random.Random()
+        self.leader = leader
+
+        self._lock = threading.RLock()
+        self._members = {}  # Name -> _Member, dead ones included.
+        self._updates = {}  # Name -> [update, transmissions left].
+        self._probe_order = []
+        # (callback, args) of membership changes, see _notify.
+        self._callbacks = []
+        self._notify_lock = threading.Lock()
+
+        self._executor = ThreadPoolExecutor(max_workers=max(indirect_probes, 1))
+        self._stop = threading.Event()
+        self._thread = None
+
+    def members(self):
+        """Return the members that are not dead.
+
+        Returns:
+            list: ``{"name": <str>, "address": <str>, "state": <str>,
+                "incarnation": <int>}`` dictionaries.
+
+        """
+        with self._lock:
+            return [m.as_update() for m in self._members.values()
+                    if m.state != DEAD]
+
+    def add_member(self, name, address):
+        """Add a member we learned of outside of the protocol.
+
+        Used when a node registers directly.  Known members are not affected,
+        the member itself will tell us of its current incarnation.
+
+        Args:
+            name (str): Name of the member.
+            address (str): Address of the member.
+
+        """
+        with self._lock:
+            if name != self.name and name not in self._members:
+                self._apply(dict(name=name, address=address, state=ALIVE,
+                                 incarnation=0), disseminate=True)
+        self._notify()
+
+    def remove_member(self, name):
+        """Declare a member that announced leaving the network dead.
+
+        Args:
+            name (str): Name of the member.
+
+        """
+        with self._lock:
+            member = self._members.get(name)
+            if member is not None and member.state != DEAD:
+                update = member.as_update()
+                update['state'] = DEAD
+                self._apply(update, disseminate=True)
+        self._notify()
+
+    def tick(self):
+        """Run one protocol period: probe the next member."""
+        try:
+            self._probe()
+        finally:
+            self._notify()
+
+    def _probe(self):
+        # Probe the next member, directly and then indirectly, and suspect
+        # it if it doesn't acknowledge.
+        with self._lock:
+            self._expire()
+            target = self._next_target()
+            if target is None:
+                return
+            target = target.as_update()
+            message = self._message()
+
+        try:
+            self._receive(self.transport.ping(target['address'], message))
+            return
+        except Exception:
+            pass
+
+        with self._lock:
+            helpers = [m.as_update() for m in self._members.values()
+                       if m.state == ALIVE and m.name != target['name']]
+            helpers = self.rng.sample(helpers,
+                                      min(self.indirect_probes, len(helpers)))
+            message = self._message()
+
+        futures = [self._executor.submit(self.transport.ping_req,
+                                         helper['address'], target, message)
+                   for helper in helpers]
+
+        while futures:
+            done, pending = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    self._receive(future.result())
+                    return
+            futures = pending
+
+        with self._lock:
+            member = self._members.get(target['name'])
+            if member is not None and member.state == ALIVE:
+                update = member.as_update()
+                update['state'] = SUSPECT
+                self._apply(update, disseminate=True)
+
+    def handle_ping(self, message):
+        """Answer a ping of another node.
+
+        Args:
+            message (dict): The ping.
+
+        Returns:
+            dict: The acknowledgement.  If the sender wasn't known before, it
+                includes the full membership list.
+
+        """
+        with self._lock:
+            known = message['from']['name'] in self._members
+            self._receive(message)
+            return self._message(full=not known)
+
+    def handle_ping_req(self, message):
+        """Answer an indirect ping request of another node.
+
+        Args:
+            message (dict): The request, a ping with the member to ping in
+                ``"target"``.
+
+        Returns:
+            dict: Acknowledgement for the requester.
+
+        Raises:
+            Exception: Whatever the transport raises if the target doesn't
+                acknowledge.
+
+        """
+        self._receive(message)
+
+        with self._lock:
+            ping = self._message()
+        self._receive(self.transport.ping(message['target']['address'], ping))
+
+        with self._lock:
+            return self._message()
+
+    def start(self):
+        """Run protocol periods in a background thread."""
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='gossip',
+                                        daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the background thread."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(self.period):
+            try:
+                if self.leader is None or self.leader():
+                    self.tick()
+                else:
+                    # Changes learned from pings.
+                    self._notify()
+            except Exception:
+                logger.exception('Gossip protocol period failed')
+
+    def _notify(self):
+        # Run the queued callbacks, without holding the state lock.  One
+        # thread at a time runs them, in order; a thread finding another one
+        # at it leaves it the callbacks, which it picks up before it stops.
+        while True:
+            if not self._notify_lock.acquire(blocking=False):
+                return
+            try:
+                while True:
+                    with self._lock:
+                        callbacks, self._callbacks = self._callbacks, []
+                    if not callbacks:
+                        break
+                    for callback, args in callbacks:
+                        try:
+                            callback(*args)
+                        except Exception:
+                            logger.exception('Gossip membership callback '
+                                             'failed')
+            finally:
+                self._notify_lock.release()
+
+            with self._lock:
+                if not self._callbacks:
+                    return
+
+    def _receive(self, message):
+        # Process a ping or acknowledgement: the sender is evidently alive,
+        # and it carries updates and possibly the full membership list.
+        with self._lock:
+            sender = dict(message['from'], state=ALIVE)
+            self._apply(sender, disseminate=sender['name'] not in self._members)
+
+            for update in message.get('updates', []):
+                self._apply(update, disseminate=True)
+            for update in message.get('members', []):
+                self._apply(update, disseminate=False)
+
+    def _apply(self, update, disseminate):
+        # Merge an update into our view if it is newer than what we know,
+        # queueing the callbacks of a change.  Must be called with the lock
+        # held.
+        name = update['name']
+        state = update['state']
+        incarnation = update['incarnation']
+
+        if name == self.name:
+            if state != ALIVE and incarnation >= self.incarnation:
+                # Refute suspicion (or rumours of our death).
+                self.incarnation = incarnation + 1
+                self._enqueue(dict(name=self.name, address=self.address,
+                                   state=ALIVE, incarnation=self.incarnation))
+            return
+
+        member = self._members.get(name)
+
+        if member is None:
+            member = _Member(name, update['address'], state, incarnation,
+                             self.clock())
+            self._members[name] = member
+            if state != DEAD and self.on_alive:
+                self._callbacks.append((self.on_alive,
+                                        (name, member.address)))
+        elif self._overrides(state, incarnation, member):
+            previous = member.state
+            member.address = update['address']
+            member.state = state
+            member.incarnation = incarnation
+            if state != previous:
+                member.changed = self.clock()
+
+            if state == DEAD and previous != DEAD and self.on_dead:
+                self._callbacks.append((self.on_dead, (name,)))
+            elif state != DEAD and previous == DEAD and self.on_alive:
+                self._callbacks.append((self.on_alive,
+                                        (name, member.address)))
+        else:
+            return
+
+        if disseminate:
+            self._enqueue(member.as_update())
+
+    @staticmethod
+    def _overrides(state, incarnation, member):
+        # SWIM precedence rules: higher incarnation wins, on equal
+        # incarnation dead beats suspect beats alive.
+        if incarnation > member.incarnation:
+            return True
+        if incarnation < member.incarnation:
+            return False
+
+        rank = {ALIVE: 0, SUSPECT: 1, DEAD: 2}
+        return rank[state] > rank[member.state]
+
+    def _enqueue(self, update):
+        # Queue an update for piggybacking, replacing older news of the same
+        # member.
+        alive = sum(1 for m in self._members.values() if m.state != DEAD) + 1
+        transmissions = self.retransmit_mult * math.ceil(math.log(alive + 1))
+        self._updates[update['name']] = [update, transmissions]
+
+    def _message(self, full=False):
+        # Build a ping or acknowledgement with piggybacked updates.  Must be
+        # called with the lock held.
+        queued = sorted(self._updates.values(), key=lambda u: -u[1])
+        updates = []
+        for entry in queued[:self.max_piggyback]:
+            updates.append(entry[0])
+            entry[1] -= 1
+            if entry[1] <= 0:
+                del self._updates[entry[0]['name']]
+
+        message = {'from': dict(name=self.name, address=self.address,
+                                incarnation=self.incarnation),
+                   'updates': updates}
+        if full:
+            message['members'] = [m.as_update()
+                                  for m in self._members.values()
+                                  if m.state != DEAD]
+
+        return message
+
+    def _next_target(self):
+        # Next member to probe.  Members are probed round robin in random
+        # order, which bounds the time until a failure is detected.
+        while True:
+            if not self._probe_order:
+                self._probe_order = [n for n, m in self._members.items()
+                                     if m.state != DEAD]
+                if not self._probe_order:
+                    return None
+                self.rng.shuffle(self._probe_order)
+
+            member = self._members.get(self._probe_order.pop())
+            if member is not None and member.state != DEAD:
+                return member
+
+    def _expire(self):
+        # Declare suspects dead after the suspicion timeout, and forget dead
+        # members once their death had enough time to spread.
+        now = self.clock()
+
+        for member in list(self._members.values()):
+            age = now - member.changed
+
+            if member.state == SUSPECT and age > self.suspicion_timeout:
+                update = member.as_update()
+                update['state'] = DEAD
+                self._apply(update, disseminate=True)
+            elif member.state == DEAD and age > 10 * self.suspicion_timeout:
+                del self._members[member.name]
+
+
+class HTTPTransport:
+    """Gossip transport over the HTTP API of nodes.
+
+    Uses its own peer client without retries, failure detection relies on
+    failing fast.
+
+    """
+
+    def __init__(self, timeout):
+        """Initialize the transport.
+
+        Args:
+            timeout (float): Seconds to wait for an acknowledgement.
+
+        """
+        self.timeout = timeout
+        self._client = PeerClient(pool_size=2, pools=Config.PEER_POOLS,
+                                  timeout=timeout, retries=0)
+
+    def ping(self, address, message):
+        r = self._client.post(address, '/gossip/ping',
+                              data=json.dumps(message))
+        return r.json()
+
+    def ping_req(self, address, target, message):
+        # The helper needs time for its own ping of the target.
+        r = self._client.post(address, '/gossip/ping_req',
+                              data=json.dumps(dict(message, target=target)),
+                              timeout=2 * self.timeout)
+        return r.json()
+
+
+class FileLock:
+    """Lock electing the worker process that probes other nodes.
+
+    An exclusive ``flock`` on a file, so it's held by one process at a time
+    and released by the operating system when that process dies, letting
+    another worker take it.
+
+    Methods:
+        held: Return if this process holds the lock, taking it if free.
+        release: Release the lock.
+
+    """
+
+    def __init__(self, path):
+        """Initialize the lock.
+
+        Args:
+            path (str): Path of the lock file, created if needed.
+
+        """
+        self.path = path
+        self._file = None
+
+    def held(self):
+        """Return if this process holds the lock, taking it if it's free.
+
+        Returns:
+            bool: True if held.
+
+        """
+        if self._file is None:
+            file = open(self.path, 'a')
+            try:
+                fcntl.flock(file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                file.close()
+                return False
+            self._file = file
+        return True
+
+    def release(self):
+        """Release the lock if held."""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+_gossip = None
+
+
+def get_gossip():
+    """Return the membership protocol instance of this process.
+
+    Returns:
+        Gossip or None: The instance, ``None`` if the protocol wasn't
+            started.
+
+    """
+    return _gossip
+
+
+def start():
+    """Start the membership protocol for this node.
+
+    Members are kept in sync with :class:`Registry`: nodes the protocol
+    finds alive are registered, and nodes it declares dead are deleted.
+    Registered nodes are the initial members.  Of the worker processes of
+    the node, only the one holding the lock file (in the temporary
+    directory, named after the node) probes.
+
+    Returns:
+        Gossip: The running instance.
+
+    """
+    global _gossip
+
+    if _gossip is None:
+        _gossip = Gossip(
+            Config.NAME, Config.ADDRESS,
+            HTTPTransport(Config.GOSSIP_PING_TIMEOUT),
+            on_alive=lambda name, address: Registry.register(
+                {'name': name, 'address': address}),
+            on_dead=Registry.delete_node,
+            period=Config.GOSSIP_PERIOD,
+            indirect_probes=Config.GOSSIP_INDIRECT_PROBES,
+            suspicion_timeout=Config.GOSSIP_SUSPICION_TIMEOUT,
+            leader=FileLock(os.path.join(
+                tempfile.gettempdir(),
+                'seventweets-gossip-{}.lock'.format(Config.NAME))).held)
+
+        for node in Registry.nodes():
+            _gossip.add_member(node.name, node.address)
+
+        _gossip.start()
+
+    return _gossip
@@ -5,67 +5,112 @@ database access functions, etc.
 
 Attributes:
     HEADERS (dict): Common HTTP response headers.
+    DEADLINE_HEADER (str): Request header with the milliseconds the caller
+        is going to wait for the response.
     PROTECTED_ENDPOINTS (dict): A dictionary indicating which endpoints are auth
         protected.
     single_mode (bool): Boolean indicating if we are the only node.
 
+Lists of tweets and nodes are sent to other nodes in the compact encoding
+of :mod:`seventweets.wire` if they ask for it, and responses are compressed
+with gzip for clients that accept it.
+
 Functions:
     delete_node: Endpoint for removing inactive nodes.
+    delete_subscription: Endpoint for cancelling a push subscription.
     delete_tweet: Endpoint for deleting own tweets.
     get_known_nodes: “Private” endpoint, returns nodes we are aware of.
+    get_pool_stats: “Private” endpoint, returns database pool statistics.
+    get_cache_stats: “Private” endpoint, returns tweet cache statistics.
+    get_peer_stats: “Private” endpoint, returns metrics of requests to peers.
+    get_changes: Endpoint to get changes of tweets since a cursor.
     get_tweet: Endpoint to get tweet by ID.
+    get_timeline: Endpoint to get the home timeline.
     get_tweets: Endpoint to get all own tweets.
+    gossip_ping: Endpoint for probes of the membership protocol.
+    gossip_ping_req: Endpoint for indirect probes of the membership protocol.
     join_network: Initiate network join.
+    receive_tweets: Endpoint for tweets pushed by other nodes.
     register_node: Register the node in request.
+    save_retweet: Retweet a tweet of another node.
     save_tweet: Save the tweet in request.
+    save_tweets: Save a batch of tweets in request.
+    save_subscription: Endpoint for subscribing to pushed tweets.
     search: Search local or all tweets.
 
 """
 
 from collections import OrderedDict
-from contextlib import contextmanager
+from concurrent.futures import FIRST_COMPLETED
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import wait
 from functools import wraps
+from itertools import chain
+import gzip
 import json
+import time
 
 from flask import Flask
 from flask import request
-import pg8000
+from flask import Response
 import requests
 
+from seventweets import batching
+from seventweets import peers
+from seventweets import push
+from seventweets import serialization
+from seventweets import wire
+from seventweets.cache import get_cache
 from seventweets.config import Config
+from seventweets.db import get_db_cursor
+from seventweets.db import get_pool
+from seventweets.db import InvalidInput
+from seventweets.db import PoolTimeout
+from seventweets.db import QueryTimeout
+from seventweets.gossip import get_gossip
 from seventweets.registry import Registry
+from seventweets.search import ORDERS
+from seventweets.search import SearchCache
+from seventweets.search import TopK
 from seventweets.storage import Storage
 
 
 HEADERS = {'Content-Type': 'application/json; charset=utf=8'}
+DEADLINE_HEADER = 'X-Deadline-Ms'
 PROTECTED_ENDPOINTS = {'get_tweets': False,
+                       'get_timeline': False,
+                       'get_changes': False,
                        'get_tweet': False,
                        'save_tweet': True,
+                       'save_tweets': True,
+                       'save_retweet': True,
                        'delete_tweet': True,
                        'register_node': False,
                        'delete_node': False,
+                       'save_subscription': False,
+                       'delete_subscription': False,
+                       'receive_tweets': False,
                        'search': False,
                        'join_network': True,
                        'get_known_nodes': True,
+                       'get_pool_stats': True,
+                       'get_cache_stats': True,
+                       'get_peer_stats': True,
+                       'gossip_ping': False,
+                       'gossip_ping_req': False,
                        }
 
 app = Flask(__name__)
 
+# Stands for an unparsable line of an NDJSON request body.
+_INVALID_JSON = object()
 
-#  TODO:  Privatize the name.
-@contextmanager
-def get_db_cursor():
-    # Context manager which returns a database connection, and closes it
-    # after processing is done.
-
-    _connection = pg8000.connect(**Config.DB_CONFIG)
-    cursor = _connection.cursor()
+# Shared by all requests of the worker for concurrent calls to peers.
+_peer_executor = ThreadPoolExecutor(max_workers=Config.PEER_WORKERS)
 
-    yield cursor
-
-    cursor.close()
-    _connection.commit()
-    _connection.close()
+# Results of peers in global searches.
+_search_cache = SearchCache(Config.SEARCH_CACHE_SIZE, Config.SEARCH_CACHE_TTL,
+                            Config.SEARCH_CACHE_STALE)
 
 
 def auth(f):
@@ -94,20 +139,148 @@ def auth(f):
 @app.route('/tweets')
 @auth
 def get_tweets():
-    """Return all tweets by this node.
+    """Return all tweets by this node, or a page of them.
 
-    This endpoint is not protected by authentication.
+    This endpoint is not protected by authentication.  The accepted query
+    string parameters are:
+
+    *  ``limit`` -- Maximum number of tweets to return;
+    *  ``before_id`` -- Only return tweets with a lower ID;
+    *  ``after_id`` -- Only return tweets with a higher ID;
+    *  ``stream`` -- If set, stream all tweets instead of building the whole
+       response in memory.
+
+    If any of the paging parameters is given, one page of at most ``limit``
+    (default ``Config.PAGE_SIZE``, capped at ``Config.MAX_PAGE_SIZE``) tweets
+    is returned.  Pages are newest first, except with ``after_id``, when they
+    are oldest first.  See :meth:`Storage.get_tweets`.
+
+    Responses carry an ETag, and a request with a matching ``If-None-Match``
+    header is answered with 304 and no body.
 
     Returns:
         (str, int, dict): JSON array of tweet objects
             (``"[{"id": <int>, "name": <str>, "tweet": <str>}, ...]"``),
-            HTTP status code (200 on success) , headers.
+            HTTP status code (200 on success, 304 if the client's copy is
+            current, 400 on invalid parameters), headers.
 
     """
-    with get_db_cursor() as cursor:
-        tweets = Storage.get_all_tweets(cursor)
+    try:
+        limit = _int_arg('limit')
+        before_id = _int_arg('before_id')
+        after_id = _int_arg('after_id')
+    except ValueError:
+        return '{}', 400, HEADERS
+
+    headers, not_modified = _conditional(listing=True)
+    if not_modified:
+        return '', 304, headers
+
+    if limit is not None or before_id is not None or after_id is not None:
+        if limit is None:
+            limit = Config.PAGE_SIZE
+        limit = max(0, min(limit, Config.MAX_PAGE_SIZE))
+
+        with get_db_cursor() as cursor:
+            tweets = Storage.get_tweets(cursor, limit, before_id, after_id)
+    elif request.args.get('stream') in ['1', 'true', 'yes']:
+        return _stream(lambda cursor: Storage.iter_tweets(
+            cursor, Config.STREAM_BATCH_SIZE), headers)
+    else:
+        with get_db_cursor() as cursor:
+            tweets = Storage.get_all_tweets(cursor)
+
+    return _list_response(tweets, 200, headers)
+
+
+def _conditional(listing=False):
+    # Support for conditional requests of tweets.  All representations of
+    # tweets are tagged with the storage version, which changes whenever a
+    # tweet is saved or deleted.  Returns the response headers with the ETag,
+    # and whether the client's copy is still current, in which case it can be
+    # answered with 304 without touching the database.  The version is read
+    # before the tweets, so a concurrent change can only make the tag older
+    # than the content, never newer.  Lists (listing set) may be sent in
+    # the columnar encoding, single tweets never are.
+
+    version = Storage.version()
+    if listing and _columns():
+        # Representations in different encodings need different tags.
+        version += '-columns'
+    headers = dict(HEADERS)
+    headers['ETag'] = '"{}"'.format(version)
+    headers['Cache-Control'] = 'no-cache'
+
+    return headers, request.if_none_match.contains_weak(version)
+
+
+def _columns():
+    # If the client asked for lists in the columnar encoding.
+    return wire.accepts(request.headers.get('Accept'))
+
+
+def _list_response(objects, status, headers):
+    # Response with a list of objects in the encoding the client asked for.
+    # The list is either a JSON string (as cached by Storage) or a list.
+
+    headers = dict(headers, Vary='Accept')
+
+    if _columns():
+        if isinstance(objects, str):
+            objects = json.loads(objects)
+        headers['Content-Type'] = wire.COLUMNS
+        return wire.dumps(objects), status, headers
+
+    if not isinstance(objects, str):
+        objects = serialization.dumps(objects)
+    return objects, status, headers
+
+
+def _int_arg(name):
+    # Return the integer value of a query string parameter, or None if it's
+    # not set.  Raises ValueError if it's not an integer.
+
+    value = request.args.get(name)
+    if value is None or value == '':
+        return None
+    return int(value)
+
+
+def _parse_cursor(value):
+    # Return a change feed cursor ("<xid>-<seq>") as a tuple of integers.
+    # Raises ValueError if it's not a cursor.
+
+    since = tuple(int(part) for part in value.split('-'))
+    if len(since) != 2:
+        raise ValueError
+    return since
 
-    return tweets, 200, HEADERS
+
+def _stream(iterate, headers):
+    # Response streaming the JSON array of the objects (JSON strings)
+    # iterate(cursor) generates.  The query is started before the response,
+    # so that its errors (like invalid parameters) still get an error status,
+    # not a 200 with a truncated body.  The database connection is held until
+    # the response is fully sent.
+
+    pieces = _stream_pieces(iterate)
+    first = next(pieces)
+
+    response = Response(chain([first], pieces), 200, headers)
+    response.call_on_close(pieces.close)
+    return response
+
+
+def _stream_pieces(iterate):
+    # Generate the JSON array of the objects iterate(cursor) generates.
+
+    with get_db_cursor() as cursor:
+        objects = iterate(cursor)
+        first = next(objects, None)
+        yield '[' if first is None else '[' + first
+        for o in objects:
+            yield ',' + o
+        yield ']'
 
 
 @app.route('/tweets/<int:id>')
@@ -123,18 +296,100 @@ def get_tweet(id):
     Returns:
         (str, int, dict): JSON object of the tweet (``"{"id": <int>,
             "name": <str>, "tweet": <str>}"``), HTTP status code (200 on
-            success, 404 if no result) , headers.
+            success, 304 if the client's copy is current, 404 if no result),
+            headers.
 
     """
+    headers, not_modified = _conditional()
+    if not_modified:
+        return '', 304, headers
+
     with get_db_cursor() as cursor:
         tweet = Storage.get_tweet(cursor, id)
 
     if tweet:
-        return tweet, 200, HEADERS
+        return tweet, 200, headers
     else:
         return '{}', 404, HEADERS
 
 
+@app.route('/timeline')
+@auth
+def get_timeline():
+    """Return a page of the home timeline.
+
+    The home timeline holds tweets of this node and all known nodes, newest
+    first (see :mod:`seventweets.timeline`).  This endpoint is not protected
+    by authentication.  The accepted query string parameters are:
+
+    *  ``limit`` -- Maximum number of tweets to return (default
+       ``Config.PAGE_SIZE``, capped at ``Config.MAX_PAGE_SIZE``);
+    *  ``before`` -- Only return tweets before this position (the ``seq`` of
+       the last tweet of the previous page).
+
+    Returns:
+        (str, int, dict): JSON array of tweet objects (``"[{"seq": <int>,
+            "id": <int>, "name": <str>, "tweet": <str>}, ...]"``), HTTP status
+            code (200 on success, 400 on invalid parameters), headers.
+
+    """
+    try:
+        limit = _int_arg('limit')
+        before = _int_arg('before')
+    except ValueError:
+        return '{}', 400, HEADERS
+
+    if limit is None:
+        limit = Config.PAGE_SIZE
+    limit = max(0, min(limit, Config.MAX_PAGE_SIZE))
+
+    with get_db_cursor() as cursor:
+        tweets = Storage.get_timeline(cursor, limit, before)
+
+    return _list_response(tweets, 200, HEADERS)
+
+
+@app.route('/changes')
+@auth
+def get_changes():
+    """Return changes of tweets since a cursor.
+
+    Used by other nodes to sync tweets incrementally, deletions included.
+    This endpoint is not protected by authentication.  The accepted query
+    string parameters are:
+
+    *  ``since`` -- Cursor returned with the previous batch, all changes if
+       not set;
+    *  ``limit`` -- Maximum number of changes to return (default
+       ``Config.PAGE_SIZE``, capped at ``Config.MAX_PAGE_SIZE``).
+
+    Keep asking with the returned cursor while ``more`` is true.  See
+    :meth:`Storage.get_changes`.
+
+    Returns:
+        (str, int, dict): JSON object of the changes (``"{"tweets": [{"id":
+            <int>, "name": <str>, "tweet": <str>}, ...], "deleted": [<int>,
+            ...], "cursor": <str>, "more": <bool>}"``), HTTP status code
+            (200 on success, 400 on invalid parameters), headers.
+
+    """
+    try:
+        limit = _int_arg('limit')
+        since = _parse_cursor(request.args.get('since', '0-0'))
+    except ValueError:
+        return '{}', 400, HEADERS
+
+    if limit is None:
+        limit = Config.PAGE_SIZE
+    limit = max(1, min(limit, Config.MAX_PAGE_SIZE))
+
+    with get_db_cursor() as cursor:
+        changes = Storage.get_changes(cursor, since, limit)
+
+    changes['cursor'] = '{}-{}'.format(*changes['cursor'])
+    return serialization.dumps(changes), 200, HEADERS
+
+
 @app.route('/tweets', methods=['POST'])
 @auth
 def save_tweet():
@@ -146,16 +401,193 @@ def save_tweet():
     Request body format is a JSON object with the tweet as value of string
     ``"tweet"``, e.g.: ``{"tweet": "Hot takes! Get your hot takes!"}``.
 
+    With ``Config.WRITE_BATCH`` the tweet is saved together with tweets of
+    concurrent requests, in one transaction (see
+    :mod:`seventweets.batching`).
+
     Returns:
         (str, int, dict): JSON object of the tweet (``"{"id": <int>,
-            "name": <str>, "tweet": <str>}"``), HTTP status code 201, headers.
+            "name": <str>, "tweet": <str>}"``), HTTP status code (201 on
+            success, 400 on invalid request body), headers.
+
+    """
+    try:
+        tweet = json.loads(request.get_data(as_text=True))
+    except ValueError:
+        tweet = _INVALID_JSON
+
+    # Checked before the tweet joins a batch, so that it can't fail the
+    # tweets of other requests.
+    if _validate_tweet(tweet):
+        return '{}', 400, HEADERS
+
+    if Config.WRITE_BATCH:
+        result = serialization.dumps(
+            batching.get_batcher().save_tweet(tweet['tweet']))
+    else:
+        with get_db_cursor() as cursor:
+            result = Storage.save_tweet(cursor, tweet['tweet'])
+
+    return result, 201, HEADERS
+
+
+@app.route('/tweets/batch', methods=['POST'])
+@auth
+def save_tweets():
+    """Save a batch of tweets in POST request body to this node.
+
+    Used to import many tweets at once, they are all saved by a single
+    statement in one transaction.  This endpoint is authenticated.
+
+    The request body is either a JSON array of tweet objects in the same
+    format as for ``POST /tweets``, or, with content type
+    ``application/x-ndjson``, one such object per line.  Invalid items are
+    reported and skipped, they don't prevent saving the rest of the batch.
+    If the database rejects an item anyway, the items are saved one by one,
+    each in its own transaction, to report the rejected ones.
+    At most ``Config.MAX_BATCH_SIZE`` items are accepted.
+
+    Returns:
+        (str, int, dict): JSON object with the saved tweets and the errors,
+            each with the index of its item in the batch (``{"saved":
+            [{"index": <int>, "id": <int>, "name": <str>, "tweet": <str>},
+            ...], "errors": [{"index": <int>, "error": <str>}, ...]}``),
+            HTTP status code (201 if anything was saved, 400 if the body is
+            invalid or no item could be saved, 413 if the batch is too big),
+            headers.
+
+    """
+    body = request.get_data(as_text=True)
+
+    if request.mimetype == 'application/x-ndjson':
+        items = []
+        for line in body.splitlines():
+            if line.strip():
+                try:
+                    items.append(json.loads(line))
+                except ValueError:
+                    items.append(_INVALID_JSON)
+    else:
+        try:
+            items = json.loads(body)
+        except ValueError:
+            return '{}', 400, HEADERS
+        if not isinstance(items, list):
+            return '{}', 400, HEADERS
+
+    if len(items) > Config.MAX_BATCH_SIZE:
+        return '{}', 413, HEADERS
+
+    indexes = []
+    tweets = []
+    errors = []
+    for index, item in enumerate(items):
+        error = _validate_tweet(item)
+        if error:
+            errors.append(OrderedDict([('index', index), ('error', error)]))
+        else:
+            indexes.append(index)
+            tweets.append(item['tweet'])
+
+    saved = []
+    try:
+        if tweets:
+            with get_db_cursor() as cursor:
+                result = Storage.save_tweets(cursor, tweets)
+            saved = [dict(tweet, index=index)
+                     for index, tweet in zip(indexes, result)]
+    except InvalidInput:
+        # The database rejected an item, find out which one.
+        for index, tweet in zip(indexes, tweets):
+            try:
+                with get_db_cursor() as cursor:
+                    result = Storage.save_tweets(cursor, [tweet])
+            except InvalidInput as e:
+                errors.append(OrderedDict([('index', index),
+                                           ('error', str(e))]))
+            else:
+                saved.append(dict(result[0], index=index))
+        errors.sort(key=lambda error: error['index'])
+
+    status = 201 if saved or not errors else 400
+
+    return (serialization.dumps({'saved': saved, 'errors': errors}), status,
+            HEADERS)
+
+
+def _validate_tweet(item):
+    # Check a tweet object from a request body, return a description of the
+    # problem, or None if it's valid.
+
+    if item is _INVALID_JSON:
+        return 'Invalid JSON'
+    if not isinstance(item, dict):
+        return 'Not a JSON object'
+    if not isinstance(item.get('tweet'), str):
+        return 'Missing or invalid "tweet"'
+    if '\x00' in item['tweet']:
+        # PostgreSQL text can't hold it.
+        return 'Tweet contains a NUL character'
+    if len(item['tweet']) > Config.MAX_TWEET_LENGTH:
+        return 'Tweet longer than {} characters'.format(
+            Config.MAX_TWEET_LENGTH)
+    return None
+
+
+@app.route('/retweets', methods=['POST'])
+@auth
+def save_retweet():
+    """Retweet a tweet of another node.
+
+    Used by this node's frontend.  The retweet refers to the original tweet
+    instead of copying it.  The content of the original is fetched from its
+    node the first time it's retweeted and cached, retweeting a tweet again
+    returns the existing retweet.  This endpoint is authenticated.
+
+    Request body format is a JSON object with the name of the node of the
+    original tweet and its ID, e.g.: ``{"name": "nzp", "id": 7}``.
+
+    Returns:
+        (str, int, dict): JSON object of the retweet (``"{"id": <int>,
+            "name": <str>, "tweet": <str>}"``), HTTP status code (201 on
+            success, 400 on invalid request body, 404 if the node or tweet
+            is not known, 409 if the retweet was deleted meanwhile, 502 if
+            the node couldn't be reached), headers.
 
     """
-    tweet = json.loads(request.get_data(as_text=True))
+    try:
+        origin = json.loads(request.get_data(as_text=True))
+        name, id = origin['name'], origin['id']
+        if not isinstance(id, int) or name == Config.NAME:
+            raise ValueError
+    except (ValueError, TypeError, KeyError):
+        return '{}', 400, HEADERS
 
     with get_db_cursor() as cursor:
-        result = Storage.save_tweet(cursor, tweet['tweet'])
+        content = Storage.get_origin(cursor, name, id)
+
+    cached = content is not None
+    if not cached:
+        node = next((n for n in Registry.nodes() if n.name == name), None)
+        if node is None:
+            return '{}', 404, HEADERS
+
+        try:
+            r = peers.get_client().get(node.address, '/tweets/{}'.format(id))
+            content = r.json()['tweet']
+        except requests.HTTPError as e:
+            status = 404 if e.response.status_code == 404 else 502
+            return '{}', status, HEADERS
+        except (requests.RequestException, ValueError, KeyError):
+            return '{}', 502, HEADERS
 
+    with get_db_cursor() as cursor:
+        if not cached:
+            Storage.save_origin(cursor, name, id, content)
+        result = Storage.save_retweet(cursor, name, id, content)
+
+    if result is None:
+        return '{}', 409, HEADERS
     return result, 201, HEADERS
 
 
@@ -203,7 +635,11 @@ def register_node():
 
     Registry.register(node)
 
-    return Registry.known_nodes, 200, HEADERS
+    gossip = get_gossip()
+    if gossip is not None:
+        gossip.add_member(node['name'], node['address'])
+
+    return _list_response(Registry.known_nodes, 200, HEADERS)
 
 
 @app.route('/registry/<string:name>', methods=['DELETE'])
@@ -224,9 +660,174 @@ def delete_node(name):
     """
     Registry.delete_node(name)
 
+    if Config.PUSH:
+        with get_db_cursor() as cursor:
+            push.unsubscribe(cursor, name)
+
+    gossip = get_gossip()
+    if gossip is not None:
+        # Spread the news, so that others don't have to detect the failure.
+        gossip.remove_member(name)
+
+    return '{}', 204, HEADERS
+
+
+@app.route('/subscriptions', methods=['POST'])
+@auth
+def save_subscription():
+    """Subscribe the node in POST request body to new tweets.
+
+    Used by other nodes to have new tweets of this node pushed to their
+    ``POST /inbox`` (see :mod:`seventweets.push`).  Request body is a JSON
+    object with the name of the node, its address, and optionally the cursor
+    of the last change of this node it has: ``{"name": <str>, "address":
+    <str>, "since": <str>}``.  This endpoint is not authenticated.
+
+    Returns:
+        (str, int, dict): JSON object with the cursor of the last change
+            that is not going to be pushed (``{"cursor": <str>}``), HTTP
+            status code (201 on success, 400 on invalid request body, 404 if
+            push is disabled), headers.
+
+    """
+    if not Config.PUSH:
+        return '{}', 404, HEADERS
+
+    try:
+        node = json.loads(request.get_data(as_text=True))
+        name, address = node['name'], node['address']
+        since = node.get('since')
+        if since is not None:
+            since = _parse_cursor(since)
+    except (ValueError, TypeError, KeyError, AttributeError):
+        return '{}', 400, HEADERS
+
+    with get_db_cursor() as cursor:
+        start = push.subscribe(cursor, name, address, since)
+
+    return json.dumps({'cursor': '{}-{}'.format(*start)}), 201, HEADERS
+
+
+@app.route('/subscriptions/<string:name>', methods=['DELETE'])
+@auth
+def delete_subscription(name):
+    """Cancel the push subscription of a node.
+
+    This endpoint is not authenticated.
+
+    Args:
+        name (str): Name of the subscribed node.
+
+    Returns:
+        (str, int, dict): Empty JSON object, HTTP status code (204 on
+            success, 404 if the node isn't subscribed or push is disabled),
+            headers.
+
+    """
+    if not Config.PUSH:
+        return '{}', 404, HEADERS
+
+    with get_db_cursor() as cursor:
+        result = push.unsubscribe(cursor, name)
+
+    return '{}', 204 if result else 404, HEADERS
+
+
+@app.route('/inbox', methods=['POST'])
+@auth
+def receive_tweets():
+    """Add tweets pushed by another node to the home timeline.
+
+    Used by nodes this node subscribed to (see :mod:`seventweets.push`).
+    Request body is a JSON object with the name of the sending node, the
+    cursors of its change feed the pushed tweets are between, and the
+    tweets: ``{"name": <str>, "since": <str>, "cursor": <str>, "tweets":
+    [{"id": <int>, "name": <str>, "tweet": <str>}, ...]}``.  If the timeline
+    has the node's tweets up to ``since``, it moves on to ``cursor``,
+    otherwise the tweets are just added early and pulling catches up.  Only
+    tweets of known nodes are accepted.  This endpoint is not authenticated.
+
+    Returns:
+        (str, int, dict): Empty JSON object, HTTP status code (204 on
+            success, 400 on invalid request body, 403 if the node is not
+            known, 404 if the home timeline is disabled), headers.
+
+    """
+    if not Config.TIMELINE:
+        return '{}', 404, HEADERS
+
+    try:
+        body = json.loads(request.get_data(as_text=True))
+        name, tweets = body['name'], body['tweets']
+        since = _parse_cursor(body['since'])
+        until = _parse_cursor(body['cursor'])
+        if not all(isinstance(t['id'], int) and isinstance(t['tweet'], str)
+                   for t in tweets):
+            raise ValueError
+    except (ValueError, TypeError, KeyError, AttributeError):
+        return '{}', 400, HEADERS
+
+    if name not in {node.name for node in Registry.nodes()}:
+        return '{}', 403, HEADERS
+
+    with get_db_cursor() as cursor:
+        if not Storage.save_timeline(cursor, name, tweets, since, until):
+            Storage.save_timeline(cursor, name, tweets)
+
     return '{}', 204, HEADERS
 
 
+@app.route('/gossip/ping', methods=['POST'])
+@auth
+def gossip_ping():
+    """Answer a probe of the membership protocol.
+
+    Used by other nodes running the protocol (see :mod:`seventweets.gossip`)
+    to check we are alive and exchange membership updates.  It is not
+    authenticated.
+
+    Returns:
+        (str, int, dict): JSON object of the acknowledgement, HTTP status code
+            (200 on success, 404 if the protocol isn't running), headers.
+
+    """
+    gossip = get_gossip()
+    if gossip is None:
+        return '{}', 404, HEADERS
+
+    message = json.loads(request.get_data(as_text=True))
+
+    return json.dumps(gossip.handle_ping(message)), 200, HEADERS
+
+
+@app.route('/gossip/ping_req', methods=['POST'])
+@auth
+def gossip_ping_req():
+    """Probe another node on behalf of the requesting node.
+
+    Used by other nodes running the protocol when the node in ``"target"`` of
+    the request didn't answer their own probe.  It is not authenticated.
+
+    Returns:
+        (str, int, dict): JSON object of the acknowledgement, HTTP status code
+            (200 if the target answered, 404 if the protocol isn't running,
+            504 if the target didn't answer), headers.
+
+    """
+    gossip = get_gossip()
+    if gossip is None:
+        return '{}', 404, HEADERS
+
+    message = json.loads(request.get_data(as_text=True))
+
+    try:
+        ack = gossip.handle_ping_req(message)
+    except Exception:
+        return '{}', 504, HEADERS
+
+    return json.dumps(ack), 200, HEADERS
+
+
 @app.route('/search')
 @auth
 def search():
@@ -236,54 +837,273 @@ def search():
     a global search of the whole network.  It is not authenticated.  The
     accepted query string parameters are:
 
-    *  ``content`` -- String to search for;
+    *  ``content`` -- Words to search for;
     *  ``created_from`` -- Earliest date of tweet;
     *  ``created_to`` -- Last date of tweet;
-    *  ``all`` -- If set, do a global search.
+    *  ``order`` -- ``newest`` or ``relevance`` (only with ``content``, and
+       the default then);
+    *  ``limit`` -- Maximum number of tweets to return;
+    *  ``all`` -- If set, do a global search;
+    *  ``status`` -- If set together with ``all``, also report the status of
+       each peer.
+
+    Tweets are matched and ranked with full text search, see
+    :meth:`Storage.search`.  In a global search all known peers are searched
+    concurrently for their best ``limit`` (default ``Config.PAGE_SIZE``,
+    capped at ``Config.MAX_PAGE_SIZE``) tweets, and the best ``limit`` of all
+    are returned (see :class:`seventweets.search.TopK`).  Each peer gets
+    ``Config.SEARCH_PEER_TIMEOUT`` seconds to answer and the whole search
+    takes at most ``Config.SEARCH_DEADLINE`` seconds.  Tweets of peers that
+    failed or didn't answer in time are left out of the result.
+
+    Peers are told how long we are going to wait for them in the
+    ``X-Deadline-Ms`` header, and stop searching when that runs out.  With
+    ``Config.SEARCH_HEDGE_DELAY`` set, a peer that hasn't answered by then is
+    sent a second request, and the first answer is used.  Peers that failed
+    too many times in a row are skipped for a while (see
+    :class:`seventweets.registry.CircuitBreaker`).
+
+    Results of each peer are cached for ``Config.SEARCH_CACHE_TTL`` seconds.
+    For ``Config.SEARCH_CACHE_STALE`` more seconds they are still used, but
+    refreshed in the background.
+
+    A local search without ``limit`` (and without a deadline) is streamed
+    from the database ``Config.STREAM_BATCH_SIZE`` tweets at a time, so that
+    a broad search doesn't load all matching tweets into memory.
 
     Returns:
-        (str, int, dict): JSON array of tweet objects (``[{"id": <int>, "name":
-            <str>, "tweet": <str>}, ...]``), HTTP status code 200, headers.
+        (str, int, dict): JSON array of tweet objects, best first (``[{"id":
+            <int>, "name": <str>, "tweet": <str>, "created": <str>}, ...]``,
+            with ``"rank": <float>`` if searching for content), HTTP status
+            code (200 on success, 400 on invalid parameters, 504 if the
+            caller's deadline passed), headers.  With ``status`` set the array
+            is wrapped in a JSON object along with the peer statuses:
+            ``{"tweets": [...], "nodes": [{"name": <str>, "address": <str>,
+            "status": "ok" | "error" | "timeout" | "skipped", ...}, ...]}``.
+            Cached results of a peer are marked with ``"cached": "fresh" |
+            "stale"``.
 
     """
-    # TODO: Some validation.  Or switch to having an ORM.
+    start = time.monotonic()
 
-    # pg8000 chokes on '%', one solution is escaping: '%%'.
-    if request.args.get('content'):
-        content = '%%' + request.args.get('content') + '%%'
-    else:
-        content = '%%'
+    try:
+        params = _search_params(request.args)
+        budget = _budget(request.headers)
+    except ValueError:
+        return '{}', 400, HEADERS
 
-    if request.args.get('created_from'):
-        created_from = request.args.get('created_from')
-    else:
-        created_from = '-infinity'
+    if budget is not None and budget <= 0:
+        return '{}', 504, HEADERS
+
+    global_search = request.args.get('all') in ['1', 'true', 'yes']
+    if (not global_search and params['limit'] is None and budget is None and
+            not _columns()):
+        return _stream(lambda cursor: Storage.iter_search(
+            cursor, Config.STREAM_BATCH_SIZE, **params), HEADERS)
 
-    if request.args.get('created_to'):
-        created_to = request.args.get('created_to')
+    with get_db_cursor(timeout=budget) as cursor:
+        result = Storage.search(cursor, **params)
+
+    if global_search:
+        top = TopK(params['limit'], params['order'])
+        top.add(result)
+
+        deadline = start + min(Config.SEARCH_DEADLINE,
+                               budget if budget is not None else float('inf'))
+        nodes = _search_peers(Registry.nodes(), _peer_params(params), top,
+                              deadline)
+        result = top.result()
+
+        if request.args.get('status') in ['1', 'true', 'yes']:
+            return (serialization.dumps({'tweets': result, 'nodes': nodes}),
+                    200, HEADERS)
+
+    return _list_response(result, 200, HEADERS)
+
+
+def _search_params(args):
+    # Keyword arguments of Storage.search from query string parameters.
+    # Raises ValueError on invalid parameters.  A global search is always
+    # limited, so that its result is bounded regardless of network size.
+
+    limit = args.get('limit')
+    limit = int(limit) if limit else None
+    if args.get('all') in ['1', 'true', 'yes']:
+        if limit is None:
+            limit = Config.PAGE_SIZE
+        limit = max(0, min(limit, Config.MAX_PAGE_SIZE))
+
+    content = args.get('content')
+    order = args.get('order') or ('relevance' if content else 'newest')
+    if order not in ORDERS:
+        raise ValueError('Invalid order: {}'.format(order))
+
+    return dict(content=content, created_from=args.get('created_from'),
+                created_to=args.get('created_to'), limit=limit, order=order)
+
+
+def _peer_params(params):
+    # Query string of the local searches peers do for a global search.  Only
+    # unset parameters are left out, limit=0 still limits.
+
+    return {k: str(v) for k, v in params.items() if v is not None}
+
+
+def _budget(headers):
+    # Seconds the caller is going to wait for the response, from the deadline
+    # header, or None.  Raises ValueError if the header is invalid.
+
+    value = headers.get(DEADLINE_HEADER)
+    if not value:
+        return None
+    return int(value) / 1000
+
+
+def _search_peer(node, params, top, deadline):
+    # Run a local search on a single peer and merge its tweets into top,
+    # return the number of tweets and the time it took.  The peer is told of
+    # the deadline (time.monotonic() based).  Runs in a thread of
+    # _peer_executor.
+
+    start = time.monotonic()
+    remaining = max(deadline - start, 0.001)
+
+    r = peers.get_client().get(
+        node.address, '/search', params=params,
+        headers={DEADLINE_HEADER: str(int(remaining * 1000))},
+        timeout=min(Config.SEARCH_PEER_TIMEOUT, remaining), retry=False)
+    tweets = wire.decode(r)
+    _search_cache.set(node.address, params, tweets)
+    top.add(tweets, source=node.name)
+
+    return len(tweets), time.monotonic() - start
+
+
+def _search_peers(nodes, params, top, deadline):
+    # Search all the nodes concurrently, merging results into top as they
+    # arrive, and wait for them until deadline.  Returns a list with the
+    # status of each node.  Slow or failed nodes don't fail the search, their
+    # results are just missing.  Nodes whose circuit breaker is open are
+    # skipped, and nodes still searching after Config.SEARCH_HEDGE_DELAY get
+    # a second request.  Nodes with cached results aren't asked at all,
+    # unless the results are stale, then they are refreshed in the
+    # background.
+
+    def submit(node):
+        return _peer_executor.submit(_search_peer, node, params, top, deadline)
+
+    cached = _cached_results(nodes, params, top)
+    for node in nodes:
+        if cached.get(node.name, {}).get('cached') == 'stale':
+            if _search_cache.claim(node.address, params):
+                if Registry.breaker(node.name).allow():
+                    _peer_executor.submit(_refresh_peer, node, params)
+                else:
+                    _search_cache.release(node.address, params)
+
+    attempts = OrderedDict((node.name, [submit(node)]) for node in nodes
+                           if node.name not in cached and
+                           Registry.breaker(node.name).allow())
+    hedge_at = (time.monotonic() + Config.SEARCH_HEDGE_DELAY
+                if Config.SEARCH_HEDGE_DELAY else None)
+
+    while True:
+        pending = [f for tries in attempts.values() if not _resolved(tries)
+                   for f in tries if not f.done()]
+        now = time.monotonic()
+        if not pending or now >= deadline:
+            break
+
+        if hedge_at is not None and now >= hedge_at:
+            for node in nodes:
+                tries = attempts.get(node.name)
+                if tries and not _resolved(tries):
+                    tries.append(submit(node))
+            hedge_at = None
+            continue
+
+        until = deadline if hedge_at is None else min(deadline, hedge_at)
+        wait(pending, timeout=until - now, return_when=FIRST_COMPLETED)
+
+    return [cached.get(node.name) or
+            _peer_status(node, attempts.get(node.name)) for node in nodes]
+
+
+def _cached_results(nodes, params, top):
+    # Merge cached results of nodes into top, return their statuses by node
+    # name.
+
+    statuses = {}
+    for node in nodes:
+        entry = _search_cache.get(node.address, params)
+        if entry is not None:
+            tweets, fresh = entry
+            top.add(tweets, source=node.name)
+            statuses[node.name] = OrderedDict([
+                ('name', node.name), ('address', node.address),
+                ('status', 'ok'), ('tweets', len(tweets)),
+                ('cached', 'fresh' if fresh else 'stale')])
+
+    return statuses
+
+
+def _refresh_peer(node, params):
+    # Refresh stale cached results of a node, claimed in _search_cache.  Runs
+    # in a thread of _peer_executor.
+
+    deadline = time.monotonic() + Config.SEARCH_PEER_TIMEOUT
+    try:
+        _search_peer(node, params, TopK(0, 'newest'), deadline)
+    except Exception:
+        Registry.breaker(node.name).failure()
     else:
-        created_to = 'infinity'
+        Registry.breaker(node.name).success()
+    finally:
+        _search_cache.release(node.address, params)
 
-    query = """
-    SELECT id, node_name, content FROM tweet
-    WHERE content ILIKE '{content}' AND
-    (pub_datetime > '{frm}' AND pub_datetime < '{to}');
-    """.format(content=content, frm=created_from, to=created_to)
 
-    with get_db_cursor() as cursor:
-        result = Storage.search(cursor, query)
+def _resolved(tries):
+    # If a node's search is over: an attempt succeeded, or all failed.
+    # Works with futures and asyncio tasks alike.
+
+    return (any(t.done() and t.exception() is None for t in tries) or
+            all(t.done() for t in tries))
+
+
+def _peer_status(node, tries):
+    # Status of a node in a global search from its attempts (futures or
+    # asyncio tasks, None if skipped), recorded in its circuit breaker.
+    # Attempts still running are cancelled.
+
+    status = OrderedDict([('name', node.name), ('address', node.address)])
+
+    if tries is None:
+        status['status'] = 'skipped'
+        return status
+
+    succeeded = [t for t in tries if t.done() and t.exception() is None]
+    if succeeded:
+        count, elapsed = succeeded[0].result()
+        status['status'] = 'ok'
+        status['tweets'] = count
+        status['elapsed'] = round(elapsed, 3)
+        Registry.breaker(node.name).success()
+    elif all(t.done() for t in tries):
+        status['status'] = 'error'
+        status['error'] = str(tries[-1].exception())
+        Registry.breaker(node.name).failure()
+    else:
+        status['status'] = 'timeout'
+        Registry.breaker(node.name).failure()
 
-    if request.args.get('all') in ['1', 'true', 'yes']:
-        for node in Registry._known_nodes:
-            url = ('http://{}/search?'.format(node.address) +
-                   'content={}'.format(request.args.get('content')) +
-                   '&created_from={}'.format(request.args.get('created_from')) +
-                   '&created_to={}'.format(request.args.get('created_to')))
+    for t in tries:
+        if not t.done():
+            t.cancel()
 
-            r = request.get(url)
-            result.extend(json.loads(r))
+    if len(tries) > 1:
+        status['hedged'] = True
 
-    return json.dumps(result), 200, HEADERS
+    return status
 
 
 @app.route('/join_network', methods=['POST'])
@@ -295,11 +1115,15 @@ def join_network():
     is authenticated.  The request body contains the name and address of the
     initial node we should register to, as a JSON object of format:
     ``{"name": <str>, "address": <str>}``.  After the initial node returns its
-    list of known nodes, we register to each of those.
+    list of known nodes, we register to all of those concurrently.  Requests
+    time out and are retried as configured for :mod:`seventweets.peers`.
 
     Returns:
-        (str, int, dict): Response body (API does not specify any), HTTP status
-            code 200, headers.
+        (str, int, dict): JSON object with the outcome of registering to each
+            node (``{"nodes": [{"name": <str>, "address": <str>, "status":
+            "ok" | "error", ...}, ...]}``), the initial node first, HTTP status
+            code (200 on success, 502 if the initial node couldn't be
+            reached), headers.
 
     """
     init_node = json.loads(request.get_data(as_text=True))
@@ -313,30 +1137,138 @@ def join_network():
     # In case others not returning self in list of known nodes.
     Registry.register(init_node)
 
-    all_nodes_json = requests.post(
-        'http://{address}/registry'.format(address=init_node['address']),
-        data=body)
+    try:
+        all_nodes = wire.decode(_register_to(init_node, body))
+    except (requests.RequestException, ValueError) as e:
+        summary = [_join_status(init_node, e)]
+        return json.dumps({'nodes': summary}), 502, HEADERS
 
-    all_nodes = json.loads(all_nodes_json)
+    summary = [_join_status(init_node)]
 
-    for node in all_nodes:
-        # TODO: Remove initial node if present.
+    others = [node for node in all_nodes
+             if node['name'] not in (init_node['name'], Config.NAME)]
+    for node in others:
         Registry.register(node)
 
-        r = requests.post(
-            'http://{address}/registry'.format(address=node['address']),
-            data=body)
+    futures = [_peer_executor.submit(_register_to, node, body)
+               for node in others]
+    wait(futures)
+
+    for node, future in zip(others, futures):
+        summary.append(_join_status(node, future.exception()))
+
+    return json.dumps({'nodes': summary}), 200, HEADERS
+
 
-    return "Joined network", 200, HEADERS
+def _register_to(node, body):
+    # Announce ourselves to a node, return its response.
+
+    return peers.get_client().post(node['address'], '/registry', data=body)
+
+
+def _join_status(node, error=None):
+    # Summary entry of registering to a node.
+
+    status = OrderedDict([('name', node['name']), ('address', node['address'])])
+    if error is None:
+        status['status'] = 'ok'
+    else:
+        status['status'] = 'error'
+        status['error'] = str(error)
+
+    return status
 
 
 @app.route('/private/nodes')
 @auth
 def get_known_nodes():
     # Not part of API specification, used only by the frontend to get a list
-    # of known nodes for diagnostic purposes.
+    # of known nodes for diagnostic purposes, along with the state of their
+    # circuit breakers in the worker process that happens to serve the
+    # request.
+
+    return json.dumps(Registry.status()), 200, HEADERS
+
+
+@app.route('/private/pool')
+@auth
+def get_pool_stats():
+    # Not part of API specification, used for monitoring the database
+    # connection pool of the worker process that happens to serve the request.
+
+    return json.dumps(get_pool().stats()), 200, HEADERS
+
+
+@app.route('/private/cache')
+@auth
+def get_cache_stats():
+    # Not part of API specification, used for monitoring the tweet cache, and
+    # the search cache of the worker process that happens to serve the
+    # request.
+
+    stats = get_cache().stats()
+    stats['search'] = _search_cache.stats()
+
+    return json.dumps(stats), 200, HEADERS
+
+
+@app.route('/private/peers')
+@auth
+def get_peer_stats():
+    # Not part of API specification, used for monitoring requests to other
+    # nodes made by the worker process that happens to serve the request.
+
+    return json.dumps(peers.metrics.snapshot()), 200, HEADERS
+
+
+@app.after_request
+def compress(response):
+    # Compress responses of at least Config.GZIP_MIN_SIZE bytes for clients
+    # accepting gzip.  Streamed responses are sent as they are.
+
+    if (not Config.GZIP_MIN_SIZE or response.is_streamed or
+            response.status_code != 200 or
+            'Content-Encoding' in response.headers or
+            'gzip' not in request.headers.get('Accept-Encoding', '')):
+        return response
+
+    data = response.get_data()
+    if len(data) < Config.GZIP_MIN_SIZE:
+        return response
+
+    response.set_data(gzip.compress(data, Config.GZIP_LEVEL))
+    response.headers['Content-Encoding'] = 'gzip'
+    response.vary.add('Accept-Encoding')
+
+    # The compressed body is not the same bytes any more.
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+
+    return response
+
+
+@app.errorhandler(PoolTimeout)
+def pool_timeout(error):
+    # All database connections of this worker are busy, tell the client to
+    # come back later instead of failing with a generic error.
+
+    return '{}', 503, HEADERS
+
+
+@app.errorhandler(InvalidInput)
+def invalid_input(error):
+    # The database couldn't use a value of the request, like a malformed
+    # date.
+
+    return '{}', 400, HEADERS
+
+
+@app.errorhandler(QueryTimeout)
+def query_timeout(error):
+    # The database query ran out of the time the caller gave us.
 
-    return Registry.known_nodes, 200, HEADERS
+    return '{}', 504, HEADERS
 
 
 if __name__ == '__main__':
@@ -0,0 +1,337 @@
+"""This module implements the HTTP client for talking to other nodes.
+
+Every request to another node goes through here, so that connections to
+peers are kept alive and reused, timeouts and retries are applied
+consistently, and all traffic is measured in one place.
+
+Attributes:
+    metrics (PeerMetrics): Metrics of requests to other nodes, shared by all
+        clients of the process.
+
+Classes:
+    PeerMetrics: Collects request metrics per peer.
+    PeerClient: Synchronous client, based on requests.
+    AsyncPeerClient: Asynchronous client, based on aiohttp.
+
+Functions:
+    get_client: Return the synchronous client of this process.
+
+"""
+
+import asyncio
+from bisect import bisect_left
+from collections import OrderedDict
+import json
+import threading
+import time
+
+import aiohttp
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from seventweets import wire
+from seventweets.config import Config
+
+
+class PeerMetrics:
+    """Thread-safe collector of request metrics per peer address.
+
+    For every peer it counts requests in flight, finished requests and
+    errors, and keeps a cumulative latency histogram.
+
+    Attributes:
+        BUCKETS (tuple): Upper bounds of latency histogram buckets, seconds.
+
+    Methods:
+        started: Record the start of a request.
+        finished: Record the end of a request.
+        snapshot: Return the current metrics.
+
+    """
+
+    BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._peers = {}
+
+    def _peer(self, address):
+        # Metrics of a peer, must be called with the lock held.
+        peer = self._peers.get(address)
+        if peer is None:
+            peer = self._peers[address] = dict(
+                in_flight=0, requests=0, errors=0, latency_sum=0.0,
+                # Last bucket counts requests slower than all bounds.
+                buckets=[0] * (len(self.BUCKETS) + 1))
+        return peer
+
+    def started(self, address):
+        """Record the start of a request to address."""
+        with self._lock:
+            self._peer(address)['in_flight'] += 1
+
+    def finished(self, address, elapsed, error=False):
+        """Record the end of a request to address.
+
+        Args:
+            address (str): Address of the peer.
+            elapsed (float): Duration of the request in seconds.
+            error (bool): If the request failed.
+
+        """
+        with self._lock:
+            peer = self._peer(address)
+            peer['in_flight'] -= 1
+            peer['requests'] += 1
+            peer['errors'] += int(error)
+            peer['latency_sum'] += elapsed
+            peer['buckets'][bisect_left(self.BUCKETS, elapsed)] += 1
+
+    def snapshot(self):
+        """Return the current metrics.
+
+        Returns:
+            dict: Metrics by peer address (``{<address>: {"in_flight": <int>,
+                "requests": <int>, "errors": <int>, "latency": {"sum":
+                <float>, "buckets": {"<bound>": <int>, ..., "+Inf": <int>}}},
+                ...}``).  Buckets are cumulative: each counts requests that
+                took at most its bound.
+
+        """
+        with self._lock:
+            snapshot = {}
+            for address, peer in self._peers.items():
+                buckets = OrderedDict()
+                count = 0
+                for bound, n in zip(self.BUCKETS + ('+Inf',), peer['buckets']):
+                    count += n
+                    buckets[str(bound)] = count
+
+                snapshot[address] = OrderedDict([
+                    ('in_flight', peer['in_flight']),
+                    ('requests', peer['requests']),
+                    ('errors', peer['errors']),
+                    ('latency', OrderedDict([
+                        ('sum', round(peer['latency_sum'], 6)),
+                        ('buckets', buckets)])),
+                ])
+            return snapshot
+
+
+metrics = PeerMetrics()
+
+
+class PeerClient:
+    """Synchronous HTTP client for requests to other nodes.
+
+    Keeps a pool of keep-alive connections for each peer address.  Requests
+    time out after ``timeout`` seconds unless told otherwise, and failed
+    connections and gateway errors are retried with exponential backoff,
+    except in requests that must finish by a deadline.
+    Lists are asked for in the compact encoding of :mod:`seventweets.wire`,
+    decode responses with :func:`seventweets.wire.decode`.  The client is
+    safe to use from many threads.
+
+    Methods:
+        request: Make a request to a peer.
+        get: Make a GET request.
+        post: Make a POST request.
+        delete: Make a DELETE request.
+
+    """
+
+    def __init__(self, pool_size=10, pools=100, timeout=3, retries=2):
+        """Initialize the client.
+
+        Args:
+            pool_size (int): Maximum number of connections kept alive per
+                peer.
+            pools (int): Maximum number of peers to keep connections to.
+            timeout (float): Default request timeout in seconds.
+            retries (int): Number of retries of failed requests.
+
+        """
+        self.timeout = timeout
+
+        # Requests to other nodes are idempotent (searching, registering,
+        # unregistering), so all methods are retried.
+        self._session = self._new_session(
+            pool_size, pools, Retry(total=retries, backoff_factor=0.1,
+                                    status_forcelist=(502, 503, 504),
+                                    allowed_methods=None))
+        # For requests with a deadline.  A retry would get a fresh timeout
+        # and tell the peer it has the whole budget again, and the deadline
+        # is better spent on hedged requests.
+        self._session_once = self._new_session(pool_size, pools, 0)
+
+    @staticmethod
+    def _new_session(pool_size, pools, retries):
+        # Session with keep-alive connection pools and the given retries.
+        session = requests.Session()
+        session.headers['Accept'] = wire.ACCEPT
+        session.mount('http://', HTTPAdapter(
+            pool_connections=pools, pool_maxsize=pool_size,
+            max_retries=retries))
+        return session
+
+    def request(self, method, address, path, retry=True, **kwargs):
+        """Make a request to a peer.
+
+        Args:
+            method (str): HTTP method.
+            address (str): Address of the peer.
+            path (str): Path of the endpoint, starting with ``/``.
+            retry (bool): If a failed request is retried.  Requests bound by
+                a deadline shouldn't be.
+            **kwargs: Passed on to :meth:`requests.Session.request`.
+
+        Returns:
+            :class:`requests.Response`: The response.
+
+        Raises:
+            requests.RequestException: If the request failed, including
+                responses with an error status.
+
+        """
+        kwargs.setdefault('timeout', self.timeout)
+        url = 'http://{address}{path}'.format(address=address, path=path)
+
+        metrics.started(address)
+        start = time.monotonic()
+        error = True
+        try:
+            session = self._session if retry else self._session_once
+            r = session.request(method, url, **kwargs)
+            r.raise_for_status()
+            error = False
+        finally:
+            metrics.finished(address, time.monotonic() - start, error)
+
+        return r
+
+    def get(self, address, path, **kwargs):
+        """Make a GET request, see :meth:`request`."""
+        return self.request('GET', address, path, **kwargs)
+
+    def post(self, address, path, **kwargs):
+        """Make a POST request, see :meth:`request`."""
+        return self.request('POST', address, path, **kwargs)
+
+    def delete(self, address, path, **kwargs):
+        """Make a DELETE request, see :meth:`request`."""
+        return self.request('DELETE', address, path, **kwargs)
+
+
+class AsyncPeerClient:
+    """Asynchronous HTTP client for requests to other nodes.
+
+    The asyncio counterpart of :class:`PeerClient`, with the same connection
+    reuse, timeouts, retries and metrics.  Must be created and closed inside
+    a running event loop.
+
+    Methods:
+        request_json: Make a request to a peer and decode its JSON response.
+        close: Close all connections.
+
+    """
+
+    def __init__(self, pool_size=10, timeout=3, retries=2):
+        """Initialize the client.
+
+        Args:
+            pool_size (int): Maximum number of connections per peer.
+            timeout (float): Default request timeout in seconds.
+            retries (int): Number of retries of failed requests.
+
+        """
+        self.timeout = timeout
+        self.retries = retries
+
+        self._session = aiohttp.ClientSession(
+            headers={'Accept': wire.ACCEPT},
+            connector=aiohttp.TCPConnector(limit=0,
+                                           limit_per_host=pool_size))
+
+    async def request_json(self, method, address, path, timeout=None,
+                           retry=True, **kwargs):
+        """Make a request to a peer and return its decoded response.
+
+        Lists are asked for in the compact encoding of
+        :mod:`seventweets.wire`, responses in either encoding are decoded.
+
+        Args:
+            method (str): HTTP method.
+            address (str): Address of the peer.
+            path (str): Path of the endpoint, starting with ``/``.
+            timeout (float): Request timeout, the default if ``None``.
+            retry (bool): If a failed request is retried, see
+                :meth:`PeerClient.request`.
+            **kwargs: Passed on to :meth:`aiohttp.ClientSession.request`.
+
+        Returns:
+            The decoded response body.
+
+        Raises:
+            aiohttp.ClientError: If the request failed, including responses
+                with an error status.
+            asyncio.TimeoutError: If the request timed out.
+
+        """
+        timeout = aiohttp.ClientTimeout(total=timeout or self.timeout)
+        url = 'http://{address}{path}'.format(address=address, path=path)
+
+        retries = self.retries if retry else 0
+
+        for attempt in range(retries + 1):
+            metrics.started(address)
+            start = time.monotonic()
+            error = True
+            try:
+                async with self._session.request(method, url, timeout=timeout,
+                                                 **kwargs) as r:
+                    r.raise_for_status()
+                    body = await r.read()
+                if r.content_type == wire.COLUMNS:
+                    data = wire.loads(body)
+                else:
+                    data = json.loads(body) if body.strip() else None
+                error = False
+                return data
+            except aiohttp.ClientResponseError as e:
+                if e.status not in (502, 503, 504) or attempt == retries:
+                    raise
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+                if attempt == retries:
+                    raise
+            finally:
+                metrics.finished(address, time.monotonic() - start, error)
+
+            await asyncio.sleep(0.1 * 2 ** attempt)
+
+    async def close(self):
+        """Close all connections."""
+        await self._session.close()
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """Return the peer client of this process, creating it if needed.
+
+    Returns:
+        PeerClient: Client configured from :class:`Config`.
+
+    """
+    global _client
+
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = PeerClient(pool_size=Config.PEER_POOL_SIZE,
+                                     pools=Config.PEER_POOLS,
+                                     timeout=Config.PEER_TIMEOUT,
+                                     retries=Config.PEER_RETRIES)
+    return _client
@@ -0,0 +1,300 @@
+"""This module implements pushing new tweets to subscribed nodes.
+
+Other nodes subscribe with ``POST /subscriptions``, and a dispatcher in
+every worker process delivers new tweets to them in batches with ``POST
+/inbox``.  New tweets are read from the change feed of the node (see
+:meth:`seventweets.storage.Storage.get_changes`), which is written in the
+same transaction as the tweets, so that saving stays a single round trip
+and no tweet is lost if the node stops before delivering it.
+
+Each subscription remembers the cursor of the last change delivered to the
+subscriber.  A transaction that commits late, even with lower tweet IDs, is
+always after that cursor, so its tweets are delivered too.  A dispatcher
+claims a subscription for a while (``FOR UPDATE SKIP LOCKED``), reads its
+next batch and commits, before making the request.  The dispatchers of all
+workers share the work, every subscriber gets its tweets in order, and no
+database connection or transaction is held while waiting for the
+subscriber.  A failed delivery is retried with exponential backoff, and a
+subscriber that failed too many times in a row is dropped (it subscribes
+again when it's back, see :mod:`seventweets.timeline`).
+
+Classes:
+    Dispatcher: Delivers new tweets to subscribers.
+
+Functions:
+    subscribe: Subscribe a node to new tweets.
+    unsubscribe: Cancel a node's subscription.
+    start: Start delivering tweets in the background.
+    wake: Deliver new tweets now instead of at the next interval.
+
+"""
+
+import json
+import logging
+import threading
+
+import requests
+
+from seventweets import peers
+from seventweets import storage
+from seventweets.config import Config
+from seventweets.db import get_db_cursor
+
+
+logger = logging.getLogger(__name__)
+
+
+def subscribe(cursor, name, address, since=None):
+    """Subscribe a node to new tweets.
+
+    A node continues from the cursor it gives, usually where it has pulled
+    to.  Without one, a new subscriber gets tweets saved after it subscribed
+    and a known one continues where its deliveries stopped.  Failed
+    deliveries are retried right away.
+
+    Args:
+        cursor (:class:`pg8000.Cursor`): Database cursor object.
+        name (str): Name of the node.
+        address (str): Address of the node.
+        since (tuple): Cursor of the last change the node has, see
+            :meth:`seventweets.storage.Storage.get_changes`.
+
+    Returns:
+        tuple: Cursor of the last change that is not going to be delivered.
+
+    """
+    if since is None:
+        # The end of the feed, as far as no transaction in progress can
+        # commit before it.
+        cursor.execute(
+            'SELECT xid, seq FROM change '
+            'WHERE xid < txid_snapshot_xmin(txid_current_snapshot()) '
+            'ORDER BY xid DESC, seq DESC LIMIT 1')
+        row = cursor.fetchone()
+        start = tuple(row) if row else (0, 0)
+    else:
+        start = tuple(since)
+
+    cursor.execute(
+        'INSERT INTO subscription (node_name, address, after_xid, after_seq) '
+        'VALUES (%s, %s, %s, %s) '
+        'ON CONFLICT (node_name) DO UPDATE SET address = EXCLUDED.address, '
+        'after_xid = CASE WHEN %s THEN EXCLUDED.after_xid '
+        'ELSE subscription.after_xid END, '
+        'after_seq = CASE WHEN %s THEN EXCLUDED.after_seq '
+        'ELSE subscription.after_seq END, '
+        'failures = 0, retry_at = now() '
+        'RETURNING after_xid, after_seq',
+        (name, address, start[0], start[1], since is not None,
+         since is not None))
+
+    return tuple(cursor.fetchone())
+
+
+def unsubscribe(cursor, name):
+    """Cancel a node's subscription.
+
+    Args:
+        cursor (:class:`pg8000.Cursor`): Database cursor object.
+        name (str): Name of the node.
+
+    Returns:
+        bool: True on success, False if the node wasn't subscribed.
+
+    """
+    cursor.execute(
+        'DELETE FROM subscription WHERE node_name = %s RETURNING node_name',
+        (name,))
+
+    return cursor.fetchone() is not None
+
+
+class Dispatcher:
+    """Delivers new tweets of the change feed to subscribers.
+
+    Methods:
+        dispatch: Deliver new tweets to all subscribers that are due.
+        start: Deliver periodically in a background thread.
+        stop: Stop the background thread.
+        wake: Deliver now instead of at the next interval.
+
+    """
+
+    def __init__(self, interval=1, batch_size=100, backoff=1, max_backoff=300,
+                 max_failures=20, lease=60):
+        """Initialize the dispatcher.
+
+        Args:
+            interval (float): Seconds between deliveries, unless woken up.
+            batch_size (int): Maximum number of changes delivered at once.
+            backoff (float): Seconds before the first retry of a failed
+                delivery, doubled with every further failure.
+            max_backoff (float): Maximum seconds between retries.
+            max_failures (int): Number of failures in a row after which a
+                subscriber is dropped.
+            lease (float): Seconds a subscriber claimed for a delivery is
+                left alone by other dispatchers, in case this one dies
+                before recording the outcome.
+
+        """
+        self.interval = interval
+        self.batch_size = batch_size
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.max_failures = max_failures
+        self.lease = lease
+
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def dispatch(self):
+        """Deliver new tweets to all subscribers that are due.
+
+        Returns:
+            int: Number of tweets delivered.
+
+        """
+        delivered = 0
+
+        while not self._stop.is_set():
+            count = self._deliver_next()
+            if count is None:
+                break
+            delivered += count
+
+        return delivered
+
+    def start(self):
+        """Deliver periodically in a background thread."""
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='push',
+                                        daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the background thread."""
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def wake(self):
+        """Deliver now instead of at the next interval."""
+        self._wake.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            if self._stop.is_set():
+                break
+            try:
+                self.dispatch()
+            except Exception:
+                logger.exception('Delivering tweets to subscribers failed')
+
+    def _deliver_next(self):
+        # Deliver a batch to one subscriber that is due and has changes
+        # waiting.  Returns the number of tweets delivered, None if there was
+        # nobody to deliver to.
+        with get_db_cursor() as cursor:
+            claimed = self._claim(cursor)
+            if claimed is None:
+                return None
+            name, address, since, failures = claimed
+            changes = storage.Storage.get_changes(cursor, since,
+                                                  self.batch_size)
+
+        tweets = changes['tweets']
+        until = changes['cursor']
+
+        if tweets:
+            body = json.dumps({'name': Config.NAME,
+                               'since': '{}-{}'.format(*since),
+                               'cursor': '{}-{}'.format(*until),
+                               'tweets': tweets})
+            try:
+                peers.get_client().post(address, '/inbox', data=body)
+            except requests.RequestException as e:
+                with get_db_cursor() as cursor:
+                    self._failed(cursor, name, failures + 1, e)
+                return 0
+
+        # Only if the subscription wasn't restarted at another cursor
+        # meanwhile.
+        with get_db_cursor() as cursor:
+            cursor.execute(
+                'UPDATE subscription SET after_xid = %s, after_seq = %s, '
+                'failures = 0, retry_at = now() WHERE node_name = %s '
+                'AND after_xid = %s AND after_seq = %s',
+                (until[0], until[1], name, since[0], since[1]))
+
+        return len(tweets)
+
+    def _claim(self, cursor):
+        # Claim a subscriber that is due and has changes waiting, by putting
+        # off its next delivery for the lease.  Returns its name, address,
+        # cursor and failures, None if there is none.
+        cursor.execute(
+            "UPDATE subscription SET retry_at = now() + %s * interval "
+            "'1 second' WHERE node_name = ("
+            'SELECT node_name FROM subscription AS s WHERE retry_at <= now() '
+            'AND EXISTS (SELECT 1 FROM change AS c '
+            'WHERE (c.xid, c.seq) > (s.after_xid, s.after_seq) '
+            'AND c.xid < txid_snapshot_xmin(txid_current_snapshot())) '
+            'ORDER BY retry_at LIMIT 1 FOR UPDATE SKIP LOCKED) '
+            'RETURNING node_name, address, after_xid, after_seq, failures',
+            (self.lease,))
+
+        row = cursor.fetchone()
+        if row is None:
+            return None
+        name, address, after_xid, after_seq, failures = row
+        return name, address, (after_xid, after_seq), failures
+
+    def _failed(self, cursor, name, failures, error):
+        # Schedule the retry of a failed delivery, or drop the subscriber.
+        if failures >= self.max_failures:
+            logger.warning('Dropping subscriber %s after %s failures: %s',
+                           name, failures, error)
+            cursor.execute('DELETE FROM subscription WHERE node_name = %s',
+                           (name,))
+            return
+
+        delay = min(self.backoff * 2 ** (failures - 1), self.max_backoff)
+        cursor.execute(
+            'UPDATE subscription SET failures = %s, '
+            "retry_at = now() + %s * interval '1 second' "
+            'WHERE node_name = %s',
+            (failures, delay, name))
+
+
+_dispatcher = None
+
+
+def start():
+    """Start delivering tweets to subscribers in the background.
+
+    Returns:
+        Dispatcher: The running dispatcher, configured from :class:`Config`.
+
+    """
+    global _dispatcher
+
+    if _dispatcher is None:
+        _dispatcher = Dispatcher(interval=Config.PUSH_INTERVAL,
+                                 batch_size=Config.PUSH_BATCH_SIZE,
+                                 backoff=Config.PUSH_BACKOFF,
+                                 max_backoff=Config.PUSH_MAX_BACKOFF,
+                                 max_failures=Config.PUSH_MAX_FAILURES)
+        _dispatcher.start()
+
+    return _dispatcher
+
+
+def wake():
+    """Deliver new tweets now, if the dispatcher of this process runs."""
+    if _dispatcher is not None:
+        _dispatcher.wake()
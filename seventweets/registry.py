@@ -1,14 +1,19 @@
 """This module implements the registry of known/active nodes in the network.
 
 Classes:
+    CircuitBreaker: Tracks failures of requests to a node.
+    PostgresStore: Registry storage in the database.
     Registry: Class that represents the registry.
 
 """
 
 from collections import namedtuple
 import json
+import threading
+import time
 
 from seventweets.config import Config
+from seventweets.db import get_db_cursor
 
 
 class _classproperty:
@@ -21,18 +26,157 @@ class _classproperty:
         return self.fget(objtype)
 
 
+class CircuitBreaker:
+    """Tracks failures of requests to a node, to stop sending it requests.
+
+    After ``threshold`` consecutive failures the breaker opens and requests
+    aren't allowed for ``cooldown`` seconds.  Then it is half open and lets
+    a single request through: if it succeeds the breaker closes, if it fails
+    it opens again.
+
+    Attributes:
+        threshold (int): Consecutive failures that open the breaker.
+        cooldown (float): Seconds the breaker stays open.
+
+    Methods:
+        allow: Return if a request may be sent.
+        success: Record a successful request.
+        failure: Record a failed request.
+        status: Return the state of the breaker.
+
+    """
+
+    def __init__(self, threshold=5, cooldown=30, clock=time.monotonic):
+        self.threshold = threshold
+        self.cooldown = cooldown
+
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened = None  # When the breaker last opened.
+        self._trial = False  # If the half open trial request is out.
+
+    def allow(self):
+        """Return if a request may be sent (bool)."""
+        with self._lock:
+            if self._opened is None:
+                return True
+            if self._trial or self._clock() - self._opened < self.cooldown:
+                return False
+            self._trial = True
+            return True
+
+    def success(self):
+        """Record a successful request, closing the breaker."""
+        with self._lock:
+            self._failures = 0
+            self._opened = None
+            self._trial = False
+
+    def failure(self):
+        """Record a failed request, opening the breaker if needed."""
+        with self._lock:
+            self._failures += 1
+            if self._trial or self._failures >= self.threshold:
+                self._opened = self._clock()
+            self._trial = False
+
+    def status(self):
+        """Return the state of the breaker.
+
+        Returns:
+            dict: ``{"state": "closed" | "open" | "half_open", "failures":
+                <int>}``.
+
+        """
+        with self._lock:
+            if self._opened is None:
+                state = 'closed'
+            elif self._clock() - self._opened < self.cooldown:
+                state = 'open'
+            else:
+                state = 'half_open'
+            return dict(state=state, failures=self._failures)
+
+
+class PostgresStore:
+    """Registry storage in the ``node`` table of the database.
+
+    The store is shared by all worker processes of the node and survives
+    restarts.  Every change draws a new value from the ``node_version_seq``
+    sequence, so reading its last value tells cheaply if anything changed.
+    Before the first change the version is 0.
+
+    Methods:
+        version: Return the current version of the stored registry.
+        load: Return all stored nodes.
+        add: Store a node.
+        remove: Remove a node.
+
+    """
+
+    def version(self):
+        """Return the current version of the stored registry (int)."""
+        with get_db_cursor() as cursor:
+            # A fresh sequence reports the same last value as after its
+            # first nextval, until then it's version 0.
+            cursor.execute('SELECT CASE WHEN is_called THEN last_value '
+                           'ELSE 0 END FROM node_version_seq')
+            return cursor.fetchone()[0]
+
+    def load(self):
+        """Return all stored nodes as ``(name, address)`` pairs."""
+        with get_db_cursor() as cursor:
+            cursor.execute('SELECT name, address FROM node')
+            return [tuple(row) for row in cursor.fetchall()]
+
+    def add(self, name, address):
+        """Store a node, or update its address."""
+        with get_db_cursor() as cursor:
+            # Nodes re-register often, unchanged rows don't bump the version.
+            cursor.execute(
+                'INSERT INTO node (name, address) VALUES (%s, %s) '
+                'ON CONFLICT (name) DO UPDATE SET address = EXCLUDED.address '
+                'WHERE node.address <> EXCLUDED.address RETURNING name',
+                (name, address))
+            if cursor.fetchone():
+                cursor.execute("SELECT nextval('node_version_seq')")
+
+    def remove(self, name):
+        """Remove a node by name."""
+        with get_db_cursor() as cursor:
+            cursor.execute('DELETE FROM node WHERE name = %s RETURNING name',
+                           (name,))
+            if cursor.fetchone():
+                cursor.execute("SELECT nextval('node_version_seq')")
+
+
 class Registry:
     """A pseudo-singleton[*]_ implementing network node registry.
 
     This is a runtime registry of active network nodes.
 
+    With ``Config.REGISTRY_BACKEND`` set to ``"postgres"`` the registry is
+    kept in the database (see :class:`PostgresStore`), so that all worker
+    processes agree on it and a restarted node knows the network right away.
+    Each process reads from its own snapshot of the stored registry, which is
+    reloaded when the stored version changed, checked at most every
+    ``Config.REGISTRY_REFRESH_INTERVAL`` seconds.  With the default
+    ``"memory"`` backend every process has its own registry.
+
     Attributes:
         known_nodes (str): JSON array of known nodes (``"[{"name": <str>,
             "address": <str>}, ...]"``).
 
+    Every known node has a :class:`CircuitBreaker` for requests to it,
+    local to the process.
+
     Methods:
+        nodes: Return a list of known nodes.
         register: Register a node.
         delete_node: Delete a node from registry.
+        breaker: Return the circuit breaker of a node.
+        status: Return known nodes with the state of their breakers.
 
 
     .. [*] We're not technically ensuring only one exists, but it would probably
@@ -40,13 +184,37 @@ class Registry:
 
     """
 
-    _known_nodes = set()
+    # Known nodes by name, the unique ID of a node in the network.
+    _known_nodes = {}
     _self_node = {'name': Config.NAME, 'address': Config.ADDRESS}
 
     # For easier access to name and address, we store a node as a named tuple
     # instead of an ordinary tuple.
     _Node = namedtuple('_Node', 'name, address')
 
+    # Mutations hold the lock and bump the version.  Readers use immutable
+    # snapshots (a tuple of nodes and its JSON) built once per version.
+    _lock = threading.RLock()
+    _version = 0
+    _snapshot = None  # (version, nodes, JSON)
+
+    _breakers = {}  # Circuit breakers by node name.
+
+    _store = PostgresStore() if Config.REGISTRY_BACKEND == 'postgres' else None
+    _store_version = None
+    _checked = None  # When the stored version was last checked.
+    _refresh_lock = threading.Lock()
+
+    @classmethod
+    def nodes(cls):
+        """Return a list of known nodes.
+
+        Returns:
+            list: Nodes as named tuples with ``name`` and ``address``.
+
+        """
+        return list(cls._get_snapshot()[1])
+
     @classmethod
     def register(cls, node):
         """Register a node.
@@ -56,8 +224,18 @@ class Registry:
                 (``{"name": <str>, "address": <str>}``).
         
         """
-        if node != cls._self_node:
-            cls._known_nodes.add(cls._Node(**node))
+        node = cls._Node(**node)
+        if node.name == cls._self_node['name']:
+            return
+
+        if cls._store is not None:
+            cls._store.add(node.name, node.address)
+
+        with cls._lock:
+            # Nodes re-register often, only an actual change is a new version.
+            if cls._known_nodes.get(node.name) != node:
+                cls._known_nodes[node.name] = node
+                cls._version += 1
 
     @_classproperty
     def known_nodes(cls):
@@ -68,15 +246,12 @@ class Registry:
                 <str>}, ...]"``).
 
         """
-        # Because the list of known nodes is a set of named tuples and needs to
-        # be processed into final form of a JSON array of node objects, this
-        # method is made into a class property via _classproperty so that we
-        # can access it as a simple class attribute.  There's also the
-        # convenience of having an exception if setting is attempted.
+        # This method is made into a class property via _classproperty so
+        # that we can access it as a simple class attribute.  There's also the
+        # convenience of having an exception if setting is attempted.  The
+        # JSON is serialized only once per version of the registry.
 
-        node_list = [n._asdict() for n in cls._known_nodes]
-        node_list.append(cls._self_node)
-        return json.dumps(node_list)
+        return cls._get_snapshot()[2]
 
     @classmethod
     def delete_node(cls, node):
@@ -86,8 +261,101 @@ class Registry:
             node (str): Name of the node to delete.
         
         """
+        if cls._store is not None:
+            cls._store.remove(node)
+
+        with cls._lock:
+            if cls._known_nodes.pop(node, None) is not None:
+                cls._version += 1
+            cls._breakers.pop(node, None)
+
+    @classmethod
+    def breaker(cls, name):
+        """Return the circuit breaker of a node.
+
+        Args:
+            name (str): Name of the node.
+
+        Returns:
+            CircuitBreaker: The node's breaker, created on first use.
+
+        """
+        with cls._lock:
+            breaker = cls._breakers.get(name)
+            if breaker is None:
+                breaker = cls._breakers[name] = CircuitBreaker(
+                    Config.BREAKER_THRESHOLD, Config.BREAKER_COOLDOWN)
+            return breaker
 
-        for n in cls._known_nodes:
-            if n.name == node:  # name is the unique ID in the network.
-                cls._known_nodes.remove(n)
-                break
+    @classmethod
+    def status(cls):
+        """Return known nodes with the state of their circuit breakers.
+
+        Returns:
+            list: ``[{"name": <str>, "address": <str>, "breaker": {"state":
+                <str>, "failures": <int>}}, ...]``, see
+                :meth:`CircuitBreaker.status`.
+
+        """
+        return [dict(node._asdict(), breaker=cls.breaker(node.name).status())
+                for node in cls.nodes()]
+
+    @classmethod
+    def _get_snapshot(cls):
+        # Return the snapshot of the current version, building it if needed.
+        cls._refresh()
+
+        snapshot = cls._snapshot
+        if snapshot is None or snapshot[0] != cls._version:
+            with cls._lock:
+                nodes = tuple(cls._known_nodes.values())
+                node_list = [n._asdict() for n in nodes]
+                node_list.append(cls._self_node)
+                snapshot = (cls._version, nodes, json.dumps(node_list))
+                cls._snapshot = snapshot
+
+        return snapshot
+
+    @classmethod
+    def _refresh(cls):
+        # Reload from the store if the stored registry changed.  Own changes
+        # are applied right away as well, so reloading them is harmless.  One
+        # thread refreshes at a time, the others wait for it and then find
+        # the registry fresh.  The store is read without holding the lock of
+        # the registry, the new nodes are swapped in under it.
+        if cls._store is None or cls._fresh():
+            return
+
+        with cls._refresh_lock:
+            if cls._fresh():
+                return
+
+            now = time.monotonic()
+            with cls._lock:
+                local_version = cls._version
+
+            version = cls._store.version()
+            if version == cls._store_version:
+                cls._checked = now
+                return
+
+            # Loaded after reading the version, so the registry is never older
+            # than the version it's marked with.
+            nodes = {name: cls._Node(name, address)
+                     for name, address in cls._store.load()}
+
+            with cls._lock:
+                # A node registered or deleted meanwhile might be missing from
+                # what was loaded, load again on the next call then.
+                if cls._version == local_version:
+                    cls._known_nodes = nodes
+                    cls._version += 1
+                    cls._store_version = version
+                    cls._checked = now
+
+    @classmethod
+    def _fresh(cls):
+        # If the stored version was checked less than the refresh interval
+        # ago.
+        return (cls._checked is not None and time.monotonic() - cls._checked <
+                Config.REGISTRY_REFRESH_INTERVAL)
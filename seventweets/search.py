@@ -0,0 +1,222 @@
+"""This module implements merging of search results of many nodes.
+
+A global search asks every node for its best ``limit`` tweets in the same
+order, and keeps only the best ``limit`` of all of them.  Results are merged
+into a bounded heap as each node answers, so the memory used and the size of
+the response don't grow with the size of the network.
+
+Attributes:
+    ORDERS (tuple): Supported orders of search results, best first:
+        ``"newest"`` (by time of publication) and ``"relevance"`` (by full
+        text search rank, then newest).
+
+The coordinating node of a global search also caches the results of each
+peer, so that repeated searches don't have to ask every peer again.
+
+Classes:
+    TopK: Thread-safe bounded merge of search results.
+    SearchCache: Cache of peers' search results with stale-while-revalidate.
+
+Functions:
+    sort_key: Return the sort key function for an order.
+
+"""
+
+import heapq
+from itertools import count
+import json
+import threading
+import time
+
+from seventweets.cache import LRUCache
+
+
+ORDERS = ('newest', 'relevance')
+
+
+def _newest(tweet):
+    # Name and ID only make ties deterministic.
+    return (tweet.get('created') or '', tweet.get('name') or '',
+            tweet.get('id') or 0)
+
+
+def _relevance(tweet):
+    return (tweet.get('rank') or 0.0,) + _newest(tweet)
+
+
+def sort_key(order):
+    """Return the sort key function for an order.
+
+    Tweets of nodes that don't report the fields of the order (``created``,
+    ``rank``) sort last.
+
+    Args:
+        order (str): One of :data:`ORDERS`.
+
+    Returns:
+        callable: Maps a tweet object to a key, higher is better.
+
+    """
+    return _relevance if order == 'relevance' else _newest
+
+
+class TopK:
+    """Thread-safe bounded merge of search results.
+
+    Keeps the best ``k`` tweets of all that are added in a min-heap, so
+    adding a tweet costs O(log k) and at most ``k`` tweets are held.
+
+    Methods:
+        add: Merge a list of tweets.
+        result: Return the best tweets, best first.
+
+    """
+
+    def __init__(self, k, order):
+        """Initialize the merge.
+
+        Args:
+            k (int): Number of tweets to keep.
+            order (str): One of :data:`ORDERS`.
+
+        """
+        self.k = k
+        self._key = sort_key(order)
+        self._heap = []
+        # Tie breaker, so that tweets (dicts) are never compared.
+        self._counter = count()
+        self._sources = set()
+        self._lock = threading.Lock()
+
+    def add(self, tweets, source=None):
+        """Merge a list of tweets (dictionaries).
+
+        Args:
+            tweets (list): Tweets to merge.
+            source (str): Where the tweets come from.  Only the first list
+                of each source is merged, later ones (e.g. answers to hedged
+                requests) are ignored.
+
+        Returns:
+            bool: If the tweets were merged.
+
+        """
+        with self._lock:
+            if source is not None:
+                if source in self._sources:
+                    return False
+                self._sources.add(source)
+
+            for tweet in tweets:
+                entry = (self._key(tweet), next(self._counter), tweet)
+                if len(self._heap) < self.k:
+                    heapq.heappush(self._heap, entry)
+                elif self._heap and entry > self._heap[0]:
+                    heapq.heapreplace(self._heap, entry)
+
+        return True
+
+    def result(self):
+        """Return the best tweets, best first (list)."""
+        with self._lock:
+            return [entry[2] for entry in sorted(self._heap, reverse=True)]
+
+
+class SearchCache:
+    """Cache of peers' search results, with stale-while-revalidate.
+
+    Results are cached per peer and normalized search parameters.  For
+    ``ttl`` seconds an entry is fresh and used instead of asking the peer.
+    For ``stale`` more seconds it is still used, but should be refreshed in
+    the background (see :meth:`claim`), after that it expires.  The least
+    recently used entries are evicted beyond ``maxsize``.
+
+    Methods:
+        get: Return cached results of a peer.
+        set: Cache results of a peer.
+        claim: Claim the refresh of an entry.
+        release: Release a claimed refresh.
+        stats: Return cache statistics.
+
+    """
+
+    def __init__(self, maxsize=1000, ttl=10, stale=60):
+        """Initialize the cache.
+
+        Args:
+            maxsize (int): Maximum number of entries.
+            ttl (float): Seconds an entry is fresh, zero disables the cache.
+            stale (float): Seconds a stale entry is still used.
+
+        """
+        self.ttl = ttl
+        self.stale = stale
+
+        self._entries = LRUCache(maxsize, ttl + stale)
+        self._lock = threading.Lock()
+        self._refreshing = set()
+
+    @staticmethod
+    def _key(address, params):
+        # Searches that differ only in case or spacing of the words match
+        # the same tweets.
+        params = dict(params)
+        if params.get('content'):
+            params['content'] = ' '.join(params['content'].lower().split())
+        return address + ' ' + json.dumps(sorted(params.items()))
+
+    def get(self, address, params):
+        """Return cached results of a peer.
+
+        Args:
+            address (str): Address of the peer.
+            params (dict): Parameters of the search.
+
+        Returns:
+            (list, bool) or None: The tweets and if they are fresh, ``None``
+                if nothing is cached.
+
+        """
+        if not self.ttl:
+            return None
+
+        entry = self._entries.get(self._key(address, params))
+        if entry is None:
+            return None
+
+        stored, tweets = entry
+        return tweets, time.monotonic() - stored < self.ttl
+
+    def set(self, address, params, tweets):
+        """Cache results (list of tweets) of a peer."""
+        if self.ttl:
+            self._entries.set(self._key(address, params),
+                              (time.monotonic(), tweets))
+
+    def claim(self, address, params):
+        """Claim the refresh of an entry.
+
+        Returns:
+            bool: If the caller should refresh the entry, ``False`` if it's
+                already being refreshed.  A successful claim must be released
+                with :meth:`release` once done.
+
+        """
+        key = self._key(address, params)
+        with self._lock:
+            if key in self._refreshing:
+                return False
+            self._refreshing.add(key)
+            return True
+
+    def release(self, address, params):
+        """Release a claimed refresh."""
+        with self._lock:
+            self._refreshing.discard(self._key(address, params))
+
+    def stats(self):
+        """Return cache statistics (dict), see :meth:`LRUCache.stats`."""
+        stats = self._entries.stats()
+        stats.update(ttl=self.ttl, stale=self.stale)
+        del stats['backend']
+        return stats
@@ -0,0 +1,65 @@
+"""This module implements serialization of tweets to JSON.
+
+Tweets are serialized straight from database rows, without building an
+object per row.  If the orjson package is installed it is used, it's several
+times faster than the standard library's json, which is the fallback.  Both
+produce the same compact JSON (no whitespace, non-ASCII characters as they
+are).
+
+Attributes:
+    BACKEND (str): The JSON library in use, ``"orjson"`` or ``"json"``.
+
+Functions:
+    dumps: Serialize an object to a JSON string.
+    tweet_dict: Return the dictionary of a tweet row.
+    dumps_tweet: Serialize a tweet row.
+    dumps_tweets: Serialize tweet rows as an array.
+
+"""
+
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+BACKEND = 'orjson' if orjson is not None else 'json'
+
+if orjson is not None:
+    def dumps(obj):
+        """Serialize an object to a JSON string (str)."""
+        return orjson.dumps(obj).decode()
+else:
+    # Built once, json.dumps with arguments builds an encoder every call.
+    _encoder = json.JSONEncoder(separators=(',', ':'), ensure_ascii=False)
+
+    def dumps(obj):
+        """Serialize an object to a JSON string (str)."""
+        return _encoder.encode(obj)
+
+
+def tweet_dict(row):
+    """Return the dictionary of a tweet row.
+
+    Args:
+        row (list): ``[<id>, <name of node>, <tweet body>, ...]``, further
+            columns are ignored.
+
+    Returns:
+        dict: ``{"id": <int>, "name": <str>, "tweet": <str>}``.
+
+    """
+    return {'id': row[0], 'name': row[1], 'tweet': row[2]}
+
+
+def dumps_tweet(row):
+    """Serialize a tweet row (see :func:`tweet_dict`) to a JSON object."""
+    return dumps({'id': row[0], 'name': row[1], 'tweet': row[2]})
+
+
+def dumps_tweets(rows):
+    """Serialize tweet rows (see :func:`tweet_dict`) to a JSON array."""
+    return dumps([{'id': row[0], 'name': row[1], 'tweet': row[2]}
+                  for row in rows])
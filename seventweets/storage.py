@@ -6,13 +6,25 @@ Classes:
 
 """
 
-import json
+from datetime import timezone
+import uuid
 
+from seventweets import push
+from seventweets.cache import get_cache
 from seventweets.config import Config
+from seventweets.db import on_commit
+from seventweets.serialization import dumps
+from seventweets.serialization import dumps_tweet
+from seventweets.serialization import dumps_tweets
+from seventweets.serialization import tweet_dict
 
 
 class Tweet:
     """Implements tweet objects.
+
+    Storage serializes rows of tweets without building these (see
+    :mod:`seventweets.serialization`), they are for code that needs objects.
+    Instances have fixed attributes and no ``__dict__``, use :meth:`as_dict`.
     
     Attributes:
         id (int): A unique ID of a tweet.
@@ -21,6 +33,8 @@ class Tweet:
     
     """
 
+    __slots__ = ('id', 'name', 'tweet')
+
     def __init__(self, tweet):
         """Initialize a tweet object.
 
@@ -39,16 +53,61 @@ class Tweet:
     def __str__(self):
         return self.tweet
 
+    def as_dict(self):
+        """Return the tweet as a dictionary.
+
+        Returns:
+            dict: ``{"id": <int>, "name": <str>, "tweet": <str>}``.
+
+        """
+        return {'id': self.id, 'name': self.name, 'tweet': self.tweet}
+
 
 class Storage:
     """This class encapsulates methods for database access.
 
+    All queries are parameterized and their SQL text is constant.  pg8000
+    prepares each distinct statement on the server once per connection and
+    reuses it afterwards, so on pooled connections query plans are reused
+    across requests.
+
+    Single tweets and pages of tweets are cached (see
+    :func:`seventweets.cache.get_cache`), all of them, unbounded, are not.
+    Cached entries are keyed by the storage version, which changes with
+    every saved or deleted tweet, so that they are never served after a
+    change.  The cache is updated only after the transaction making the
+    change commits.
+
+    With ``Config.PUSH`` saving tweets wakes the dispatcher once the
+    transaction commits, to push them to subscribed nodes (see
+    :mod:`seventweets.push`).
+
+    Retweets store a reference to the original tweet (the origin) instead of
+    its content.  The content of each origin is kept once, in the
+    ``origin_tweet`` table, and reads go through the ``tweet_view`` view that
+    fills it in.
+
     Class methods:
         get_all_tweets: Return all the node's tweets and retweets.
+        get_tweets: Return a page of the node's tweets and retweets.
+        iter_tweets: Iterate over all the node's tweets and retweets.
         get_tweet: Return a specific tweet by it's ID.
         save_tweet: Save a tweet to database.
+        save_tweets: Save many tweets to database at once.
+        save_retweet: Save a retweet to database.
+        get_origin: Return the cached content of an origin tweet.
+        save_origin: Cache the content of an origin tweet.
         delete_tweet: Delete a tweet from database.
         search: Search for tweets.
+        iter_search: Iterate over tweets matching a search.
+        get_changes: Return changes of tweets since a cursor.
+        version: Return the current storage version.
+        get_timeline: Return a page of the home timeline.
+        get_timeline_cursor: Return how far a node's tweets are in the
+            timeline.
+        claim_timeline: Claim pulling a node's tweets into the timeline.
+        save_timeline: Add tweets of a node to the timeline.
+        sync_own_timeline: Add the node's own new tweets to the timeline.
     
     """
 
@@ -64,9 +123,89 @@ class Storage:
                 (``[{"id": <int>, "name": <str>, "tweet": <str>}, ...]``).
         
         """
-        cursor.execute('SELECT id, node_name, content FROM tweet')
+        # Not cached, the whole table grows without bound.  Built from a
+        # stream, so that only the JSON is held in memory in full, not the
+        # rows and their dictionaries too.
+        rows = cls._stream(
+            cursor, 'SELECT id, node_name, content FROM tweet_view', (),
+            Config.STREAM_BATCH_SIZE)
+        return '[' + ','.join(dumps_tweet(row) for row in rows) + ']'
+
+    @classmethod
+    def get_tweets(cls, cursor, limit, before_id=None, after_id=None):
+        """Return a page of tweets and retweets from the database.
+
+        Pages are selected by tweet ID (keyset pagination), so fetching any
+        page is an index range scan regardless of how deep it is.  Without
+        ``after_id`` the page holds the newest tweets older than
+        ``before_id``, newest first.  With ``after_id`` it holds the oldest
+        tweets newer than ``after_id`` (and older than ``before_id`` if set),
+        oldest first.
+
+        Args:
+            cursor (:class:`pg8000.Cursor`): Database cursor object.
+            limit (int): Maximum number of tweets to return.
+            before_id (int): Only return tweets with a lower ID.
+            after_id (int): Only return tweets with a higher ID.
+
+        Returns:
+            str: Tweets and retweets as JSON array of objects (``[{"id": <int>,
+                "name": <str>, "tweet": <str>}, ...]``).
+
+        """
+        key = 'tweets:{}:{}:{}:{}'.format(cls.version(), limit, before_id,
+                                          after_id)
+        tweets = get_cache().get(key)
+        if tweets is not None:
+            return tweets
+
+        if after_id is not None and before_id is not None:
+            cursor.execute(
+                'SELECT id, node_name, content FROM tweet_view '
+                'WHERE id > %s AND id < %s ORDER BY id LIMIT %s',
+                (after_id, before_id, limit))
+        elif after_id is not None:
+            cursor.execute(
+                'SELECT id, node_name, content FROM tweet_view '
+                'WHERE id > %s ORDER BY id LIMIT %s',
+                (after_id, limit))
+        elif before_id is not None:
+            cursor.execute(
+                'SELECT id, node_name, content FROM tweet_view '
+                'WHERE id < %s ORDER BY id DESC LIMIT %s',
+                (before_id, limit))
+        else:
+            cursor.execute(
+                'SELECT id, node_name, content FROM tweet_view '
+                'ORDER BY id DESC LIMIT %s',
+                (limit,))
+
+        tweets = dumps_tweets(cursor.fetchall())
+        get_cache().set(key, tweets)
 
-        return json.dumps([Tweet(tweet).__dict__ for tweet in cursor.fetchall()])
+        return tweets
+
+    @classmethod
+    def iter_tweets(cls, cursor, batch_size):
+        """Iterate over all tweets and retweets in the database.
+
+        Rows are fetched through a server-side cursor ``batch_size`` at a
+        time, so that only one batch of tweets is held in memory at once.
+        The iteration must be finished before the transaction ends.
+
+        Args:
+            cursor (:class:`pg8000.Cursor`): Database cursor object.
+            batch_size (int): Number of rows to fetch at once.
+
+        Yields:
+            str: Tweets and retweets in order of ID, each as a JSON object
+                (``{"id": <int>, "name": <str>, "tweet": <str>}``).
+
+        """
+        for row in cls._stream(
+                cursor, 'SELECT id, node_name, content FROM tweet_view '
+                'ORDER BY id', (), batch_size):
+            yield dumps_tweet(row)
 
     @classmethod
     def get_tweet(cls, cursor, id):
@@ -81,12 +220,22 @@ class Storage:
                 "tweet": <str>}``), or ``None`` if no tweet with ID.
         
         """
+        # Keyed by the version read before the query, so that a read racing
+        # a delete caches the deleted tweet only under a stale version.
+        key = 'tweet:{}:{}'.format(cls.version(), id)
+        tweet = get_cache().get(key)
+        if tweet is not None:
+            return tweet
+
         cursor.execute(
-            'SELECT id, node_name, content FROM tweet WHERE id = {}'.format(id))
+            'SELECT id, node_name, content FROM tweet_view WHERE id = %s',
+            (id,))
 
         res = cursor.fetchone()
         if res:
-            return json.dumps(Tweet(res).__dict__)
+            tweet = dumps_tweet(res)
+            get_cache().set(key, tweet)
+            return tweet
         else:
             return None
 
@@ -104,13 +253,139 @@ class Storage:
 
         """
         cursor.execute(
-            "INSERT INTO tweet (node_name, content) \
-            VALUES ('{name}', '{tweet}') RETURNING id, node_name, content".format(
-                **{'name': Config.NAME, 'tweet': tweet}))
+            'INSERT INTO tweet (node_name, content) VALUES (%s, %s) '
+            'RETURNING id, node_name, content',
+            (Config.NAME, tweet))
+        if Config.PUSH:
+            on_commit(push.wake)
 
         res = cursor.fetchone()
+        on_commit(cls._changed)
+
+        return dumps_tweet(res)
 
-        return json.dumps(Tweet(res).__dict__)
+    @classmethod
+    def save_tweets(cls, cursor, tweets):
+        """Save many tweets to the database with a single statement.
+
+        All tweets are inserted by one multi-row ``INSERT`` in the current
+        transaction.  The SQL text doesn't depend on the number of tweets, so
+        the statement is prepared only once per connection.
+
+        Args:
+            cursor (:class:`pg8000.Cursor`): Database cursor object.
+            tweets (list): Contents of the tweets (str).
+
+        Returns:
+            list: Saved tweets as dictionaries (``[{"id": <int>, "name":
+                <str>, "tweet": <str>}, ...]``), in the same order as
+                ``tweets``.
+
+        """
+        if not tweets:
+            return []
+
+        cursor.execute(
+            'INSERT INTO tweet (node_name, content) '
+            'SELECT %s, content '
+            'FROM unnest(CAST(%s AS TEXT[])) WITH ORDINALITY AS t (content, n) '
+            'ORDER BY n RETURNING id',
+            (Config.NAME, list(tweets)))
+        if Config.PUSH:
+            on_commit(push.wake)
+
+        # Rows are inserted in order of n, so IDs drawn from the sequence
+        # increase in the same order, but RETURNING doesn't promise any order.
+        ids = sorted(row[0] for row in cursor.fetchall())
+        on_commit(cls._changed)
+
+        return [tweet_dict([id, Config.NAME, tweet])
+                for id, tweet in zip(ids, tweets)]
+
+    @classmethod
+    def save_retweet(cls, cursor, origin_name, origin_id, content):
+        """Save a retweet to the database, unless it's already there.
+
+        A node retweets a tweet only once, retweeting it again returns the
+        existing retweet.
+
+        Args:
+            cursor (:class:`pg8000.Cursor`): Database cursor object.
+            origin_name (str): Name of the node of the original tweet.
+            origin_id (int): ID of the original tweet on its node.
+            content (str): Content of the original tweet, only returned.
+
+        Returns:
+            str: Retweet as a JSON object (``{"id": <int>, "name": <str>,
+                "tweet": <str>}``), ``None`` if a concurrent transaction
+                deleted the retweet.
+
+        """
+        # Retweets of the same tweet are serialized, so that a concurrent
+        # retweet is committed, and visible to the statement below, by the
+        # time the lock is taken.  Otherwise the insert would conflict with
+        # it, and the select not see it.
+        cursor.execute('SELECT pg_advisory_xact_lock(hashtext(%s))',
+                       ('retweet:{}:{}'.format(origin_name, origin_id),))
+
+        # The inserted row isn't visible to the rest of the statement, so
+        # exactly one of the two selects returns the retweet.
+        cursor.execute(
+            'WITH new AS ('
+            'INSERT INTO tweet (node_name, rt, rt_origin_node, rt_origin_id) '
+            'VALUES (%s, TRUE, %s, %s) '
+            'ON CONFLICT (rt_origin_node, rt_origin_id) WHERE rt DO NOTHING '
+            'RETURNING id) '
+            'SELECT id FROM new UNION ALL '
+            'SELECT id FROM tweet '
+            'WHERE rt AND rt_origin_node = %s AND rt_origin_id = %s',
+            (Config.NAME, origin_name, origin_id, origin_name, origin_id))
+
+        res = cursor.fetchone()
+        if res is None:
+            return None
+        on_commit(cls._changed)
+
+        return dumps_tweet([res[0], Config.NAME, content])
+
+    @classmethod
+    def get_origin(cls, cursor, name, id):
+        """Return the cached content of an origin tweet.
+
+        Args:
+            cursor (:class:`pg8000.Cursor`): Database cursor object.
+            name (str): Name of the node of the tweet.
+            id (int): ID of the tweet on its node.
+
+        Returns:
+            str or None: Content of the tweet, ``None`` if it isn't cached.
+
+        """
+        cursor.execute(
+            'SELECT content FROM origin_tweet '
+            'WHERE node_name = %s AND tweet_id = %s',
+            (name, id))
+
+        res = cursor.fetchone()
+        return res[0] if res else None
+
+    @classmethod
+    def save_origin(cls, cursor, name, id, content):
+        """Cache the content of an origin tweet.
+
+        Args:
+            cursor (:class:`pg8000.Cursor`): Database cursor object.
+            name (str): Name of the node of the tweet.
+            id (int): ID of the tweet on its node.
+            content (str): Content of the tweet.
+
+        """
+        cursor.execute(
+            'INSERT INTO origin_tweet (node_name, tweet_id, content) '
+            'VALUES (%s, %s, %s) '
+            'ON CONFLICT (node_name, tweet_id) DO UPDATE '
+            'SET content = EXCLUDED.content',
+            (name, id, content))
 
     @classmethod
     def delete_tweet(cls, cursor, id):
@@ -124,29 +399,377 @@ class Storage:
             bool: True on success, False if the tweet ID doesn't exist.
         
         """
-        cursor.execute(
-            "DELETE FROM tweet WHERE id = {} RETURNING id".format(id))
+        cursor.execute('DELETE FROM tweet WHERE id = %s RETURNING id', (id,))
 
         result = cursor.fetchone()
 
         if result:
+            on_commit(cls._changed)
             return True
         else:
             return False
 
     @classmethod
-    def search(cls, cursor, query):
-        """Execute a query on the database and return matching tweets.
+    def search(cls, cursor, content=None, created_from=None, created_to=None,
+               limit=None, order='newest'):
+        """Search for tweets and return them.
+
+        Content is matched with PostgreSQL full text search against the
+        indexed search vector of tweets, so that a tweet matches if it
+        contains all the words in ``content``.  Retweets are searched, and
+        returned, with the content of the retweeted tweet.  Without
+        ``content``, all tweets in the date range match.  Matching tweets are ordered newest
+        first, or with ``content`` and ``order="relevance"``, best ranked
+        first.
+
+        Args:
+            cursor (:class:`pg8000.Cursor`): Database cursor object.
+            content (str): Words to search for.
+            created_from (str): Only return tweets published after this
+                date/time (anything PostgreSQL accepts as a timestamp).
+            created_to (str): Only return tweets published before this
+                date/time.
+            limit (int): Maximum number of tweets to return, all if ``None``.
+            order (str): ``"newest"`` or ``"relevance"``.
+
+        Returns:
+            list: All matching tweets as a list of dictionaries (``[{"id":
+                <int>, "name": <str>, "tweet": <str>, "created": <str>},
+                ...]``).  ``created`` is the ISO 8601 UTC time of
+                publication.  With ``content`` the dictionaries also hold the
+                full text search rank as ``"rank": <float>``.
+
+        """
+        query, args = cls._search_query(content, created_from, created_to,
+                                        limit, order)
+        cursor.execute(query, args)
+
+        return [cls._search_result(row, content) for row in cursor.fetchall()]
+
+    @classmethod
+    def iter_search(cls, cursor, batch_size, content=None, created_from=None,
+                    created_to=None, limit=None, order='newest'):
+        """Iterate over tweets matching a search.
+
+        Same as :meth:`search`, but the matching tweets are fetched through
+        a server-side cursor ``batch_size`` at a time, so that only one batch
+        is held in memory at once, however many tweets match.  The iteration
+        must be finished before the transaction ends.
 
         Args:
             cursor (:class:`pg8000.Cursor`): Database cursor object.
-            query (str): SQL query to execute.
+            batch_size (int): Number of rows to fetch at once.
+            content, created_from, created_to, limit, order: See
+                :meth:`search`.
+
+        Yields:
+            str: Matching tweets, each as a JSON object (see :meth:`search`).
+
+        """
+        query, args = cls._search_query(content, created_from, created_to,
+                                        limit, order)
+
+        for row in cls._stream(cursor, query, args, batch_size):
+            yield dumps(cls._search_result(row, content))
+
+    @classmethod
+    def get_changes(cls, cursor, since, limit):
+        """Return changes of tweets since a cursor.
+
+        Every saved and deleted tweet is recorded in the ``change`` table by
+        a trigger.  A cursor is the position of a change in the feed, as the
+        ID of the transaction that made it and its sequence number.  Changes
+        are returned in that order, and only those of transactions older
+        than any still in progress.  A transaction that commits later, even
+        if it drew lower sequence numbers, is thus always after the cursor of
+        a batch read before, and no change is ever skipped.
+
+        Saved tweets that were deleted since are left out, their tombstone is
+        in the same or a later batch.  IDs of tweets are never reused, so
+        changes in a batch can be applied in any order.
+
+        Args:
+            cursor (:class:`pg8000.Cursor`): Database cursor object.
+            since (tuple): Cursor ``(<transaction ID>, <sequence number>)`` of
+                the last change seen, ``(0, 0)`` for all changes.
+            limit (int): Maximum number of changes to return.
 
         Returns:
-            str: All tweets as a JSON array of objects (``[{"id": <int>, "name":
-                <str>, "tweet": <str>}, ...]``).
+            dict: Saved tweets and IDs of deleted tweets, the cursor of the
+                last change returned, and if there may be more (``{"tweets":
+                [{"id": <int>, "name": <str>, "tweet": <str>}, ...],
+                "deleted": [<int>, ...], "cursor": (<int>, <int>), "more":
+                <bool>}``).
 
         """
-        cursor.execute(query)
+        cursor.execute(
+            'SELECT c.xid, c.seq, c.tweet_id, c.deleted, t.node_name, '
+            't.content FROM change AS c LEFT JOIN tweet_view AS t '
+            'ON NOT c.deleted AND t.id = c.tweet_id '
+            'WHERE (c.xid, c.seq) > (%s, %s) '
+            'AND c.xid < txid_snapshot_xmin(txid_current_snapshot()) '
+            'ORDER BY c.xid, c.seq LIMIT %s',
+            (since[0], since[1], limit))
+
+        rows = cursor.fetchall()
+        tweets = []
+        deleted = []
+        for xid, seq, id, is_deleted, name, content in rows:
+            if is_deleted:
+                deleted.append(id)
+            elif name is not None:
+                tweets.append(tweet_dict([id, name, content]))
+
+        return {'tweets': tweets,
+                'deleted': deleted,
+                'cursor': tuple(rows[-1][:2]) if rows else tuple(since),
+                'more': len(rows) == limit}
+
+    @classmethod
+    def version(cls):
+        """Return the current storage version.
+
+        The version is an opaque token that changes every time a tweet is
+        saved or deleted.  It is kept in the cache, so all processes sharing
+        a cache backend see the same version.
+
+        Returns:
+            str: Storage version.
+
+        """
+        version = get_cache().get('version')
+
+        if version is None:
+            # Never seen, or evicted from the cache.  A fresh random version
+            # can't match anything cached under an older one.
+            version = uuid.uuid4().hex
+            get_cache().set('version', version)
 
-        return [Tweet(tweet).__dict__ for tweet in cursor.fetchall()]
+        return version
+
+    @classmethod
+    def get_timeline(cls, cursor, limit, before=None):
+        """Return a page of the home timeline, newest first.
+
+        The timeline holds tweets of this node and of its peers, in the order
+        they were added to it (see :mod:`seventweets.timeline`).
+
+        Args:
+            cursor (:class:`pg8000.Cursor`): Database cursor object.
+            limit (int): Maximum number of tweets to return.
+            before (int): Only return tweets with a lower position.
+
+        Returns:
+            list: Tweets as dictionaries (``[{"seq": <int>, "id": <int>,
+                "name": <str>, "tweet": <str>}, ...]``), ``seq`` being the
+                position in the timeline and ``id`` the ID on the node
+                ``name``.
+
+        """
+        if before is None:
+            cursor.execute(
+                'SELECT seq, tweet_id, node_name, content FROM timeline '
+                'ORDER BY seq DESC LIMIT %s',
+                (limit,))
+        else:
+            cursor.execute(
+                'SELECT seq, tweet_id, node_name, content FROM timeline '
+                'WHERE seq < %s ORDER BY seq DESC LIMIT %s',
+                (before, limit))
+
+        return [dict(seq=row[0], **tweet_dict(row[1:]))
+                for row in cursor.fetchall()]
+
+    @classmethod
+    def get_timeline_cursor(cls, cursor, node_name):
+        """Return how far a node's tweets are in the timeline.
+
+        Args:
+            cursor (:class:`pg8000.Cursor`): Database cursor object.
+            node_name (str): Name of the node.
+
+        Returns:
+            tuple: Cursor ``(<transaction ID>, <sequence number>)`` of the
+                last change in the node's feed (see :meth:`get_changes`)
+                that is in the timeline, ``(0, 0)`` if none is.
+
+        """
+        cursor.execute(
+            'SELECT after_xid, after_seq FROM timeline_cursor '
+            'WHERE node_name = %s',
+            (node_name,))
+
+        row = cursor.fetchone()
+        return tuple(row) if row else (0, 0)
+
+    @classmethod
+    def claim_timeline(cls, cursor, node_name, interval):
+        """Claim pulling a node's tweets into the timeline.
+
+        Worker processes share the pulling: a node that any of them claimed
+        less than ``interval`` seconds ago is not claimed again.  The claim
+        only saves pulling twice, :meth:`save_timeline` is safe to call
+        concurrently.
+
+        Args:
+            cursor (:class:`pg8000.Cursor`): Database cursor object.
+            node_name (str): Name of the node.
+            interval (float): Seconds since the last claim.
+
+        Returns:
+            tuple: The node's timeline cursor (see
+                :meth:`get_timeline_cursor`), ``None`` if the node wasn't
+                claimed.
+
+        """
+        cursor.execute(
+            'INSERT INTO timeline_cursor (node_name, pulled_at) '
+            'VALUES (%s, now()) '
+            'ON CONFLICT (node_name) DO UPDATE SET pulled_at = now() '
+            'WHERE timeline_cursor.pulled_at <= '
+            "now() - %s * interval '1 second' "
+            'RETURNING after_xid, after_seq',
+            (node_name, interval))
+
+        row = cursor.fetchone()
+        return tuple(row) if row else None
+
+    @classmethod
+    def save_timeline(cls, cursor, node_name, tweets, since=None, until=None):
+        """Add tweets of a node to the timeline, and advance its cursor.
+
+        Tweets already in the timeline are skipped.  With ``since`` and
+        ``until``, ``tweets`` are the node's tweets between these cursors of
+        its change feed, and they are saved only if the timeline cursor is
+        still at ``since``, which then moves to ``until``.  Otherwise
+        another worker saved them already, or the tweets could be preceded by
+        ones not pulled yet, that would be skipped.
+
+        Args:
+            cursor (:class:`pg8000.Cursor`): Database cursor object.
+            node_name (str): Name of the node.
+            tweets (list): Tweets of the node as dictionaries (``[{"id":
+                <int>, "tweet": <str>, ...}, ...]``), oldest first.
+            since (tuple): Cursor the tweets follow.
+            until (tuple): Cursor of the last change the tweets are from.
+
+        Returns:
+            bool: True if the tweets were saved.
+
+        """
+        if since is not None:
+            # The row is locked until commit, so of concurrent callers with
+            # the same since only the first one moves the cursor.
+            cursor.execute(
+                'UPDATE timeline_cursor SET after_xid = %s, after_seq = %s '
+                'WHERE node_name = %s AND after_xid = %s AND after_seq = %s '
+                'RETURNING node_name',
+                (until[0], until[1], node_name, since[0], since[1]))
+            if cursor.fetchone() is None:
+                return False
+
+        if tweets:
+            cursor.execute(
+                'INSERT INTO timeline (node_name, tweet_id, content) '
+                'SELECT %s, t.id, t.content '
+                'FROM unnest(CAST(%s AS INTEGER[]), CAST(%s AS TEXT[])) '
+                'WITH ORDINALITY AS t (id, content, n) ORDER BY n '
+                'ON CONFLICT (node_name, tweet_id) DO NOTHING',
+                (node_name, [t['id'] for t in tweets],
+                 [t['tweet'] for t in tweets]))
+
+        return True
+
+    @classmethod
+    def sync_own_timeline(cls, cursor, limit, interval=0):
+        """Add the node's own new tweets to the timeline.
+
+        New tweets are read from the node's change feed, so that tweets of
+        transactions that commit late are not skipped.
+
+        Args:
+            cursor (:class:`pg8000.Cursor`): Database cursor object.
+            limit (int): Maximum number of changes to read.
+            interval (float): Seconds since another worker last synced, see
+                :meth:`claim_timeline`.
+
+        Returns:
+            int: Number of tweets added.
+
+        """
+        since = cls.claim_timeline(cursor, Config.NAME, interval)
+        if since is None:
+            return 0
+
+        changes = cls.get_changes(cursor, since, limit)
+        if not cls.save_timeline(cursor, Config.NAME, changes['tweets'],
+                                 since, changes['cursor']):
+            return 0
+
+        return len(changes['tweets'])
+
+    @classmethod
+    def _stream(cls, cursor, query, args, batch_size):
+        # Yield the rows of a query, fetched through a server-side cursor
+        # batch_size at a time.  pg8000 reads the whole result of a statement
+        # before returning from execute (fetchmany only slices it), so this is
+        # the only way to keep big results out of memory.  The cursor is
+        # closed when all rows are read, only one can be open at a time.
+        cursor.execute('DECLARE stream NO SCROLL CURSOR FOR ' + query, args)
+        fetch = 'FETCH FORWARD {:d} FROM stream'.format(batch_size)
+
+        while True:
+            cursor.execute(fetch)
+            rows = cursor.fetchall()
+            yield from rows
+            if len(rows) < batch_size:
+                break
+
+        cursor.execute('CLOSE stream')
+
+    @classmethod
+    def _search_query(cls, content, created_from, created_to, limit, order):
+        # Query and arguments of a search, see search.
+        created_from = created_from or '-infinity'
+        created_to = created_to or 'infinity'
+
+        if content and order == 'relevance':
+            return (
+                "SELECT id, node_name, content, pub_datetime, "
+                "ts_rank(content_tsv, query) AS rank "
+                "FROM tweet_view, plainto_tsquery('pg_catalog.simple', %s) AS query "
+                "WHERE content_tsv @@ query AND "
+                "pub_datetime > %s AND pub_datetime < %s "
+                "ORDER BY rank DESC, pub_datetime DESC, id DESC LIMIT %s",
+                (content, created_from, created_to, limit))
+        elif content:
+            return (
+                "SELECT id, node_name, content, pub_datetime, "
+                "ts_rank(content_tsv, query) AS rank "
+                "FROM tweet_view, plainto_tsquery('pg_catalog.simple', %s) AS query "
+                "WHERE content_tsv @@ query AND "
+                "pub_datetime > %s AND pub_datetime < %s "
+                "ORDER BY pub_datetime DESC, id DESC LIMIT %s",
+                (content, created_from, created_to, limit))
+        else:
+            return (
+                "SELECT id, node_name, content, pub_datetime FROM tweet_view "
+                "WHERE pub_datetime > %s AND pub_datetime < %s "
+                "ORDER BY pub_datetime DESC, id DESC LIMIT %s",
+                (created_from, created_to, limit))
+
+    @classmethod
+    def _search_result(cls, row, content):
+        # Dictionary of a tweet found by a search.
+        tweet = tweet_dict(row)
+        # All nodes report UTC, so that times compare as strings when results
+        # of many nodes are merged.
+        tweet['created'] = row[3].astimezone(timezone.utc).isoformat()
+        if content:
+            tweet['rank'] = row[4]
+        return tweet
+
+    @classmethod
+    def _changed(cls):
+        # Invalidate cached data after a tweet was saved or deleted.
+        get_cache().set('version', uuid.uuid4().hex)
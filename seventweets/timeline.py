@@ -0,0 +1,215 @@
+"""This module implements the home timeline.
+
+The home timeline is a table of tweets of this node and all the nodes in the
+registry, kept up to date by pulling new tweets from each node periodically,
+so that showing it is one indexed query instead of asking every peer.  For
+every node the timeline remembers how far it got in the node's change feed
+(its cursor), and asks the node only for changes after that with ``GET
+/changes?since=<cursor>``.  Unlike tweet IDs, the cursor never skips tweets
+of transactions that commit late (see
+:meth:`seventweets.storage.Storage.get_changes`).
+
+Every worker process of the node runs its own puller.  A worker claims a
+peer before pulling it, so that the workers don't all pull the same peer
+(see :meth:`seventweets.storage.Storage.claim_timeline`).  Requests to peers
+are made outside of any transaction, each page is saved in a short one of
+its own, and only if no other worker saved it first.
+
+With ``Config.PUSH`` the puller also subscribes to every node, from the
+cursor it pulled to, so that new tweets are pushed to the timeline as soon
+as they are saved (see :mod:`seventweets.push`), and pulling only catches up
+on what was missed.
+
+Deleted tweets are not removed from the timeline.
+
+Classes:
+    TimelinePuller: Pulls new tweets of all nodes into the timeline.
+
+Functions:
+    start: Start pulling tweets into the timeline in the background.
+
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+import json
+import logging
+import threading
+
+import requests
+
+from seventweets import peers
+from seventweets.config import Config
+from seventweets.db import get_db_cursor
+from seventweets.registry import Registry
+from seventweets.storage import Storage
+
+
+logger = logging.getLogger(__name__)
+
+
+class TimelinePuller:
+    """Pulls new tweets of this node and all its peers into the timeline.
+
+    Methods:
+        sync: Pull new tweets of all nodes once.
+        sync_peer: Pull new tweets of a peer.
+        start: Pull periodically in a background thread.
+        stop: Stop the background thread.
+
+    """
+
+    def __init__(self, interval=10, batch_size=500, max_pages=10, workers=4):
+        """Initialize the puller.
+
+        Args:
+            interval (float): Seconds between pulls.
+            batch_size (int): Number of tweets asked for at once.
+            max_pages (int): Maximum number of batches pulled from a node at
+                once, the rest waits for the next pull.
+            workers (int): Number of peers pulled concurrently.
+
+        """
+        self.interval = interval
+        self.batch_size = batch_size
+        self.max_pages = max_pages
+
+        # A node pulled by a worker less than this many seconds ago is left
+        # alone by the others.
+        self._claim = interval / 2
+
+        self._executor = ThreadPoolExecutor(max_workers=workers)
+        # Names of nodes subscribed to by this process.
+        self._subscribed = set()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def sync(self):
+        """Pull new tweets of all nodes once.
+
+        Returns:
+            dict: Number of tweets added by node name.  Nodes that failed
+                are left out.
+
+        """
+        with get_db_cursor() as cursor:
+            added = {Config.NAME: Storage.sync_own_timeline(
+                cursor, self.batch_size * self.max_pages, self._claim)}
+
+        nodes = Registry.nodes()
+        futures = [self._executor.submit(self.sync_peer, node)
+                   for node in nodes]
+
+        for node, future in zip(nodes, futures):
+            try:
+                added[node.name] = future.result()
+            except Exception as e:
+                logger.warning('Pulling tweets of %s failed: %s', node.name, e)
+
+        return added
+
+    def sync_peer(self, node):
+        """Pull new tweets of a peer.
+
+        Args:
+            node: Named tuple of the peer (``name`` and ``address``).
+
+        Returns:
+            int: Number of tweets pulled, 0 if another worker is pulling the
+                peer.
+
+        Raises:
+            requests.RequestException: If the peer couldn't be reached.
+            ValueError: If the peer's answer is invalid.
+
+        """
+        count = 0
+
+        with get_db_cursor() as cursor:
+            since = Storage.claim_timeline(cursor, node.name, self._claim)
+        if since is None:
+            return 0
+
+        for _ in range(self.max_pages):
+            r = peers.get_client().get(
+                node.address, '/changes',
+                params={'since': '{}-{}'.format(*since),
+                        'limit': self.batch_size})
+            try:
+                changes = r.json()
+                tweets = changes['tweets']
+                until = tuple(int(part)
+                              for part in changes['cursor'].split('-'))
+            except (KeyError, TypeError, AttributeError) as e:
+                raise ValueError('Invalid changes: {!r}'.format(e))
+
+            with get_db_cursor() as cursor:
+                if not Storage.save_timeline(cursor, node.name, tweets,
+                                             since, until):
+                    # Another worker got there first.
+                    break
+            count += len(tweets)
+
+            if not changes.get('more'):
+                break
+            since = until
+
+        if Config.PUSH and node.name not in self._subscribed:
+            self._subscribe(node)
+
+        return count
+
+    def start(self):
+        """Pull periodically in a background thread."""
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='timeline',
+                                        daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the background thread."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _subscribe(self, node):
+        # Have new tweets of the node pushed, from where the timeline got to.
+        # Nodes without push enabled are just pulled from.
+        with get_db_cursor() as cursor:
+            since = Storage.get_timeline_cursor(cursor, node.name)
+        body = json.dumps({'name': Config.NAME, 'address': Config.ADDRESS,
+                           'since': '{}-{}'.format(*since)})
+        try:
+            peers.get_client().post(node.address, '/subscriptions', data=body)
+        except requests.RequestException as e:
+            logger.debug('Subscribing to %s failed: %s', node.name, e)
+        else:
+            self._subscribed.add(node.name)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.sync()
+            except Exception:
+                logger.exception('Pulling tweets into the timeline failed')
+
+
+_puller = None
+
+
+def start():
+    """Start pulling tweets into the timeline in the background.
+
+    Returns:
+        TimelinePuller: The running puller, configured from :class:`Config`.
+
+    """
+    global _puller
+
+    if _puller is None:
+        _puller = TimelinePuller(interval=Config.TIMELINE_INTERVAL,
+                                 batch_size=Config.TIMELINE_BATCH_SIZE,
+                                 workers=Config.TIMELINE_WORKERS)
+        _puller.start()
+
+    return _puller
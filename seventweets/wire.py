@@ -0,0 +1,148 @@
+"""This module implements the compact encoding of lists between nodes.
+
+Nodes send each other lists of objects that all have the same keys: tweets
+(``GET /tweets``, ``GET /search``, ``GET /timeline``) and nodes (``POST
+/registry``).  In JSON every object repeats every key, and tweets of a node
+all repeat its name.  The columnar encoding is JSON too, but holds one array
+of values per key, a key with the same value in all objects (like the name
+of the node in its own tweets) just once, and a key with few distinct string
+values (like names in global search results) as indexes into a list of them:
+
+    {"count": 3, "keys": ["id", "name", "tweet"],
+     "columns": {"id": [1, 2, 3], "tweet": ["a", "b", "c"]},
+     "constants": {"name": "nzp"}, "dictionaries": {}}
+
+Nodes ask for it with the ``Accept`` header and fall back to JSON for nodes
+that don't know it.  Other clients keep getting plain JSON.
+
+Attributes:
+    JSON (str): Media type of JSON.
+    COLUMNS (str): Media type of the columnar encoding.
+    ACCEPT (str): ``Accept`` header of requests to other nodes.
+
+Functions:
+    dumps: Encode a list of objects.
+    loads: Decode a list of objects.
+    accepts: Return if an ``Accept`` header prefers the columnar encoding.
+    decode: Decode the body of a response of another node.
+
+"""
+
+from itertools import repeat
+import json
+
+from werkzeug.datastructures import MIMEAccept
+from werkzeug.http import parse_accept_header
+
+
+JSON = 'application/json'
+COLUMNS = 'application/vnd.seventweets.columns+json'
+ACCEPT = '{}, {};q=0.9'.format(COLUMNS, JSON)
+
+
+def dumps(objects):
+    """Encode a list of objects (dictionaries) in the columnar encoding.
+
+    Keys missing in some of the objects are decoded as ``None`` in those.
+
+    Args:
+        objects (list): Objects to encode.
+
+    Returns:
+        str: The encoded list.
+
+    """
+    keys = list(dict.fromkeys(key for o in objects for key in o))
+    columns = {}
+    constants = {}
+    dictionaries = {}
+
+    for key in keys:
+        values = [o.get(key) for o in objects]
+        try:
+            distinct = list(dict.fromkeys(values))
+        except TypeError:
+            # Unhashable values (lists, objects) are sent as they are.
+            columns[key] = values
+            continue
+
+        if len(distinct) == 1:
+            constants[key] = distinct[0]
+        elif (all(isinstance(v, str) for v in distinct) and
+              2 * len(distinct) <= len(values)):
+            index = {value: i for i, value in enumerate(distinct)}
+            dictionaries[key] = distinct
+            columns[key] = [index[v] for v in values]
+        else:
+            columns[key] = values
+
+    return json.dumps({'count': len(objects), 'keys': keys,
+                       'columns': columns, 'constants': constants,
+                       'dictionaries': dictionaries},
+                      separators=(',', ':'))
+
+
+def loads(body):
+    """Decode a list of objects from the columnar encoding.
+
+    Args:
+        body (str or bytes): The encoded list.
+
+    Returns:
+        list: The objects (dictionaries).
+
+    Raises:
+        ValueError: If body is not a valid encoding.
+
+    """
+    try:
+        data = json.loads(body)
+        count, keys = data['count'], data['keys']
+        columns = data['columns']
+        constants = data['constants']
+
+        for key, values in data['dictionaries'].items():
+            columns[key] = [values[i] for i in columns[key]]
+
+        values = [columns[key] if key in columns
+                  else repeat(constants[key], count) for key in keys]
+    except (KeyError, IndexError, TypeError) as e:
+        raise ValueError('Invalid columnar encoding: {!r}'.format(e))
+
+    if not keys:
+        return [{} for _ in range(count)]
+    return [dict(zip(keys, row)) for row in zip(*values)]
+
+
+def accepts(header):
+    """Return if an ``Accept`` header prefers the columnar encoding to JSON.
+
+    Args:
+        header (str): Value of the header, may be ``None``.
+
+    Returns:
+        bool: True if the columnar encoding should be sent.
+
+    """
+    if not header:
+        return False
+    accept = parse_accept_header(header, MIMEAccept)
+    return accept.best_match([JSON, COLUMNS]) == COLUMNS
+
+
+def decode(response):
+    """Decode the body of a response of another node, in either encoding.
+
+    Args:
+        response (:class:`requests.Response`): The response.
+
+    Returns:
+        The decoded body.
+
+    Raises:
+        ValueError: If the body is invalid.
+
+    """
+    if response.headers.get('Content-Type', '').startswith(COLUMNS):
+        return loads(response.content)
+    return response.json()
@@ -0,0 +1,157 @@
+import asyncio
+import json
+from unittest.mock import MagicMock
+
+import pytest
+from pytest_mock import mocker
+from starlette.testclient import TestClient
+
+import seventweets.asgi
+import seventweets.db
+
+# No database involved, see test_node.
+seventweets.db.pg8000 = MagicMock()
+
+
+TWEETS = [
+    {'id': 1, 'name': 'nzp', 'tweet': 'Hello, World!'},
+    {'id': 2, 'name': 'nzp', 'tweet': 'Hello, Again!'}
+]
+
+
+@pytest.fixture(scope='function')
+def client():
+    with TestClient(seventweets.asgi.app) as client:
+        yield client
+
+
+def test_passthrough(mocker, client):
+    mocker.patch.object(seventweets.asgi.flask_node.Storage, 'get_all_tweets')
+    seventweets.asgi.flask_node.Storage.get_all_tweets.return_value = json.dumps(
+        TWEETS)
+
+    response = client.get('/tweets')
+
+    assert response.json() == TWEETS
+    assert response.status_code == 200
+
+
+def test_search_all(mocker, client):
+    mocker.patch.object(seventweets.asgi.Storage, 'search')
+    seventweets.asgi.Storage.search.return_value = [TWEETS[0]]
+
+    Node = seventweets.registry.Registry._Node
+    mocker.patch.object(seventweets.asgi.Registry, 'nodes', return_value=[
+                        Node('node1', 'node1.example.com'),
+                        Node('node2', 'node2.example.com')])
+    mocker.patch.object(seventweets.asgi.Registry, '_breakers', {})
+    mocker.patch.object(seventweets.config.Config, 'SEARCH_DEADLINE', 0.2)
+
+    peer_tweet = {'id': 7, 'name': 'node1', 'tweet': 'Hello from afar!'}
+
+    async def search_peer(node, params, top, deadline):
+        assert params == {'content': 'Hello', 'limit': '50',
+                          'order': 'relevance'}
+        if node.name == 'node1':
+            top.add([peer_tweet])
+            return 1, 0.01
+        await asyncio.sleep(1)
+
+    mocker.patch.object(seventweets.asgi, '_search_peer',
+                        side_effect=search_peer)
+
+    response = client.get('/search?content=Hello&all=1&status=1')
+    decoded_response = response.json()
+
+    assert sorted(t['id'] for t in decoded_response['tweets']) == [1, 7]
+    statuses = {n['name']: n['status'] for n in decoded_response['nodes']}
+    assert statuses == {'node1': 'ok', 'node2': 'timeout'}
+    assert response.status_code == 200
+
+
+def test_join_network(mocker, client):
+    on_loop = []
+
+    def register(node):
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            on_loop.append(False)
+        else:
+            on_loop.append(True)
+
+    mocker.patch.object(seventweets.asgi.Registry, 'register',
+                        side_effect=register)
+    mocker.patch.object(seventweets.config.Config, 'API_TOKEN', 'test-token')
+    mocker.patch.object(seventweets.config.Config, 'NAME', 'me')
+    mocker.patch.object(seventweets.config.Config, 'ADDRESS', 'me.example.com')
+
+    node_list = [
+        {'name': 'test-node', 'address': 'node.example.com'},
+        {'name': 'node1', 'address': 'node1.example.com'},
+        {'name': 'node2', 'address': 'node2.example.com'},
+    ]
+    requests = []
+
+    async def request_json(method, address, path, data):
+        requests.append((method, address, path, data))
+        return node_list
+
+    peer_client = MagicMock()
+    peer_client.request_json.side_effect = request_json
+    mocker.patch.object(seventweets.asgi, '_client', peer_client)
+
+    data = '{"name": "test-node", "address": "node.example.com"}'
+
+    response = client.post('/join_network', content=data)
+    assert response.status_code == 401
+
+    response = client.post('/join_network', content=data,
+                           headers={'X-Api-Token': 'test-token'})
+
+    seventweets.asgi.Registry.register.assert_any_call(json.loads(data))
+    seventweets.asgi.Registry.register.assert_any_call(node_list[1])
+    seventweets.asgi.Registry.register.assert_any_call(node_list[2])
+    # Registering may write to the database, never on the event loop.
+    assert on_loop == [False, False, False]
+
+    body = '{"name": "me", "address": "me.example.com"}'
+    assert requests == [('POST', 'node.example.com', '/registry', body),
+                        ('POST', 'node1.example.com', '/registry', body),
+                        ('POST', 'node2.example.com', '/registry', body)]
+
+    summary = response.json()['nodes']
+    assert [n['status'] for n in summary] == ['ok', 'ok', 'ok']
+    assert response.status_code == 200
+
+
+def test_search_hedged(mocker, client):
+    mocker.patch.object(seventweets.asgi.Storage, 'search', return_value=[])
+
+    Node = seventweets.registry.Registry._Node
+    mocker.patch.object(seventweets.asgi.Registry, 'nodes', return_value=[
+                        Node('node1', 'node1.example.com')])
+    mocker.patch.object(seventweets.asgi.Registry, '_breakers', {})
+    mocker.patch.object(seventweets.config.Config, 'SEARCH_HEDGE_DELAY', 0.05)
+
+    peer_tweet = {'id': 7, 'name': 'node1', 'tweet': 'Hello from afar!'}
+    calls = []
+
+    async def search_peer(node, params, top, deadline):
+        calls.append(node.name)
+        if len(calls) == 1:
+            # The first request is stuck, the hedged one answers.
+            await asyncio.sleep(10)
+        top.add([peer_tweet], source=node.name)
+        return 1, 0.01
+
+    mocker.patch.object(seventweets.asgi, '_search_peer',
+                        side_effect=search_peer)
+
+    response = client.get('/search?all=1&status=1')
+    decoded_response = response.json()
+
+    assert calls == ['node1', 'node1']
+    assert decoded_response['tweets'] == [peer_tweet]
+    assert decoded_response['nodes'][0]['status'] == 'ok'
+    assert decoded_response['nodes'][0]['hedged']
@@ -0,0 +1,138 @@
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import MagicMock
+
+import pg8000
+import pytest
+
+from seventweets import batching
+import seventweets.db
+from seventweets.batching import WriteBatcher
+from seventweets.db import ConnectionPool
+from seventweets.db import InvalidInput
+from seventweets.db import PoolTimeout
+
+
+@pytest.fixture
+def cursor(mocker):
+    cursor = MagicMock()
+    mocker.patch('seventweets.batching.get_db_cursor').return_value\
+        .__enter__.return_value = cursor
+    return cursor
+
+
+@pytest.fixture
+def save_tweets(mocker):
+    def save(cursor, tweets):
+        return [{'id': int(tweet), 'name': 'me', 'tweet': tweet}
+                for tweet in tweets]
+
+    return mocker.patch.object(batching.Storage, 'save_tweets',
+                               side_effect=save)
+
+
+@pytest.fixture
+def batcher():
+    batcher = WriteBatcher(max_size=10, max_wait=0.5)
+    batcher.start()
+    yield batcher
+    batcher.stop()
+
+
+def test_save_tweet(cursor, save_tweets, batcher):
+    tweets = [str(i) for i in range(10)]
+
+    with ThreadPoolExecutor(max_workers=10) as executor:
+        results = list(executor.map(batcher.save_tweet, tweets))
+
+    # All in one batch, the batch was full before max_wait passed.
+    assert save_tweets.call_count == 1
+    assert sorted(save_tweets.call_args[0][1]) == tweets
+    assert [r['id'] for r in results] == list(range(10))
+
+
+def test_save_tweet_max_size(cursor, save_tweets):
+    batcher = WriteBatcher(max_size=2, max_wait=0.5)
+    for i in range(5):
+        batcher._queue.put(batching._Pending(str(i)))
+
+    batcher.start()
+    batcher.stop()
+
+    assert [args[1] for args, kwargs in save_tweets.call_args_list] == [
+        ['0', '1'], ['2', '3'], ['4']]
+
+
+def test_save_tweet_failed(cursor, save_tweets):
+    def save(cursor, tweets):
+        if 'bad' in tweets:
+            raise InvalidInput('value too long')
+        return [{'id': 1, 'name': 'me', 'tweet': tweet} for tweet in tweets]
+
+    save_tweets.side_effect = save
+    good = batching._Pending('good')
+    bad = batching._Pending('bad')
+    batcher = WriteBatcher(max_size=2)
+    batcher._queue.put(good)
+    batcher._queue.put(bad)
+
+    batcher.start()
+    batcher.stop()
+
+    # The batch failed, the good tweet is saved on its own.
+    assert save_tweets.call_count == 3
+    assert good.result['tweet'] == 'good'
+    assert isinstance(bad.error, InvalidInput)
+
+
+def test_save_tweet_pool_timeout(cursor, save_tweets):
+    save_tweets.side_effect = PoolTimeout
+    batch = [batching._Pending('a'), batching._Pending('b')]
+    batcher = WriteBatcher(max_size=2)
+    for pending in batch:
+        batcher._queue.put(pending)
+
+    batcher.start()
+    batcher.stop()
+
+    # Not an error of a tweet, the batch fails without saving one by one.
+    assert save_tweets.call_count == 1
+    assert all(isinstance(p.error, PoolTimeout) for p in batch)
+
+
+def test_save_tweet_timeout(save_tweets):
+    # The writer isn't running.
+    batcher = WriteBatcher(max_wait=0, timeout=0.05)
+
+    with pytest.raises(PoolTimeout):
+        batcher.save_tweet('a')
+
+    # Abandoned, not saved when the writer comes back.
+    batcher.start()
+    batcher.stop()
+    assert not save_tweets.called
+
+
+def test_save_tweet_not_encodable(mocker, save_tweets):
+    # Through the real get_db_cursor: pg8000 fails to encode the parameter
+    # before sending anything, that's the tweet's fault too.
+    pool = ConnectionPool(MagicMock, minconn=0, maxconn=1)
+    mocker.patch.object(seventweets.db, 'get_pool', return_value=pool)
+
+    def save(cursor, tweets):
+        if not all(isinstance(tweet, str) for tweet in tweets):
+            raise pg8000.ArrayContentNotHomogenousError(
+                'Array contains objects of different types')
+        return [{'id': 1, 'name': 'me', 'tweet': tweet} for tweet in tweets]
+
+    save_tweets.side_effect = save
+    good = batching._Pending('good')
+    bad = batching._Pending(123)
+    batcher = WriteBatcher(max_size=2)
+    batcher._queue.put(good)
+    batcher._queue.put(bad)
+
+    batcher.start()
+    batcher.stop()
+
+    assert good.result['tweet'] == 'good'
+    assert isinstance(bad.error, InvalidInput)
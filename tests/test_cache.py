@@ -0,0 +1,81 @@
+import sys
+import time
+from unittest.mock import MagicMock
+
+from seventweets.cache import LRUCache
+from seventweets.cache import MemcachedCache
+
+
+class TestLRUCache:
+
+    def test_get_set(self):
+        cache = LRUCache(maxsize=2, ttl=60)
+
+        assert cache.get('a') is None
+        cache.set('a', '1')
+        assert cache.get('a') == '1'
+
+        stats = cache.stats()
+        assert stats['hits'] == 1
+        assert stats['misses'] == 1
+
+    def test_eviction(self):
+        cache = LRUCache(maxsize=2, ttl=60)
+
+        cache.set('a', '1')
+        cache.set('b', '2')
+        cache.get('a')  # b is now least recently used.
+        cache.set('c', '3')
+
+        assert cache.get('b') is None
+        assert cache.get('a') == '1'
+        assert cache.get('c') == '3'
+        assert cache.stats()['evictions'] == 1
+
+    def test_expiry(self):
+        cache = LRUCache(maxsize=2, ttl=0.01)
+
+        cache.set('a', '1')
+        time.sleep(0.02)
+
+        assert cache.get('a') is None
+        assert cache.stats()['size'] == 0
+
+    def test_delete(self):
+        cache = LRUCache()
+
+        cache.set('a', '1')
+        cache.delete('a')
+        cache.delete('b')
+
+        assert cache.get('a') is None
+
+
+class TestMemcachedCache:
+
+    def test_errors_are_misses(self, mocker):
+        client = MagicMock()
+        hash_module = MagicMock()
+        hash_module.HashClient.return_value = client
+        mocker.patch.dict(sys.modules, {
+            'pymemcache': MagicMock(), 'pymemcache.client': MagicMock(),
+            'pymemcache.client.hash': hash_module})
+        cache = MemcachedCache([('localhost', 11211)], prefix='node1:')
+
+        assert hash_module.HashClient.call_args[1]['ignore_exc']
+
+        client.get.return_value = b'value'
+        assert cache.get('key') == 'value'
+        client.get.assert_called_with('node1:key')
+
+        # memcached is down, or refuses a value too large.
+        client.get.side_effect = ConnectionRefusedError
+        client.set.side_effect = Exception('SERVER_ERROR object too large')
+        client.delete.side_effect = ConnectionRefusedError
+
+        assert cache.get('key') is None
+        cache.set('key', 'value')
+        cache.delete('key')
+
+        assert cache.stats() == dict(backend='memcached', hits=1, misses=1,
+                                     errors=3)
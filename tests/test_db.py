@@ -0,0 +1,150 @@
+from unittest.mock import MagicMock
+import threading
+
+import pg8000
+import pytest
+
+from seventweets.db import ConnectionPool
+from seventweets.db import PoolTimeout
+import seventweets.db
+
+
+@pytest.fixture(scope='function')
+def connect():
+    return MagicMock(side_effect=lambda: MagicMock())
+
+
+class TestConnectionPool:
+
+    def test_reuse(self, connect):
+        pool = ConnectionPool(connect, minconn=0, maxconn=2)
+
+        c1 = pool.getconn()
+        pool.putconn(c1)
+        c2 = pool.getconn()
+
+        assert c1 is c2
+        assert connect.call_count == 1
+        assert pool.stats()['in_use'] == 1
+
+    def test_bounded(self, connect):
+        pool = ConnectionPool(connect, minconn=0, maxconn=2, wait_timeout=0.01)
+
+        pool.getconn()
+        pool.getconn()
+
+        with pytest.raises(PoolTimeout):
+            pool.getconn()
+
+        stats = pool.stats()
+        assert stats['size'] == 2
+        assert stats['timeouts'] == 1
+
+    def test_wait_for_free_connection(self, connect):
+        pool = ConnectionPool(connect, minconn=0, maxconn=1, wait_timeout=5)
+        c1 = pool.getconn()
+
+        timer = threading.Timer(0.05, pool.putconn, [c1])
+        timer.start()
+        c2 = pool.getconn()
+        timer.join()
+
+        assert c1 is c2
+        assert pool.stats()['waits'] >= 1
+
+    def test_discard(self, connect):
+        pool = ConnectionPool(connect, minconn=0, maxconn=1)
+
+        c1 = pool.getconn()
+        pool.putconn(c1, discard=True)
+        c2 = pool.getconn()
+
+        c1.close.assert_called_once_with()
+        assert c1 is not c2
+        assert pool.stats()['discarded'] == 1
+
+    def test_reconnect_on_failed_check(self, connect):
+        pool = ConnectionPool(connect, minconn=0, maxconn=1, check_interval=0)
+
+        c1 = pool.getconn()
+        c1.cursor.return_value.execute.side_effect = Exception('gone')
+        pool.putconn(c1)
+        c2 = pool.getconn()
+
+        assert c1 is not c2
+        assert pool.stats()['reconnects'] == 1
+        assert pool.stats()['size'] == 1
+
+    def test_idle_timeout(self, connect):
+        pool = ConnectionPool(connect, minconn=1, maxconn=3, idle_timeout=0)
+
+        conns = [pool.getconn() for _ in range(3)]
+        for c in conns:
+            pool.putconn(c)
+
+        # The minimum number of connections is kept open.
+        assert pool.stats()['size'] == 1
+        assert pool.stats()['expired'] == 2
+
+    def test_failed_connect_frees_slot(self):
+        pool = ConnectionPool(MagicMock(side_effect=Exception('refused')),
+                              minconn=0, maxconn=1)
+
+        with pytest.raises(Exception):
+            pool.getconn()
+
+        assert pool.stats()['size'] == 0
+
+
+def test_get_db_cursor(mocker, connect):
+    pool = ConnectionPool(connect, minconn=0, maxconn=1)
+    mocker.patch.object(seventweets.db, 'get_pool', return_value=pool)
+
+    with seventweets.db.get_db_cursor() as cursor:
+        cursor.execute('SELECT 1')
+
+    connection = pool.getconn()
+    connection.commit.assert_called_once_with()
+
+    pool.putconn(connection)
+    with pytest.raises(ValueError):
+        with seventweets.db.get_db_cursor():
+            raise ValueError
+
+    connection.rollback.assert_called_once_with()
+    assert pool.stats()['idle'] == 1
+
+
+def test_get_db_cursor_timeout(mocker, connect):
+    pool = ConnectionPool(connect, minconn=0, maxconn=1)
+    mocker.patch.object(seventweets.db, 'get_pool', return_value=pool)
+
+    with pytest.raises(seventweets.db.QueryTimeout):
+        with seventweets.db.get_db_cursor(timeout=0.25) as cursor:
+            raise Exception({'S': 'ERROR', 'C': '57014',
+                             'M': 'canceling statement due to statement '
+                                  'timeout'})
+
+    cursor.execute.assert_called_once_with(
+        "SELECT set_config('statement_timeout', %s, true)", ('250',))
+
+
+def test_get_db_cursor_invalid(mocker, connect):
+    pool = ConnectionPool(connect, minconn=0, maxconn=1)
+    mocker.patch.object(seventweets.db, 'get_pool', return_value=pool)
+
+    with pytest.raises(seventweets.db.InvalidInput):
+        with seventweets.db.get_db_cursor():
+            raise Exception({'S': 'ERROR', 'C': '22001',
+                             'M': 'value too long for type character '
+                                  'varying(500)'})
+
+    # Not sent at all, pg8000 couldn't encode a parameter.
+    with pytest.raises(seventweets.db.InvalidInput):
+        with seventweets.db.get_db_cursor():
+            raise pg8000.ArrayContentNotHomogenousError(
+                'Array contains objects of different types')
+
+    with pytest.raises(ValueError):
+        with seventweets.db.get_db_cursor():
+            raise ValueError({'C': '08006'})
@@ -0,0 +1,249 @@
+import math
+import random
+import threading
+import time
+from unittest.mock import MagicMock
+
+import pytest
+
+from seventweets.gossip import ALIVE, DEAD, SUSPECT
+from seventweets.gossip import FileLock
+from seventweets.gossip import Gossip
+
+
+class Clock:
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class Network:
+    # In-process transport connecting simulated nodes by address.
+
+    def __init__(self):
+        self.nodes = {}
+        self.down = set()
+        self.cut = set()  # (from, to) address pairs that can't talk.
+
+    def transport(self, address):
+        network = self
+
+        class Transport:
+
+            def ping(self, target, message):
+                return network.deliver(address, target, message)
+
+            def ping_req(self, helper, target, message):
+                network.deliver(address, helper, message)
+                return network.nodes[helper].handle_ping_req(
+                    dict(message, target=target))
+
+        return Transport()
+
+    def deliver(self, source, target, message):
+        if (target in self.down or source in self.down or
+                (source, target) in self.cut):
+            raise ConnectionError(target)
+        return self.nodes[target].handle_ping(message)
+
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+
+@pytest.fixture
+def network():
+    return Network()
+
+
+def make_nodes(network, clock, n, seed=0):
+    rng = random.Random(seed)
+    nodes = []
+    for i in range(n):
+        address = 'node{}.example.com'.format(i)
+        node = Gossip('node{}'.format(i), address, network.transport(address),
+                      suspicion_timeout=5, clock=clock,
+                      rng=random.Random(rng.random()), incarnation=1)
+        network.nodes[address] = node
+        nodes.append(node)
+    return nodes
+
+
+def run(nodes, clock, rounds, network=None):
+    for _ in range(rounds):
+        clock.now += 1
+        for node in nodes:
+            if network is None or node.address not in network.down:
+                node.tick()
+
+
+def names(node):
+    return {m['name'] for m in node.members()}
+
+
+def test_join_converges(network, clock):
+    nodes = make_nodes(network, clock, 32)
+
+    # Every node only knows the first one.
+    for node in nodes[1:]:
+        node.add_member(nodes[0].name, nodes[0].address)
+
+    run(nodes, clock, 4 * math.ceil(math.log2(len(nodes))))
+
+    for node in nodes:
+        assert names(node) == {n.name for n in nodes} - {node.name}
+
+
+def test_dead_node_evicted(network, clock):
+    evicted = []
+    nodes = make_nodes(network, clock, 8)
+    for node in nodes:
+        for other in nodes:
+            if other is not node:
+                node.add_member(other.name, other.address)
+    nodes[0].on_dead = evicted.append
+
+    network.down.add(nodes[7].address)
+    run(nodes, clock, 20, network)
+
+    for node in nodes[:7]:
+        assert nodes[7].name not in names(node)
+    assert evicted == [nodes[7].name]
+
+
+def test_indirect_probe(network, clock):
+    nodes = make_nodes(network, clock, 4)
+    for node in nodes:
+        for other in nodes:
+            if other is not node:
+                node.add_member(other.name, other.address)
+
+    # Node 0 can't reach node 1 directly, but others can.
+    network.cut.add((nodes[0].address, nodes[1].address))
+    run(nodes, clock, 20)
+
+    for node in nodes:
+        assert all(m['state'] == ALIVE for m in node.members())
+
+
+def test_suspicion_refuted(network, clock):
+    nodes = make_nodes(network, clock, 3)
+    for node in nodes:
+        for other in nodes:
+            if other is not node:
+                node.add_member(other.name, other.address)
+
+    nodes[0]._apply(dict(name=nodes[1].name, address=nodes[1].address,
+                         state=SUSPECT, incarnation=1), disseminate=True)
+    assert {m['name']: m['state'] for m in nodes[0].members()}[
+        nodes[1].name] == SUSPECT
+
+    run(nodes, clock, 3)
+
+    assert nodes[1].incarnation == 2
+    for node in (nodes[0], nodes[2]):
+        states = {m['name']: m for m in node.members()}
+        assert states[nodes[1].name]['state'] == ALIVE
+        assert states[nodes[1].name]['incarnation'] == 2
+
+
+def test_precedence(clock):
+    node = Gossip('a', 'a.example.com', None, clock=clock, incarnation=1)
+    update = dict(name='b', address='b.example.com', incarnation=3)
+
+    node._apply(dict(update, state=ALIVE), disseminate=False)
+    node._apply(dict(update, state=ALIVE, incarnation=2), disseminate=False)
+    assert node.members()[0]['incarnation'] == 3
+
+    node._apply(dict(update, state=SUSPECT), disseminate=False)
+    assert node.members()[0]['state'] == SUSPECT
+
+    # Same incarnation can't bring a suspect back, a newer one can.
+    node._apply(dict(update, state=ALIVE), disseminate=False)
+    assert node.members()[0]['state'] == SUSPECT
+    node._apply(dict(update, state=ALIVE, incarnation=4), disseminate=False)
+    assert node.members()[0]['state'] == ALIVE
+
+    node._apply(dict(update, state=DEAD, incarnation=4), disseminate=False)
+    assert node.members() == []
+
+
+def test_callbacks(clock):
+    events = []
+    node = Gossip('a', 'a.example.com', None, clock=clock, incarnation=1,
+                  on_alive=lambda n, a: events.append(('alive', n, a)),
+                  on_dead=lambda n: events.append(('dead', n)))
+
+    node.add_member('b', 'b.example.com')
+    node.remove_member('b')
+    node._apply(dict(name='b', address='b.example.com', state=ALIVE,
+                     incarnation=1), disseminate=False)
+    node._notify()
+
+    assert events == [('alive', 'b', 'b.example.com'), ('dead', 'b'),
+                      ('alive', 'b', 'b.example.com')]
+
+
+def test_callbacks_unlocked(network, clock):
+    locked = []
+    a, b = make_nodes(network, clock, 2)
+
+    def on_alive(name, address):
+        # Registering may write to the database, the state isn't locked
+        # meanwhile.
+        def try_lock():
+            acquired = a._lock.acquire(timeout=1)
+            locked.append(not acquired)
+            if acquired:
+                a._lock.release()
+
+        thread = threading.Thread(target=try_lock)
+        thread.start()
+        thread.join()
+
+    a.on_alive = on_alive
+    b.add_member(a.name, a.address)
+
+    # Answering b's ping only queues the callback, a's next period runs it.
+    b.tick()
+    assert locked == []
+    a.tick()
+    assert locked == [False]
+
+
+def test_not_leader(network, clock):
+    events = []
+    a, b = make_nodes(network, clock, 2)
+    a.transport = MagicMock()
+    a.on_alive = lambda name, address: events.append(name)
+    a.leader = lambda: False
+    a.period = 0.01
+    b.add_member(a.name, a.address)
+    b.tick()
+
+    a.start()
+    time.sleep(0.1)
+    a.stop()
+
+    # Probing is left to the leader, changes learned from pings are still
+    # handled.
+    assert not a.transport.ping.called
+    assert events == [b.name]
+
+
+def test_file_lock(tmp_path):
+    path = str(tmp_path / 'gossip.lock')
+    first = FileLock(path)
+    second = FileLock(path)
+
+    assert first.held()
+    assert first.held()
+    assert not second.held()
+
+    first.release()
+    assert second.held()
+    assert not first.held()
@@ -1,8 +1,10 @@
+import gzip
 import json
 from unittest.mock import MagicMock
 from unittest.mock import patch
 from unittest.mock import call
 import sys
+import time
 
 import pytest
 from pytest_mock import mocker
@@ -13,6 +15,16 @@ sys.modules['pg8000'] = MagicMock()
 
 import seventweets.node
 
+# Other test modules may have imported seventweets.db with the real driver
+# already, so nuke it there as well.
+seventweets.db.pg8000 = MagicMock()
+
+@pytest.fixture(autouse=True)
+def search_cache(mocker):
+    cache = seventweets.node.SearchCache()
+    mocker.patch.object(seventweets.node, '_search_cache', cache)
+    return cache
+
 
 MIME_TYPE = 'application/json'
 test_client = seventweets.node.app.test_client()
@@ -111,6 +123,28 @@ def test_save_tweet(mocker):
     assert response.mimetype == MIME_TYPE
 
 
+def test_save_tweet_batched(mocker):
+    mocker.patch.object(seventweets.config.Config, 'WRITE_BATCH', True)
+    mocker.patch.object(seventweets.config.Config, 'API_TOKEN', 'test-token')
+    batcher = mocker.patch.object(seventweets.node.batching, 'get_batcher')
+    batcher.return_value.save_tweet.return_value = TWEETS[1]
+
+    response = test_client.post('/tweets',
+                                data='{"tweet": "New tweet!"}',
+                                headers={'X-Api-Token': 'test-token'})
+
+    batcher.return_value.save_tweet.assert_called_once_with('New tweet!')
+    assert json.loads(response.get_data(as_text=True)) == TWEETS[1]
+    assert response.status_code == 201
+
+    # Invalid tweets never join a batch.
+    for data in ('{"tweet": 123}', '{"tweet": ["a"]}', '{}', 'tweet'):
+        response = test_client.post('/tweets', data=data,
+                                    headers={'X-Api-Token': 'test-token'})
+        assert response.status_code == 400
+    assert batcher.return_value.save_tweet.call_count == 1
+
+
 def test_delete_tweet(mocker):
     mocker.patch.object(seventweets.node.Storage, 'delete_tweet')
     seventweets.node.Storage.delete_tweet.return_value = True
@@ -174,13 +208,22 @@ def test_delete_node(mocker):
 
 def test_join_network(mocker):
     mocker.patch.object(seventweets.node.Registry, 'register')
-    mocker.patch.object(seventweets.node.requests, 'post')
+    client = mocker.patch.object(seventweets.node.peers, 'get_client')
 
     node_list = [
+        {'name': 'test-node', 'address': 'node.example.com'},
         {'name': 'node1', 'address': 'node1.example.com'},
         {'name': 'node2', 'address': 'node2.example.com'},
     ]
-    seventweets.node.requests.post.return_value = json.dumps(node_list)
+
+    def post(address, path, data):
+        if address == 'node2.example.com':
+            raise seventweets.node.requests.HTTPError('500 Server Error')
+        response = MagicMock(headers={})
+        response.json.return_value = node_list
+        return response
+
+    client.return_value.post.side_effect = post
 
     mocker.patch.object(seventweets.config.Config, 'API_TOKEN')
     seventweets.config.Config.API_TOKEN = 'test-token'
@@ -197,18 +240,573 @@ def test_join_network(mocker):
                                 headers={'X-Api-Token': 'test-token'})
 
     register_calls = [call(json.loads(data)),
-                      call(node_list[0]),
-                      call(node_list[1]),]
+                      call(node_list[1]),
+                      call(node_list[2]),]
     seventweets.node.Registry.register.assert_has_calls(register_calls)
 
     body = '{"name": "me", "address": "me.example.com"}'
     request_post_calls = [
-        call('http://node.example.com/registry', data=body),
-        call('http://{address}/registry'.format(address=node_list[0]['address']),
-             data=body),
-        call('http://{address}/registry'.format(address=node_list[1]['address']),
-             data=body)
+        call('node.example.com', '/registry', data=body),
+        call(node_list[1]['address'], '/registry', data=body),
+        call(node_list[2]['address'], '/registry', data=body),
     ]
-    seventweets.node.requests.post.assert_has_calls(request_post_calls)
+    client.return_value.post.assert_has_calls(request_post_calls,
+                                              any_order=True)
+    # The initial node is not registered to twice.
+    assert client.return_value.post.call_count == 3
+
+    summary = json.loads(response.get_data(as_text=True))['nodes']
+    assert [(n['name'], n['status']) for n in summary] == [
+        ('test-node', 'ok'), ('node1', 'ok'), ('node2', 'error')]
+    assert response.status_code == 200
+
+
+def test_join_network_unreachable(mocker):
+    mocker.patch.object(seventweets.node.Registry, 'register')
+    client = mocker.patch.object(seventweets.node.peers, 'get_client')
+    client.return_value.post.side_effect = (
+        seventweets.node.requests.ConnectionError('refused'))
+
+    mocker.patch.object(seventweets.config.Config, 'API_TOKEN')
+    seventweets.config.Config.API_TOKEN = 'test-token'
+
+    response = test_client.post(
+        '/join_network',
+        data='{"name": "test-node", "address": "node.example.com"}',
+        headers={'X-Api-Token': 'test-token'})
+
+    summary = json.loads(response.get_data(as_text=True))['nodes']
+    assert summary[0]['status'] == 'error'
+    assert response.status_code == 502
+
+
+def test_get_pool_stats(mocker):
+    mocker.patch.object(seventweets.config.Config, 'API_TOKEN')
+    seventweets.config.Config.API_TOKEN = 'test-token'
+
+    response = test_client.get('/private/pool',
+                               headers={'X-Api-Token': 'test-token'})
+
+    stats = json.loads(response.get_data(as_text=True))
+    assert 'in_use' in stats
+    assert response.status_code == 200
+
+
+def test_search_all(mocker):
+    mocker.patch.object(seventweets.node.Storage, 'search')
+    seventweets.node.Storage.search.return_value = [dict(TWEETS[0], rank=0.5)]
+
+    Node = seventweets.registry.Registry._Node
+    mocker.patch.object(seventweets.node.Registry, 'nodes', return_value=[
+                        Node('node1', 'node1.example.com'),
+                        Node('node2', 'node2.example.com'),
+                        Node('node3', 'node3.example.com')])
+    mocker.patch.object(seventweets.node.Registry, '_breakers', {})
+
+    peer_tweets = [{'id': 7, 'name': 'node1', 'tweet': 'Hello from afar!',
+                    'rank': 0.9},
+                   {'id': 8, 'name': 'node1', 'tweet': 'Hello again!',
+                    'rank': 0.1}]
+
+    def peer_get(address, path, params, headers, timeout, retry):
+        if address == 'node1.example.com':
+            response = MagicMock(headers={})
+            response.json.return_value = peer_tweets
+            return response
+        elif address == 'node2.example.com':
+            raise seventweets.node.requests.ConnectionError('refused')
+        else:
+            time.sleep(1)
+
+    client = mocker.patch.object(seventweets.node.peers, 'get_client')
+    client.return_value.get.side_effect = peer_get
+    mocker.patch.object(seventweets.config.Config, 'SEARCH_DEADLINE', 0.2)
+
+    response = test_client.get(
+        '/search?content=Hello&all=1&status=1&limit=2')
+    decoded_response = json.loads(response.get_data(as_text=True))
+
+    args, kwargs = client.return_value.get.call_args_list[0]
+    assert args == ('node1.example.com', '/search')
+    assert kwargs['params'] == {'content': 'Hello', 'limit': '2',
+                                'order': 'relevance'}
+    # Peers are given what's left of the deadline.
+    assert 0 < kwargs['timeout'] <= 0.2
+    assert 0 < int(kwargs['headers']['X-Deadline-Ms']) <= 200
+    # Hedging, not retries, covers slow peers.
+    assert kwargs['retry'] is False
+
+    # Best two of all, by rank.
+    assert [t['id'] for t in decoded_response['tweets']] == [7, 1]
+
+    statuses = {n['name']: n['status'] for n in decoded_response['nodes']}
+    assert statuses == {'node1': 'ok', 'node2': 'error', 'node3': 'timeout'}
+    assert response.status_code == 200
+
+
+def test_get_tweets_page(mocker):
+    mocker.patch.object(seventweets.node.Storage, 'get_tweets')
+    seventweets.node.Storage.get_tweets.return_value = json.dumps(TWEETS[1:])
+
+    response = test_client.get('/tweets?limit=1&after_id=1')
+
+    args, kwargs = seventweets.node.Storage.get_tweets.call_args
+    assert args[1:] == (1, None, 1)
+    assert json.loads(response.get_data(as_text=True)) == TWEETS[1:]
+    assert response.status_code == 200
+
+    response = test_client.get('/tweets?limit=many')
+    assert response.status_code == 400
+
+
+def test_get_tweets_stream(mocker):
+    mocker.patch.object(seventweets.node.Storage, 'iter_tweets')
+    seventweets.node.Storage.iter_tweets.return_value = iter(
+        json.dumps(t) for t in TWEETS)
+
+    response = test_client.get('/tweets?stream=1')
+
+    assert json.loads(response.get_data(as_text=True)) == TWEETS
+    assert response.status_code == 200
+    assert response.mimetype == MIME_TYPE
+
+
+def test_search(mocker):
+    mocker.patch.object(seventweets.node.Storage, 'search')
+    seventweets.node.Storage.search.return_value = TWEETS
+
+    response = test_client.get(
+        '/search?content=Hello&created_to=2017-06-01&limit=10')
+
+    args, kwargs = seventweets.node.Storage.search.call_args
+    assert kwargs == {'content': 'Hello', 'created_from': None,
+                      'created_to': '2017-06-01', 'limit': 10,
+                      'order': 'relevance'}
+    assert json.loads(response.get_data(as_text=True)) == TWEETS
+    assert response.status_code == 200
+
+    response = test_client.get('/search?order=random')
+    assert response.status_code == 400
+
+
+def test_search_stream(mocker):
+    mocker.patch.object(seventweets.node.Storage, 'search')
+    mocker.patch.object(seventweets.node.Storage, 'iter_search')
+    seventweets.node.Storage.iter_search.return_value = iter(
+        json.dumps(t) for t in TWEETS)
+
+    # Without a limit, the result is streamed instead of built in memory.
+    response = test_client.get('/search?content=Hello')
+
+    assert json.loads(response.get_data(as_text=True)) == TWEETS
+    assert response.status_code == 200
+    args, kwargs = seventweets.node.Storage.iter_search.call_args
+    assert args[1] == seventweets.node.Config.STREAM_BATCH_SIZE
+    assert kwargs['content'] == 'Hello'
+    assert not seventweets.node.Storage.search.called
+
+
+def test_search_stream_invalid(mocker):
+    def iter_search(cursor, batch_size, **params):
+        # The server rejects the date when the cursor is declared.
+        raise Exception({'S': 'ERROR', 'C': '22007',
+                         'M': 'invalid input syntax for type timestamp'})
+        yield
+
+    mocker.patch.object(seventweets.node.Storage, 'iter_search',
+                        side_effect=iter_search)
+
+    response = test_client.get('/search?created_from=yesterdayish')
+
+    assert response.status_code == 400
+    assert response.get_data(as_text=True) == '{}'
+
+
+def test_get_cache_stats(mocker):
+    mocker.patch.object(seventweets.config.Config, 'API_TOKEN')
+    seventweets.config.Config.API_TOKEN = 'test-token'
+
+    response = test_client.get('/private/cache',
+                               headers={'X-Api-Token': 'test-token'})
+
+    stats = json.loads(response.get_data(as_text=True))
+    assert 'hits' in stats
+    assert 'hits' in stats['search']
+    assert response.status_code == 200
+
+
+def test_get_tweets_not_modified(mocker):
+    mocker.patch.object(seventweets.node.Storage, 'version',
+                        return_value='v1')
+    mocker.patch.object(seventweets.node.Storage, 'get_all_tweets')
+    seventweets.node.Storage.get_all_tweets.return_value = json.dumps(TWEETS)
+
+    response = test_client.get('/tweets')
+    etag = response.headers['ETag']
+
+    assert etag == '"v1"'
+    assert response.status_code == 200
+
+    response = test_client.get('/tweets', headers={'If-None-Match': etag})
+
+    assert response.status_code == 304
+    assert seventweets.node.Storage.get_all_tweets.call_count == 1
+
+    seventweets.node.Storage.version.return_value = 'v2'
+    response = test_client.get('/tweets', headers={'If-None-Match': etag})
+
+    assert response.status_code == 200
+    assert response.headers['ETag'] == '"v2"'
+
+
+def test_get_tweet_not_modified(mocker):
+    mocker.patch.object(seventweets.node.Storage, 'version',
+                        return_value='v1')
+    mocker.patch.object(seventweets.node.Storage, 'get_tweet')
+
+    response = test_client.get('/tweets/1', headers={'If-None-Match': '"v1"'})
+
+    assert response.status_code == 304
+    assert not seventweets.node.Storage.get_tweet.called
+
+
+def test_save_tweets(mocker):
+    mocker.patch.object(seventweets.node.Storage, 'save_tweets')
+    seventweets.node.Storage.save_tweets.return_value = TWEETS
+
+    mocker.patch.object(seventweets.config.Config, 'API_TOKEN')
+    seventweets.config.Config.API_TOKEN = 'test-token'
+
+    data = json.dumps([{'tweet': 'Hello, World!'},
+                       {'text': 'Wrong key'},
+                       {'tweet': 'Hello, Again!'}])
+    response = test_client.post('/tweets/batch', data=data,
+                                headers={'X-Api-Token': 'test-token'})
+
+    args, kwargs = seventweets.node.Storage.save_tweets.call_args
+    assert args[1] == ['Hello, World!', 'Hello, Again!']
+
+    decoded_response = json.loads(response.get_data(as_text=True))
+    assert [t['index'] for t in decoded_response['saved']] == [0, 2]
+    assert [t['id'] for t in decoded_response['saved']] == [1, 2]
+    assert [e['index'] for e in decoded_response['errors']] == [1]
+    assert response.status_code == 201
+
+
+def test_save_tweets_rejected(mocker):
+    def save_tweets(cursor, tweets):
+        if 'Rejected' in tweets:
+            raise seventweets.node.InvalidInput('value too long')
+        return [dict(TWEETS[0], tweet=tweet) for tweet in tweets]
+
+    save = mocker.patch.object(seventweets.node.Storage, 'save_tweets',
+                               side_effect=save_tweets)
+    mocker.patch.object(seventweets.config.Config, 'API_TOKEN', 'test-token')
+
+    data = json.dumps([{'tweet': 'Hello, World!'},
+                       {'tweet': 'Rejected'},
+                       {'tweet': 'Nul\u0000'},
+                       {'tweet': 'Hello, Again!'}])
+    response = test_client.post('/tweets/batch', data=data,
+                                headers={'X-Api-Token': 'test-token'})
+
+    # The batch, then its valid items one by one.
+    assert save.call_count == 4
+    decoded_response = json.loads(response.get_data(as_text=True))
+    assert [t['index'] for t in decoded_response['saved']] == [0, 3]
+    assert decoded_response['errors'] == [
+        {'index': 1, 'error': 'value too long'},
+        {'index': 2, 'error': 'Tweet contains a NUL character'}]
+    assert response.status_code == 201
+
+
+def test_save_tweets_ndjson(mocker):
+    mocker.patch.object(seventweets.node.Storage, 'save_tweets')
+    seventweets.node.Storage.save_tweets.return_value = TWEETS[:1]
+
+    mocker.patch.object(seventweets.config.Config, 'API_TOKEN')
+    seventweets.config.Config.API_TOKEN = 'test-token'
+
+    data = '{"tweet": "Hello, World!"}\n{"tweet": \n'
+    response = test_client.post('/tweets/batch', data=data,
+                                content_type='application/x-ndjson',
+                                headers={'X-Api-Token': 'test-token'})
+
+    args, kwargs = seventweets.node.Storage.save_tweets.call_args
+    assert args[1] == ['Hello, World!']
+
+    decoded_response = json.loads(response.get_data(as_text=True))
+    assert decoded_response['errors'] == [{'index': 1,
+                                           'error': 'Invalid JSON'}]
+    assert response.status_code == 201
+
+
+def test_gossip_ping(mocker):
+    response = test_client.post('/gossip/ping', data='{}')
+    assert response.status_code == 404
+
+    gossip = MagicMock()
+    gossip.handle_ping.return_value = {'from': {'name': 'node1'},
+                                       'updates': []}
+    mocker.patch('seventweets.node.get_gossip', return_value=gossip)
+
+    message = {'from': {'name': 'node2', 'address': 'node2.example.com',
+                        'incarnation': 1},
+               'updates': []}
+    response = test_client.post('/gossip/ping', data=json.dumps(message))
+
+    assert response.status_code == 200
+    assert json.loads(response.get_data(as_text=True))['from'] == {
+        'name': 'node1'}
+    gossip.handle_ping.assert_called_once_with(message)
+
+    gossip.handle_ping_req.side_effect = ConnectionError()
+    response = test_client.post('/gossip/ping_req', data=json.dumps(message))
+    assert response.status_code == 504
+
+
+def test_peer_params():
+    params = seventweets.node._search_params({'limit': '0', 'all': '1'})
+
+    assert seventweets.node._peer_params(params) == {'limit': '0',
+                                                     'order': 'newest'}
+
+
+def test_search_all_breaker(mocker):
+    mocker.patch.object(seventweets.node.Storage, 'search', return_value=[])
+
+    Node = seventweets.registry.Registry._Node
+    mocker.patch.object(seventweets.node.Registry, 'nodes', return_value=[
+                        Node('node1', 'node1.example.com')])
+    mocker.patch.object(seventweets.node.Registry, '_breakers', {})
+    mocker.patch.object(seventweets.config.Config, 'BREAKER_THRESHOLD', 2)
+
+    client = mocker.patch.object(seventweets.node.peers, 'get_client')
+    client.return_value.get.side_effect = \
+        seventweets.node.requests.ConnectionError('refused')
+
+    for status in ('error', 'error', 'skipped'):
+        response = test_client.get('/search?all=1&status=1')
+        decoded_response = json.loads(response.get_data(as_text=True))
+        assert decoded_response['nodes'][0]['status'] == status
+
+    assert client.return_value.get.call_count == 2
+
+    response = test_client.get('/private/nodes')
+    assert json.loads(response.get_data(as_text=True))[0]['breaker'] == {
+        'state': 'open', 'failures': 2}
+
+
+def test_search_deadline(mocker):
+    mocker.patch.object(seventweets.node.Storage, 'search', return_value=[])
+    cursor = mocker.patch.object(seventweets.node, 'get_db_cursor')
+
+    response = test_client.get('/search', headers={'X-Deadline-Ms': '1500'})
+
+    assert response.status_code == 200
+    cursor.assert_called_once_with(timeout=1.5)
+
+    response = test_client.get('/search', headers={'X-Deadline-Ms': '0'})
+    assert response.status_code == 504
+
+    cursor.side_effect = seventweets.node.QueryTimeout
+    response = test_client.get('/search?limit=10')
+    assert response.status_code == 504
+
+
+def test_search_all_cached(mocker, search_cache):
+    mocker.patch.object(seventweets.node.Storage, 'search', return_value=[])
+
+    Node = seventweets.registry.Registry._Node
+    mocker.patch.object(seventweets.node.Registry, 'nodes', return_value=[
+                        Node('node1', 'node1.example.com')])
+    mocker.patch.object(seventweets.node.Registry, '_breakers', {})
 
+    peer_tweet = {'id': 7, 'name': 'node1', 'tweet': 'Hello from afar!'}
+    client = mocker.patch.object(seventweets.node.peers, 'get_client')
+    client.return_value.get.return_value.headers = {}
+    client.return_value.get.return_value.json.return_value = [peer_tweet]
+
+    response = test_client.get('/search?content=Hello&all=1&status=1')
+    assert 'cached' not in json.loads(
+        response.get_data(as_text=True))['nodes'][0]
+
+    # Same search, differently spelled.
+    response = test_client.get('/search?content=hello++&all=1&status=1')
+    decoded_response = json.loads(response.get_data(as_text=True))
+
+    assert client.return_value.get.call_count == 1
+    assert decoded_response['tweets'] == [peer_tweet]
+    assert decoded_response['nodes'][0]['cached'] == 'fresh'
+
+    # Stale results are used, and refreshed in the background.
+    search_cache.ttl = 0.01
+    time.sleep(0.02)
+    response = test_client.get('/search?content=Hello&all=1&status=1')
+    decoded_response = json.loads(response.get_data(as_text=True))
+
+    assert decoded_response['nodes'][0]['cached'] == 'stale'
+    assert decoded_response['tweets'] == [peer_tweet]
+    for _ in range(100):
+        if client.return_value.get.call_count == 2:
+            break
+        time.sleep(0.01)
+    assert client.return_value.get.call_count == 2
+
+
+def test_get_timeline(mocker):
+    mocker.patch.object(seventweets.node.Storage, 'get_timeline',
+                        return_value=[dict(TWEETS[0], seq=3)])
+
+    response = test_client.get('/timeline?limit=1&before=4')
+
+    args, kwargs = seventweets.node.Storage.get_timeline.call_args
+    assert args[1:] == (1, 4)
+    assert json.loads(response.get_data(as_text=True)) == [
+        dict(TWEETS[0], seq=3)]
     assert response.status_code == 200
+
+
+def test_save_subscription(mocker):
+    mocker.patch.object(seventweets.node.Config, 'PUSH', True)
+    subscribe = mocker.patch.object(seventweets.node.push, 'subscribe',
+                                    return_value=(100, 7))
+
+    response = test_client.post('/subscriptions', data=json.dumps(
+        {'name': 'node1', 'address': 'node1.example.com'}))
+
+    assert subscribe.call_args[0][1:] == ('node1', 'node1.example.com', None)
+    assert json.loads(response.get_data(as_text=True)) == {'cursor': '100-7'}
+    assert response.status_code == 201
+
+    response = test_client.post('/subscriptions', data=json.dumps(
+        {'name': 'node1', 'address': 'node1.example.com', 'since': '90-1'}))
+    assert subscribe.call_args[0][1:] == ('node1', 'node1.example.com',
+                                          (90, 1))
+
+    response = test_client.post('/subscriptions', data='{}')
+    assert response.status_code == 400
+
+    response = test_client.post('/subscriptions', data=json.dumps(
+        {'name': 'node1', 'address': 'node1.example.com', 'since': 'x'}))
+    assert response.status_code == 400
+
+    mocker.patch.object(seventweets.node.Config, 'PUSH', False)
+    response = test_client.post('/subscriptions', data=json.dumps(
+        {'name': 'node1', 'address': 'node1.example.com'}))
+    assert response.status_code == 404
+
+
+def test_receive_tweets(mocker):
+    mocker.patch.object(seventweets.node.Config, 'TIMELINE', True)
+    mocker.patch.object(seventweets.node.Registry, 'nodes', return_value=[
+        seventweets.node.Registry._Node('nzp', 'nzp.example.com')])
+    save = mocker.patch.object(seventweets.node.Storage, 'save_timeline',
+                               return_value=True)
+
+    body = {'name': 'nzp', 'since': '100-3', 'cursor': '101-2',
+            'tweets': TWEETS}
+    response = test_client.post('/inbox', data=json.dumps(body))
+
+    assert response.status_code == 204
+    args, kwargs = save.call_args
+    assert args[1:] == ('nzp', TWEETS, (100, 3), (101, 2))
+
+    # The timeline isn't at since, the tweets are just added.
+    save.return_value = False
+    response = test_client.post('/inbox', data=json.dumps(body))
+    assert response.status_code == 204
+    args, kwargs = save.call_args
+    assert args[1:] == ('nzp', TWEETS)
+
+    response = test_client.post('/inbox', data=json.dumps(
+        dict(body, name='stranger')))
+    assert response.status_code == 403
+
+    response = test_client.post('/inbox', data=json.dumps(
+        dict(body, tweets=[{'id': '1', 'tweet': 'a'}])))
+    assert response.status_code == 400
+
+    response = test_client.post('/inbox', data=json.dumps(
+        dict(body, since=3)))
+    assert response.status_code == 400
+
+
+def test_save_retweet(mocker):
+    mocker.patch.object(seventweets.node.Registry, 'nodes', return_value=[
+        seventweets.node.Registry._Node('node1', 'node1.example.com')])
+    get_origin = mocker.patch.object(seventweets.node.Storage, 'get_origin',
+                                     return_value=None)
+    save_origin = mocker.patch.object(seventweets.node.Storage, 'save_origin')
+    mocker.patch.object(seventweets.node.Storage, 'save_retweet',
+                        return_value=json.dumps(TWEETS[0]))
+    peer_get = mocker.patch.object(seventweets.node.peers, 'get_client')\
+        .return_value.get
+    peer_get.return_value.json.return_value = {'id': 7, 'name': 'node1',
+                                               'tweet': 'Hello, World!'}
+    body = json.dumps({'name': 'node1', 'id': 7})
+
+    response = test_client.post('/retweets', data=body)
+
+    assert response.status_code == 201
+    peer_get.assert_called_once_with('node1.example.com', '/tweets/7')
+    assert save_origin.call_args[0][1:] == ('node1', 7, 'Hello, World!')
+
+    # Cached origins aren't fetched again.
+    get_origin.return_value = 'Hello, World!'
+    response = test_client.post('/retweets', data=body)
+
+    assert response.status_code == 201
+    assert peer_get.call_count == 1
+    assert save_origin.call_count == 1
+
+    get_origin.return_value = None
+    response = test_client.post('/retweets', data=json.dumps(
+        {'name': 'node2', 'id': 7}))
+    assert response.status_code == 404
+
+
+def test_get_changes(mocker):
+    get_changes = mocker.patch.object(
+        seventweets.node.Storage, 'get_changes',
+        return_value={'tweets': TWEETS, 'deleted': [3], 'cursor': (12, 40),
+                      'more': False})
+
+    response = test_client.get('/changes?since=10-30&limit=5')
+
+    assert get_changes.call_args[0][1:] == ((10, 30), 5)
+    assert json.loads(response.get_data(as_text=True)) == {
+        'tweets': TWEETS, 'deleted': [3], 'cursor': '12-40', 'more': False}
+
+    response = test_client.get('/changes')
+    assert get_changes.call_args[0][1] == (0, 0)
+
+    response = test_client.get('/changes?since=10')
+    assert response.status_code == 400
+
+
+def test_get_tweets_encoding(mocker):
+    mocker.patch.object(seventweets.node.Storage, 'get_all_tweets',
+                        return_value=json.dumps(TWEETS * 50))
+    mocker.patch.object(seventweets.node.Config, 'GZIP_MIN_SIZE', 1024)
+
+    response = test_client.get('/tweets', headers={
+        'Accept': seventweets.node.wire.ACCEPT})
+
+    assert response.headers['Content-Type'] == seventweets.node.wire.COLUMNS
+    assert response.headers['ETag'].endswith('-columns"')
+    assert seventweets.node.wire.loads(response.get_data()) == TWEETS * 50
+
+    response = test_client.get('/tweets', headers={'Accept-Encoding': 'gzip'})
+
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert response.headers['ETag'].startswith('W/')
+    assert json.loads(gzip.decompress(response.get_data())) == TWEETS * 50
+
+    # Single tweets are never columnar, so their tag doesn't depend on it.
+    mocker.patch.object(seventweets.node.Storage, 'get_tweet',
+                        return_value=json.dumps(TWEETS[0]))
+    response = test_client.get('/tweets/1', headers={
+        'Accept': seventweets.node.wire.ACCEPT})
+
+    assert not response.headers['ETag'].endswith('-columns"')
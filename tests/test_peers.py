@@ -0,0 +1,103 @@
+import asyncio
+from unittest.mock import MagicMock
+
+import pytest
+import requests
+
+from seventweets.peers import AsyncPeerClient
+from seventweets.peers import PeerClient
+from seventweets.peers import PeerMetrics
+import seventweets.peers
+
+
+class TestPeerMetrics:
+
+    def test_snapshot(self):
+        metrics = PeerMetrics()
+
+        metrics.started('node1.example.com')
+        metrics.started('node1.example.com')
+        metrics.finished('node1.example.com', 0.02)
+
+        snapshot = metrics.snapshot()['node1.example.com']
+        assert snapshot['in_flight'] == 1
+        assert snapshot['requests'] == 1
+        assert snapshot['errors'] == 0
+
+        buckets = snapshot['latency']['buckets']
+        assert buckets['0.01'] == 0
+        assert buckets['0.025'] == 1
+        assert buckets['+Inf'] == 1
+
+    def test_slow_and_failed(self):
+        metrics = PeerMetrics()
+
+        metrics.started('node1.example.com')
+        metrics.finished('node1.example.com', 60, error=True)
+
+        snapshot = metrics.snapshot()['node1.example.com']
+        assert snapshot['errors'] == 1
+        assert snapshot['latency']['buckets']['10'] == 0
+        assert snapshot['latency']['buckets']['+Inf'] == 1
+
+
+class TestPeerClient:
+
+    def test_request(self, mocker):
+        mocker.patch.object(seventweets.peers, 'metrics', PeerMetrics())
+        client = PeerClient(timeout=1)
+        client._session = MagicMock()
+
+        client.get('node1.example.com', '/search', params={'content': 'a'})
+
+        client._session.request.assert_called_with(
+            'GET', 'http://node1.example.com/search',
+            params={'content': 'a'}, timeout=1)
+        snapshot = seventweets.peers.metrics.snapshot()['node1.example.com']
+        assert snapshot['requests'] == 1
+        assert snapshot['in_flight'] == 0
+
+    def test_request_once(self, mocker):
+        client = PeerClient(retries=2)
+        client._session = MagicMock()
+        client._session_once = MagicMock()
+
+        client.get('node1.example.com', '/search', retry=False)
+
+        assert client._session_once.request.called
+        assert not client._session.request.called
+        adapter = PeerClient(retries=2)._session_once.get_adapter('http://a')
+        assert adapter.max_retries.total == 0
+
+    def test_request_error(self, mocker):
+        mocker.patch.object(seventweets.peers, 'metrics', PeerMetrics())
+        client = PeerClient()
+        client._session = MagicMock()
+        client._session.request.return_value.raise_for_status.side_effect = (
+            requests.HTTPError('500 Server Error'))
+
+        with pytest.raises(requests.HTTPError):
+            client.delete('node1.example.com', '/registry/me')
+
+        snapshot = seventweets.peers.metrics.snapshot()['node1.example.com']
+        assert snapshot['errors'] == 1
+        assert snapshot['in_flight'] == 0
+
+
+class TestAsyncPeerClient:
+
+    def test_request_once(self, mocker):
+        mocker.patch.object(seventweets.peers, 'metrics', PeerMetrics())
+
+        async def search(retry):
+            client = AsyncPeerClient(retries=2)
+            await client.close()
+            client._session = MagicMock()
+            client._session.request.side_effect = asyncio.TimeoutError
+            with pytest.raises(asyncio.TimeoutError):
+                await client.request_json('GET', 'node1.example.com',
+                                          '/search', retry=retry)
+            return client._session.request.call_count
+
+        assert asyncio.run(search(True)) == 3
+        assert asyncio.run(search(False)) == 1
@@ -0,0 +1,150 @@
+import json
+from unittest.mock import MagicMock
+
+import pytest
+import requests
+
+from seventweets import push
+from seventweets.push import Dispatcher
+
+
+@pytest.fixture
+def cursor(mocker):
+    cursor = MagicMock()
+    mocker.patch('seventweets.push.get_db_cursor').return_value\
+        .__enter__.return_value = cursor
+    return cursor
+
+
+@pytest.fixture
+def client(mocker):
+    client = mocker.patch.object(push.peers, 'get_client')
+    return client.return_value
+
+
+@pytest.fixture
+def get_changes(mocker):
+    return mocker.patch.object(push.storage.Storage, 'get_changes')
+
+
+def _changes(tweets, until):
+    return {'tweets': [{'id': id, 'name': 'me', 'tweet': content}
+                       for id, content in tweets],
+            'deleted': [], 'cursor': until, 'more': False}
+
+
+def test_deliver(mocker, cursor, client, get_changes):
+    mocker.patch.object(push.Config, 'NAME', 'me')
+    cursor.fetchone.side_effect = [('node1', 'node1.example.com', 100, 3, 2),
+                                   None]
+    get_changes.return_value = _changes([(4, 'a'), (6, 'b')], (101, 2))
+
+    assert Dispatcher(batch_size=2).dispatch() == 2
+
+    assert get_changes.call_args[0][1:] == ((100, 3), 2)
+    args, kwargs = client.post.call_args
+    assert args == ('node1.example.com', '/inbox')
+    assert json.loads(kwargs['data']) == {
+        'name': 'me', 'since': '100-3', 'cursor': '101-2',
+        'tweets': [{'id': 4, 'name': 'me', 'tweet': 'a'},
+                   {'id': 6, 'name': 'me', 'tweet': 'b'}]}
+
+    # Claimed for the lease, then the cursor moved only if still at since.
+    (claim, claim_args), (update, update_args), _ = [
+        args for args, kwargs in cursor.execute.call_args_list]
+    assert 'FOR UPDATE SKIP LOCKED' in claim
+    assert claim_args == (60,)
+    assert update.startswith('UPDATE subscription SET after_xid')
+    assert update_args == (101, 2, 'node1', 100, 3)
+
+
+def test_deliver_late_commit(mocker, cursor, client, get_changes):
+    mocker.patch.object(push.Config, 'NAME', 'me')
+    # Tweet 7 commits first, tweet 5 of a transaction that started earlier
+    # commits after it was delivered.
+    cursor.fetchone.side_effect = [('node1', 'node1.example.com', 100, 5, 0),
+                                   ('node1', 'node1.example.com', 101, 1, 0),
+                                   None]
+    get_changes.side_effect = [_changes([(7, 'b')], (101, 1)),
+                               _changes([(5, 'a')], (102, 2))]
+
+    assert Dispatcher().dispatch() == 2
+
+    assert get_changes.call_args[0][1] == (101, 1)
+    bodies = [json.loads(kwargs['data'])
+              for args, kwargs in client.post.call_args_list]
+    assert [(b['since'], b['cursor'], [t['id'] for t in b['tweets']])
+            for b in bodies] == [('100-5', '101-1', [7]),
+                                 ('101-1', '102-2', [5])]
+
+
+def test_deliver_no_tweets(cursor, client, get_changes):
+    # Only deletions: nothing to send, the cursor still moves on.
+    cursor.fetchone.side_effect = [('node1', 'node1.example.com', 100, 3, 0),
+                                   None]
+    get_changes.return_value = _changes([], (101, 1))
+
+    assert Dispatcher().dispatch() == 0
+
+    assert not client.post.called
+    assert cursor.execute.call_args_list[1][0][1] == (101, 1, 'node1', 100, 3)
+
+
+def test_deliver_failed(cursor, client, get_changes):
+    client.post.side_effect = requests.ConnectionError
+    cursor.fetchone.return_value = ('node1', 'node1.example.com', 100, 3, 2)
+    get_changes.return_value = _changes([(4, 'a')], (101, 1))
+
+    dispatcher = Dispatcher(backoff=1, max_backoff=3, max_failures=5)
+    assert dispatcher._deliver_next() == 0
+
+    # Third failure in a row: retried after min(1 * 2 ** 2, 3) seconds.
+    args, kwargs = cursor.execute.call_args
+    assert args[0].startswith('UPDATE subscription SET failures')
+    assert args[1] == (3, 3, 'node1')
+
+    cursor.fetchone.return_value = ('node1', 'node1.example.com', 100, 3, 4)
+    dispatcher._deliver_next()
+    cursor.execute.assert_called_with(
+        'DELETE FROM subscription WHERE node_name = %s', ('node1',))
+
+
+def test_deliver_outside_transaction(mocker, cursor, client, get_changes):
+    transactions = []
+    get_db_cursor = mocker.patch('seventweets.push.get_db_cursor')
+    get_db_cursor.return_value.__enter__.side_effect = \
+        lambda: transactions.append('begin') or cursor
+    get_db_cursor.return_value.__exit__.side_effect = \
+        lambda *args: transactions.append('commit')
+    client.post.side_effect = lambda *args, **kwargs: \
+        transactions.append('post')
+    cursor.fetchone.return_value = ('node1', 'node1.example.com', 100, 3, 0)
+    get_changes.return_value = _changes([(4, 'a')], (101, 1))
+
+    Dispatcher()._deliver_next()
+
+    assert transactions == ['begin', 'commit', 'post', 'begin', 'commit']
+
+
+def test_subscribe(cursor):
+    cursor.fetchone.side_effect = [(100, 7), (100, 7)]
+
+    assert push.subscribe(cursor, 'node1', 'node1.example.com') == (100, 7)
+
+    # From the end of the feed.
+    (end,), (insert, insert_args) = [
+        args for args, kwargs in cursor.execute.call_args_list]
+    assert end.startswith('SELECT xid, seq FROM change')
+    assert insert_args == ('node1', 'node1.example.com', 100, 7, False,
+                           False)
+
+
+def test_subscribe_since(cursor):
+    cursor.fetchone.return_value = (90, 1)
+
+    assert push.subscribe(cursor, 'node1', 'node1.example.com',
+                          (90, 1)) == (90, 1)
+
+    args, kwargs = cursor.execute.call_args
+    assert cursor.execute.call_count == 1
+    assert args[1] == ('node1', 'node1.example.com', 90, 1, True, True)
@@ -1,9 +1,12 @@
 from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
 import json
+import threading
 
 import pytest
 from pytest_mock import mocker
 
+from seventweets.registry import PostgresStore
 from seventweets.registry import Registry
 
 
@@ -16,7 +19,7 @@ def node_data():
 
     node3 = {'name': 'node3', 'address': 'node3.example.com'}
 
-    known_nodes = {node1, node2}
+    known_nodes = {'node1': node1, 'node2': node2}
     self_node = {'name': None, 'address': None}
 
     known_nodes_json = json.dumps([node1._asdict(), node2._asdict(), self_node])
@@ -39,12 +42,13 @@ class TestRegistry:
 
         Registry._known_nodes = known_nodes.copy()
         Registry.register(node)
-        known_nodes.add(Node(**node))
+        known_nodes['node3'] = Node(**node)
 
         assert Registry._known_nodes == known_nodes
 
     def test_known_nodes(self, node_data):
         Registry._known_nodes = node_data['known_nodes']
+        Registry._snapshot = None
 
         test_nodes = json.loads(node_data['known_nodes_json'])
 
@@ -66,6 +70,158 @@ class TestRegistry:
         Registry._known_nodes = node_data['known_nodes']
         node = node_data['node1']
 
-        assert node in Registry._known_nodes
+        assert Registry._known_nodes['node1'] == node
         Registry.delete_node('node1')
-        assert node not in Registry._known_nodes
+        assert 'node1' not in Registry._known_nodes
+
+    def test_versions(self, node_data):
+        Registry._known_nodes = node_data['known_nodes'].copy()
+        node = node_data['node']
+
+        snapshot = Registry.known_nodes
+        assert Registry.known_nodes is snapshot
+
+        version = Registry._version
+        Registry.register(node)
+        assert Registry._version == version + 1
+        assert Registry.known_nodes is not snapshot
+        assert node in json.loads(Registry.known_nodes)
+
+        # Registering again changes nothing.
+        snapshot = Registry.known_nodes
+        Registry.register(node)
+        assert Registry._version == version + 1
+        assert Registry.known_nodes is snapshot
+
+        Registry.delete_node('node3')
+        Registry.delete_node('node3')
+        assert Registry._version == version + 2
+        assert node not in json.loads(Registry.known_nodes)
+
+
+@pytest.fixture
+def store(mocker):
+    store = mocker.MagicMock()
+    store.version.return_value = 1
+    store.load.return_value = [('node1', 'node1.example.com')]
+
+    mocker.patch.object(Registry, '_store', store)
+    mocker.patch.object(Registry, '_store_version', None)
+    mocker.patch.object(Registry, '_checked', None)
+    mocker.patch.object(Registry, '_known_nodes', {})
+
+    return store
+
+
+def test_store_snapshot(store, mocker):
+    mocker.patch('seventweets.registry.Config.REGISTRY_REFRESH_INTERVAL', 0)
+
+    assert Registry.nodes() == [('node1', 'node1.example.com')]
+    assert Registry.nodes() == [('node1', 'node1.example.com')]
+    # Unchanged version, loaded only once.
+    assert store.load.call_count == 1
+
+    store.version.return_value = 2
+    store.load.return_value = [('node2', 'node2.example.com')]
+    assert Registry.nodes() == [('node2', 'node2.example.com')]
+
+
+def test_store_refresh_interval(store, mocker):
+    mocker.patch('seventweets.registry.Config.REGISTRY_REFRESH_INTERVAL', 60)
+
+    Registry.nodes()
+    Registry.nodes()
+    assert store.version.call_count == 1
+
+
+def test_store_refresh_concurrent(store, mocker):
+    mocker.patch('seventweets.registry.Config.REGISTRY_REFRESH_INTERVAL', 60)
+    barrier = threading.Barrier(5)
+
+    def nodes():
+        barrier.wait()
+        return Registry.nodes()
+
+    with ThreadPoolExecutor(max_workers=5) as executor:
+        results = list(executor.map(lambda _: nodes(), range(5)))
+
+    # Threads that waited for the refresh didn't query the store again.
+    assert store.version.call_count == 1
+    assert all(r == [('node1', 'node1.example.com')] for r in results)
+
+
+def test_store_refresh_registered_meanwhile(store, mocker):
+    mocker.patch('seventweets.registry.Config.REGISTRY_REFRESH_INTERVAL', 60)
+
+    def load():
+        # Registered while the store is read, not in what it returns.
+        Registry._known_nodes['node2'] = Registry._Node('node2', 'a')
+        Registry._version += 1
+        return [('node1', 'node1.example.com')]
+
+    store.load.side_effect = load
+    Registry._refresh()
+    assert 'node2' in Registry._known_nodes
+
+    store.load.side_effect = None
+    Registry._refresh()
+    assert 'node2' not in Registry._known_nodes
+    assert store.load.call_count == 2
+
+
+def test_store_changes(store):
+    Registry.register({'name': 'node2', 'address': 'node2.example.com'})
+    store.add.assert_called_once_with('node2', 'node2.example.com')
+    assert Registry._known_nodes['node2'] == ('node2', 'node2.example.com')
+
+    Registry.delete_node('node2')
+    store.remove.assert_called_once_with('node2')
+    assert 'node2' not in Registry._known_nodes
+
+
+def test_postgres_store_add(mocker):
+    cursor = mocker.MagicMock()
+    mocker.patch('seventweets.registry.get_db_cursor').return_value.__enter__\
+        .return_value = cursor
+
+    cursor.fetchone.return_value = None
+    PostgresStore().add('node1', 'node1.example.com')
+    # Unchanged node, no new version.
+    assert cursor.execute.call_count == 1
+
+    cursor.fetchone.return_value = ['node1']
+    PostgresStore().add('node1', 'node1.example.com')
+    cursor.execute.assert_called_with("SELECT nextval('node_version_seq')")
+
+
+def test_postgres_store_version_first_change(mocker):
+    # A fresh sequence: last_value is 1 both before and after the first
+    # nextval, only is_called tells them apart.
+    sequence = {'last_value': 1, 'is_called': False}
+    nodes = []
+
+    def execute(query, args=None):
+        if query.startswith('INSERT INTO node'):
+            nodes.append(args)
+            cursor.fetchone.return_value = [args[0]]
+        elif query == "SELECT nextval('node_version_seq')":
+            if sequence['is_called']:
+                sequence['last_value'] += 1
+            sequence['is_called'] = True
+            cursor.fetchone.return_value = [sequence['last_value']]
+        elif 'FROM node_version_seq' in query:
+            assert query.startswith('SELECT CASE WHEN is_called')
+            cursor.fetchone.return_value = [
+                sequence['last_value'] if sequence['is_called'] else 0]
+
+    cursor = mocker.MagicMock()
+    cursor.execute.side_effect = execute
+    mocker.patch('seventweets.registry.get_db_cursor').return_value.__enter__\
+        .return_value = cursor
+    store = PostgresStore()
+
+    version = store.version()
+    store.add('node1', 'node1.example.com')
+
+    assert nodes == [('node1', 'node1.example.com')]
+    assert store.version() != version
@@ -0,0 +1,72 @@
+import random
+
+from seventweets.search import SearchCache
+from seventweets.search import TopK
+
+
+def tweet(id, created, rank=None):
+    t = {'id': id, 'name': 'node', 'tweet': '', 'created': created}
+    if rank is not None:
+        t['rank'] = rank
+    return t
+
+
+def test_top_newest():
+    tweets = [tweet(i, '2017-01-{:02d}T00:00:00+00:00'.format(i))
+              for i in range(1, 29)]
+    shuffled = tweets[:]
+    random.Random(0).shuffle(shuffled)
+
+    top = TopK(5, 'newest')
+    for i in range(0, len(shuffled), 7):
+        top.add(shuffled[i:i + 7])
+
+    assert top.result() == tweets[::-1][:5]
+
+
+def test_top_relevance():
+    top = TopK(2, 'relevance')
+    top.add([tweet(1, '2017-01-01', 0.2), tweet(2, '2017-01-02', 0.1)])
+    top.add([tweet(3, '2017-01-03', 0.2), tweet(4, '2017-01-04')])
+
+    # Equal rank, newer first.
+    assert [t['id'] for t in top.result()] == [3, 1]
+
+
+def test_top_empty():
+    top = TopK(0, 'newest')
+    top.add([tweet(1, '2017-01-01')])
+
+    assert top.result() == []
+
+
+def test_top_sources():
+    top = TopK(5, 'newest')
+
+    assert top.add([tweet(1, '2017-01-01')], source='node1')
+    assert not top.add([tweet(1, '2017-01-01')], source='node1')
+
+    assert len(top.result()) == 1
+
+
+def test_search_cache():
+    cache = SearchCache(maxsize=2, ttl=10, stale=10)
+    tweets = [tweet(1, '2017-01-01')]
+
+    assert cache.get('node1', {'content': 'Hello'}) is None
+    cache.set('node1', {'content': 'Hello  World'}, tweets)
+
+    assert cache.get('node1', {'content': 'hello world'}) == (tweets, True)
+    assert cache.get('node2', {'content': 'hello world'}) is None
+
+    assert cache.claim('node1', {'content': 'Hello'})
+    assert not cache.claim('node1', {'content': 'hello'})
+    cache.release('node1', {'content': 'Hello'})
+    assert cache.claim('node1', {'content': 'Hello'})
+
+
+def test_search_cache_disabled():
+    cache = SearchCache(ttl=0)
+    cache.set('node1', {}, [])
+
+    assert cache.get('node1', {}) is None
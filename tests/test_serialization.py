@@ -0,0 +1,36 @@
+import importlib.util
+import json
+import sys
+
+import pytest
+
+from seventweets import serialization
+
+
+ROWS = [[1, 'nzp', 'Hello, World!'], [2, 'nzp', 'Zdravo, svete! ✓']]
+
+
+@pytest.fixture(params=['orjson', 'json'])
+def backend(request, mocker):
+    if request.param == 'json':
+        # Import without orjson, as if it wasn't installed.
+        mocker.patch.dict(sys.modules, {'orjson': None})
+    elif importlib.util.find_spec('orjson') is None:
+        pytest.skip('orjson is not installed')
+
+    yield importlib.reload(serialization)
+
+    mocker.stopall()
+    importlib.reload(serialization)
+
+
+def test_dumps_tweets(backend):
+    assert backend.BACKEND in ('orjson', 'json')
+
+    result = backend.dumps_tweets(ROWS)
+
+    # Compact, and non-ASCII characters as they are.
+    assert result == ('[{"id":1,"name":"nzp","tweet":"Hello, World!"},'
+                      '{"id":2,"name":"nzp","tweet":"Zdravo, svete! ✓"}]')
+    assert json.loads(backend.dumps_tweet(ROWS[1])) == {
+        'id': 2, 'name': 'nzp', 'tweet': 'Zdravo, svete! ✓'}
@@ -1,9 +1,12 @@
+from datetime import datetime
+from datetime import timezone
 import json
 from unittest.mock import MagicMock
 from unittest.mock import patch
 
 import pytest
 
+from seventweets.cache import get_cache
 from seventweets.storage import Tweet
 from seventweets.storage import Storage
 
@@ -16,6 +19,11 @@ TWEET_2_ID = 2
 TWEET_2 = 'Hello, Again!'
 
 
+@pytest.fixture(autouse=True)
+def clear_cache():
+    get_cache().clear()
+
+
 @pytest.fixture(scope='class')
 def tweet():
     return Tweet([TWEET_1_ID, NODE_NAME, TWEET_1])
@@ -56,6 +64,11 @@ class TestTweet:
     def test_tweet_str(self, tweet):
         assert str(tweet) == TWEET_1
 
+    def test_tweet_as_dict(self, tweet):
+        assert tweet.as_dict() == {'id': TWEET_1_ID, 'name': NODE_NAME,
+                                   'tweet': TWEET_1}
+        assert not hasattr(tweet, '__dict__')
+
 
 @pytest.mark.usefixture('db_cursor')
 class TestStorage:
@@ -66,7 +79,9 @@ class TestStorage:
 
         tweets = Storage.get_all_tweets(cursor)
 
-        cursor.execute.assert_called_with('SELECT id, node_name, content FROM tweet')
+        args, kwargs = cursor.execute.call_args_list[0]
+        assert args == ('DECLARE stream NO SCROLL CURSOR FOR '
+                        'SELECT id, node_name, content FROM tweet_view', ())
 
         try:
             decoded_tweets = json.loads(tweets)
@@ -83,7 +98,8 @@ class TestStorage:
         tweet = Storage.get_tweet(cursor, id)
 
         cursor.execute.assert_called_with(
-            'SELECT id, node_name, content FROM tweet WHERE id = {}'.format(TWEET_2_ID))
+            'SELECT id, node_name, content FROM tweet_view WHERE id = %s',
+            (TWEET_2_ID,))
 
         try:
             decoded_tweet = json.loads(tweet)
@@ -95,6 +111,7 @@ class TestStorage:
     @patch('seventweets.storage.Config')
     def test_save_tweet(self, mock_config, db_cursor):
         mock_config.NAME = 'nzp'
+        mock_config.PUSH = False
         cursor = db_cursor['cursor']
         tweet = TWEET_2
         test_result = db_cursor['tweet_2']
@@ -102,8 +119,9 @@ class TestStorage:
         result = Storage.save_tweet(cursor, tweet)
 
         cursor.execute.assert_called_with(
-            "INSERT INTO tweet (node_name, content) \
-            VALUES ('nzp', '{}') RETURNING id, node_name, content".format(tweet))
+            'INSERT INTO tweet (node_name, content) VALUES (%s, %s) '
+            'RETURNING id, node_name, content',
+            ('nzp', tweet))
 
         try:
             decoded_result = json.loads(result)
@@ -121,5 +139,316 @@ class TestStorage:
         result = Storage.delete_tweet(cursor, id)
 
         cursor.execute.assert_called_with(
-            "DELETE FROM tweet WHERE id = {} RETURNING id".format(id))
+            'DELETE FROM tweet WHERE id = %s RETURNING id', (id,))
+
+
+    def test_get_tweets(self, db_cursor):
+        cursor = db_cursor['cursor']
+        all_tweets = db_cursor['all_tweets']
+
+        tweets = Storage.get_tweets(cursor, 2, after_id=0)
+
+        cursor.execute.assert_called_with(
+            'SELECT id, node_name, content FROM tweet_view '
+            'WHERE id > %s ORDER BY id LIMIT %s', (0, 2))
+        assert json.loads(tweets) == all_tweets
+
+        Storage.get_tweets(cursor, 2, before_id=3)
+
+        cursor.execute.assert_called_with(
+            'SELECT id, node_name, content FROM tweet_view '
+            'WHERE id < %s ORDER BY id DESC LIMIT %s', (3, 2))
+
+    def test_iter_tweets(self, db_cursor):
+        cursor = db_cursor['cursor']
+        all_tweets = db_cursor['all_tweets']
+        batches = [[[TWEET_1_ID, NODE_NAME, TWEET_1]],
+                   [[TWEET_2_ID, NODE_NAME, TWEET_2]],
+                   []]
+        cursor.fetchall = MagicMock(side_effect=batches)
+
+        tweets = [json.loads(t) for t in Storage.iter_tweets(cursor, 1)]
+
+        statements = [args[0] for args, kwargs in cursor.execute.call_args_list]
+        assert statements == [
+            'DECLARE stream NO SCROLL CURSOR FOR '
+            'SELECT id, node_name, content FROM tweet_view ORDER BY id',
+            'FETCH FORWARD 1 FROM stream',
+            'FETCH FORWARD 1 FROM stream',
+            'FETCH FORWARD 1 FROM stream',
+            'CLOSE stream']
+        assert tweets == all_tweets
+
+    def test_search(self, db_cursor):
+        cursor = db_cursor['cursor']
+        all_tweets = db_cursor['all_tweets']
+
+        created = datetime(2017, 1, 1, 12, tzinfo=timezone.utc)
+        cursor.fetchall.return_value = [
+            row + [created, 0.5] for row in cursor.fetchall.return_value]
+
+        result = Storage.search(cursor, content='Hello', limit=10,
+                                order='relevance')
+
+        args, kwargs = cursor.execute.call_args
+        assert 'content_tsv @@ query' in args[0]
+        assert 'ORDER BY rank DESC' in args[0]
+        assert args[1] == ('Hello', '-infinity', 'infinity', 10)
+        assert result == [dict(t, created='2017-01-01T12:00:00+00:00',
+                               rank=0.5) for t in all_tweets]
+
+        Storage.search(cursor, content='Hello', limit=10)
+
+        args, kwargs = cursor.execute.call_args
+        assert 'ORDER BY pub_datetime DESC' in args[0]
+
+        result = Storage.search(cursor, created_from='2017-01-01')
+
+        args, kwargs = cursor.execute.call_args
+        assert 'content_tsv' not in args[0]
+        assert args[1] == ('2017-01-01', 'infinity', None)
+        assert 'rank' not in result[0]
+
+    def test_search_retweet(self, db_cursor):
+        cursor = db_cursor['cursor']
+        created = datetime(2017, 1, 1, 12, tzinfo=timezone.utc)
+        # A retweet, its content is the origin's, filled in by tweet_view.
+        cursor.fetchall.return_value = [[3, 'nzp', 'Hello origin', created,
+                                         0.5]]
+
+        result = Storage.search(cursor, content='origin', limit=10)
+
+        args, kwargs = cursor.execute.call_args
+        assert 'FROM tweet_view,' in args[0]
+        assert result == [{'id': 3, 'name': 'nzp', 'tweet': 'Hello origin',
+                           'created': '2017-01-01T12:00:00+00:00',
+                           'rank': 0.5}]
+
+        Storage.search(cursor, created_from='2017-01-01')
+
+        args, kwargs = cursor.execute.call_args
+        assert 'FROM tweet_view ' in args[0]
+
+    def test_iter_search(self, db_cursor):
+        cursor = db_cursor['cursor']
+        all_tweets = db_cursor['all_tweets']
+
+        created = datetime(2017, 1, 1, 12, tzinfo=timezone.utc)
+        cursor.fetchall.return_value = [
+            row + [created, 0.5] for row in cursor.fetchall.return_value]
+
+        result = [json.loads(t)
+                  for t in Storage.iter_search(cursor, 10, content='Hello')]
+
+        args, kwargs = cursor.execute.call_args_list[0]
+        assert args[0].startswith('DECLARE stream NO SCROLL CURSOR FOR SELECT')
+        assert args[1] == ('Hello', '-infinity', 'infinity', None)
+        # A short batch is the last one.
+        assert cursor.execute.call_args_list[1][0] == (
+            'FETCH FORWARD 10 FROM stream',)
+        cursor.execute.assert_called_with('CLOSE stream')
+        assert result == [dict(t, created='2017-01-01T12:00:00+00:00',
+                               rank=0.5) for t in all_tweets]
+
+    @patch('seventweets.storage.Config')
+    def test_save_tweet_push(self, mock_config, db_cursor, mocker):
+        mock_config.NAME = 'nzp'
+        mock_config.PUSH = True
+        wake = mocker.patch('seventweets.storage.push.wake')
+        cursor = db_cursor['cursor']
+
+        result = Storage.save_tweet(cursor, TWEET_2)
+
+        # Pushed from the change feed, the dispatcher is woken on commit.
+        args, kwargs = cursor.execute.call_args
+        assert args[0].startswith('INSERT INTO tweet')
+        assert args[1] == ('nzp', TWEET_2)
+        assert json.loads(result) == db_cursor['tweet_2']
+        assert wake.called
+
+    @patch('seventweets.storage.Config')
+    def test_save_retweet(self, mock_config, db_cursor):
+        mock_config.NAME = 'nzp'
+        cursor = db_cursor['cursor']
+
+        result = Storage.save_retweet(cursor, 'node1', 7, TWEET_2)
+
+        args, kwargs = cursor.execute.call_args_list[0]
+        assert args == ('SELECT pg_advisory_xact_lock(hashtext(%s))',
+                        ('retweet:node1:7',))
+        args, kwargs = cursor.execute.call_args
+        assert 'ON CONFLICT (rt_origin_node, rt_origin_id) WHERE rt' in args[0]
+        assert args[1] == ('nzp', 'node1', 7, 'node1', 7)
+        assert json.loads(result) == db_cursor['tweet_2']
+
+        # Deleted by a concurrent transaction.
+        cursor.fetchone.return_value = None
+        assert Storage.save_retweet(cursor, 'node1', 7, TWEET_2) is None
+
+    def test_get_changes(self, db_cursor):
+        cursor = db_cursor['cursor']
+        cursor.fetchall.return_value = [
+            [100, 5, TWEET_1_ID, False, NODE_NAME, TWEET_1],
+            # Saved, but deleted since.
+            [101, 6, TWEET_2_ID, False, None, None],
+            [102, 7, TWEET_2_ID, True, None, None],
+        ]
+
+        result = Storage.get_changes(cursor, (99, 4), 3)
+
+        args, kwargs = cursor.execute.call_args
+        assert 'WHERE (c.xid, c.seq) > (%s, %s)' in args[0]
+        assert args[1] == (99, 4, 3)
+        assert result == {'tweets': [db_cursor['tweet_1']],
+                          'deleted': [TWEET_2_ID],
+                          'cursor': (102, 7),
+                          'more': True}
+
+        cursor.fetchall.return_value = []
+        assert Storage.get_changes(cursor, (102, 7), 3)['cursor'] == (102, 7)
+
+    def test_get_timeline(self, db_cursor):
+        cursor = db_cursor['cursor']
+        cursor.fetchall.return_value = [[11, TWEET_2_ID, NODE_NAME, TWEET_2]]
+
+        result = Storage.get_timeline(cursor, 10, before=12)
+
+        args, kwargs = cursor.execute.call_args
+        assert 'WHERE seq < %s ORDER BY seq DESC' in args[0]
+        assert args[1] == (12, 10)
+        assert result == [dict(db_cursor['tweet_2'], seq=11)]
+
+    def test_save_timeline(self, db_cursor):
+        cursor = db_cursor['cursor']
+
+        assert Storage.save_timeline(cursor, 'node1', [
+            {'id': 3, 'name': 'node1', 'tweet': 'a'},
+            {'id': 4, 'name': 'node1', 'tweet': 'b'}])
+
+        args, kwargs = cursor.execute.call_args
+        assert args[1] == ('node1', [3, 4], ['a', 'b'])
+
+        Storage.save_timeline(cursor, 'node1', [])
+        assert cursor.execute.call_count == 1
+
+    def test_save_timeline_cursor(self, db_cursor):
+        cursor = db_cursor['cursor']
+        tweets = [{'id': 5, 'name': 'node1', 'tweet': 'a'}]
+
+        assert Storage.save_timeline(cursor, 'node1', tweets, (100, 3),
+                                     (102, 4))
+
+        # The cursor moves only if it's still where the tweets follow.
+        (update, _), (insert, _) = cursor.execute.call_args_list
+        assert 'AND after_xid = %s AND after_seq = %s' in update[0]
+        assert update[1] == (102, 4, 'node1', 100, 3)
+
+        cursor.fetchone.return_value = None
+        assert not Storage.save_timeline(cursor, 'node1', tweets, (100, 3),
+                                         (102, 4))
+        assert cursor.execute.call_count == 3
+
+    def test_claim_timeline(self, db_cursor):
+        cursor = db_cursor['cursor']
+        cursor.fetchone.return_value = [100, 3]
+
+        assert Storage.claim_timeline(cursor, 'node1', 5) == (100, 3)
+        args, kwargs = cursor.execute.call_args
+        assert 'WHERE timeline_cursor.pulled_at <=' in args[0]
+        assert args[1] == ('node1', 5)
+
+        cursor.fetchone.return_value = None
+        assert Storage.claim_timeline(cursor, 'node1', 5) is None
+
+    @patch('seventweets.storage.Config')
+    def test_sync_own_timeline(self, mock_config, db_cursor, mocker):
+        mock_config.NAME = 'nzp'
+        cursor = db_cursor['cursor']
+        mocker.patch.object(Storage, 'claim_timeline', return_value=(100, 3))
+        mocker.patch.object(Storage, 'get_changes', return_value={
+            'tweets': [db_cursor['tweet_2']], 'deleted': [],
+            'cursor': (101, 4), 'more': False})
+        save = mocker.patch.object(Storage, 'save_timeline',
+                                   return_value=True)
+
+        assert Storage.sync_own_timeline(cursor, 10) == 1
+        save.assert_called_once_with(cursor, 'nzp', [db_cursor['tweet_2']],
+                                     (100, 3), (101, 4))
+
+    def test_get_tweet_cached(self, db_cursor):
+        cursor = db_cursor['cursor']
+
+        first = Storage.get_tweet(cursor, TWEET_2_ID)
+        second = Storage.get_tweet(cursor, TWEET_2_ID)
+
+        assert cursor.execute.call_count == 1
+        assert first == second
+
+        Storage.delete_tweet(cursor, TWEET_2_ID)
+        Storage.get_tweet(cursor, TWEET_2_ID)
+
+        assert cursor.execute.call_count == 3
+
+    @patch('seventweets.storage.Config')
+    def test_listing_invalidated(self, mock_config, db_cursor):
+        mock_config.NAME = 'nzp'
+        mock_config.STREAM_BATCH_SIZE = 500
+        cursor = db_cursor['cursor']
+
+        version = Storage.version()
+        Storage.get_tweets(cursor, 10)
+        assert cursor.execute.call_count == 1
+
+        Storage.get_tweets(cursor, 10)
+        assert cursor.execute.call_count == 1
+
+        Storage.save_tweet(cursor, TWEET_2)
+        Storage.get_tweets(cursor, 10)
+
+        assert Storage.version() != version
+        assert cursor.execute.call_count == 3
+
+    @patch('seventweets.storage.Config')
+    def test_all_tweets_not_cached(self, mock_config, db_cursor):
+        mock_config.STREAM_BATCH_SIZE = 500
+        cursor = db_cursor['cursor']
+
+        Storage.get_all_tweets(cursor)
+        Storage.get_all_tweets(cursor)
+
+        # Declare, fetch and close the server-side cursor, twice.
+        assert cursor.execute.call_count == 6
+
+    def test_get_tweet_racing_delete(self, db_cursor):
+        cursor = db_cursor['cursor']
+
+        def execute(*args):
+            # The tweet is deleted, and the delete committed, after it was
+            # read but before it's cached.
+            cursor.execute.side_effect = None
+            Storage._changed()
+
+        cursor.execute.side_effect = execute
+        Storage.get_tweet(cursor, TWEET_2_ID)
+
+        cursor.fetchone.return_value = None
+        assert Storage.get_tweet(cursor, TWEET_2_ID) is None
+        assert cursor.execute.call_count == 2
+
+    @patch('seventweets.storage.Config')
+    def test_save_tweets(self, mock_config, db_cursor):
+        mock_config.NAME = 'nzp'
+        mock_config.PUSH = False
+        cursor = db_cursor['cursor']
+        # RETURNING doesn't guarantee order.
+        cursor.fetchall = MagicMock(return_value=[[TWEET_2_ID], [TWEET_1_ID]])
+
+        result = Storage.save_tweets(cursor, [TWEET_1, TWEET_2])
+
+        args, kwargs = cursor.execute.call_args
+        assert args[1] == ('nzp', [TWEET_1, TWEET_2])
+        assert result == db_cursor['all_tweets']
 
+        cursor.execute.reset_mock()
+        assert Storage.save_tweets(cursor, []) == []
+        assert not cursor.execute.called
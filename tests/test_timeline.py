@@ -0,0 +1,92 @@
+from unittest.mock import MagicMock
+
+import pytest
+
+from seventweets.registry import Registry
+from seventweets.timeline import TimelinePuller
+import seventweets.timeline
+
+
+@pytest.fixture
+def cursor(mocker):
+    cursor = MagicMock()
+    mocker.patch('seventweets.timeline.get_db_cursor').return_value\
+        .__enter__.return_value = cursor
+    return cursor
+
+
+@pytest.fixture
+def client(mocker):
+    client = mocker.patch.object(seventweets.timeline.peers, 'get_client')
+    return client.return_value
+
+
+def test_sync_peer(mocker, cursor, client):
+    node = Registry._Node('node1', 'node1.example.com')
+    claim = mocker.patch.object(seventweets.timeline.Storage,
+                                'claim_timeline', return_value=(100, 5))
+    save = mocker.patch.object(seventweets.timeline.Storage, 'save_timeline',
+                               return_value=True)
+
+    pages = [{'tweets': [{'id': 6, 'name': 'node1', 'tweet': 'a'},
+                         {'id': 7, 'name': 'node1', 'tweet': 'b'}],
+              'deleted': [], 'cursor': '101-9', 'more': True},
+             # Tweet 3 committed late, after 6 and 7.
+             {'tweets': [{'id': 3, 'name': 'node1', 'tweet': 'c'}],
+              'deleted': [], 'cursor': '103-10', 'more': False}]
+    client.get.return_value.json.side_effect = pages
+
+    puller = TimelinePuller(interval=10, batch_size=2)
+    assert puller.sync_peer(node) == 3
+
+    assert claim.call_args[0][1:] == ('node1', 5)
+    args = [args for args, kwargs in client.get.call_args_list]
+    assert args == [('node1.example.com', '/changes')] * 2
+    params = [kwargs['params'] for args, kwargs in client.get.call_args_list]
+    assert params == [{'since': '100-5', 'limit': 2},
+                      {'since': '101-9', 'limit': 2}]
+    save.assert_called_with(cursor, 'node1', pages[1]['tweets'], (101, 9),
+                            (103, 10))
+
+
+def test_sync_peer_claimed(mocker, cursor, client):
+    node = Registry._Node('node1', 'node1.example.com')
+    mocker.patch.object(seventweets.timeline.Storage, 'claim_timeline',
+                        return_value=None)
+
+    assert TimelinePuller().sync_peer(node) == 0
+    assert not client.get.called
+
+
+def test_sync_peer_saved_meanwhile(mocker, cursor, client):
+    node = Registry._Node('node1', 'node1.example.com')
+    mocker.patch.object(seventweets.timeline.Storage, 'claim_timeline',
+                        return_value=(0, 0))
+    mocker.patch.object(seventweets.timeline.Storage, 'save_timeline',
+                        return_value=False)
+    client.get.return_value.json.return_value = {
+        'tweets': [{'id': 1, 'name': 'node1', 'tweet': 'a'}], 'deleted': [],
+        'cursor': '1-1', 'more': True}
+
+    # Another worker moved the cursor, this one stops.
+    assert TimelinePuller().sync_peer(node) == 0
+    assert client.get.call_count == 1
+
+
+def test_sync(mocker, cursor):
+    mocker.patch.object(seventweets.timeline.Config, 'NAME', 'me')
+    mocker.patch.object(seventweets.timeline.Storage, 'sync_own_timeline',
+                        return_value=1)
+    mocker.patch.object(seventweets.timeline.Registry, 'nodes', return_value=[
+        Registry._Node('node1', 'node1.example.com'),
+        Registry._Node('node2', 'node2.example.com')])
+
+    def sync_peer(node):
+        if node.name == 'node2':
+            raise ConnectionError
+        return 2
+
+    puller = TimelinePuller()
+    mocker.patch.object(puller, 'sync_peer', side_effect=sync_peer)
+
+    assert puller.sync() == {'me': 1, 'node1': 2}
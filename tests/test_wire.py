@@ -0,0 +1,64 @@
+import json
+from unittest.mock import MagicMock
+
+import pytest
+
+from seventweets import wire
+
+
+TWEETS = [
+    {'id': 1, 'name': 'nzp', 'tweet': 'Hello, World!'},
+    {'id': 2, 'name': 'nzp', 'tweet': 'Hello, Again!'},
+    {'id': 3, 'name': 'nzp', 'tweet': 'Hello, Again!'},
+]
+
+
+def test_round_trip():
+    assert wire.loads(wire.dumps(TWEETS)) == TWEETS
+    assert wire.loads(wire.dumps([])) == []
+
+    mixed = [dict(tweet, name='node{}'.format(tweet['id'] % 2),
+                  rank=0.1 * tweet['id'])
+             for tweet in TWEETS * 2]
+    assert wire.loads(wire.dumps(mixed)) == mixed
+
+
+def test_layout():
+    tweets = TWEETS + [dict(TWEETS[2], id=4)]
+    data = json.loads(wire.dumps(tweets))
+
+    # The name only once, repeated tweets as indexes.
+    assert data['constants'] == {'name': 'nzp'}
+    assert data['dictionaries'] == {'tweet': ['Hello, World!',
+                                              'Hello, Again!']}
+    assert data['columns'] == {'id': [1, 2, 3, 4], 'tweet': [0, 1, 1, 1]}
+
+
+def test_missing_keys():
+    objects = [{'id': 1}, {'id': 2, 'rank': 0.5}]
+    assert wire.loads(wire.dumps(objects)) == [{'id': 1, 'rank': None},
+                                               {'id': 2, 'rank': 0.5}]
+
+
+def test_invalid():
+    with pytest.raises(ValueError):
+        wire.loads('{"count": 1}')
+    with pytest.raises(ValueError):
+        wire.loads('[1, 2]')
+
+
+def test_accepts():
+    assert wire.accepts(wire.ACCEPT)
+    assert not wire.accepts('application/json')
+    assert not wire.accepts('*/*')
+    assert not wire.accepts(None)
+
+
+def test_decode():
+    response = MagicMock(headers={'Content-Type': wire.COLUMNS},
+                         content=wire.dumps(TWEETS).encode())
+    assert wire.decode(response) == TWEETS
+
+    response = MagicMock(headers={'Content-Type': 'application/json'})
+    response.json.return_value = TWEETS
+    assert wire.decode(response) == TWEETS